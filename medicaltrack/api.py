@@ -0,0 +1,118 @@
+"""Versioned JSON API for the mobile client, mounted at /api/v1.
+
+Each resource has a list endpoint and a detail endpoint:
+
+    GET /api/v1/<resource>?cursor=...&limit=50&fields=id,name
+    GET /api/v1/<resource>/<id>?fields=...
+
+Lists are keyset-paginated by id; the response carries next_cursor, which is
+null on the last page. fields= picks which fields come back (unknown names
+are a 400), and only those columns are loaded. Bodies are compact JSON with
+sorted keys, so the same data always gives the same bytes and a strong ETag;
+a client that sends it back in If-None-Match gets a 304 with no body.
+
+Clients log in through /login like the browser and send the session cookie.
+A resource's scope function decides which rows the logged-in user may see.
+"""
+import json
+from datetime import date, datetime
+
+from flask import Blueprint, Response, abort, jsonify, request, session
+from sqlalchemy.orm import load_only
+
+from fragments import body_etag
+from pagination import decode_cursor, keyset_page
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class Resource:
+    def __init__(self, name, model, fields, scope):
+        """fields lists the model attributes exposed; scope(query, role, username) narrows
+        the query to the rows the user may see, or returns None if the role has no access."""
+        self.name = name
+        self.model = model
+        self.fields = fields
+        self.scope = scope
+
+    def selected_fields(self):
+        requested = request.args.get('fields')
+        if not requested:
+            return self.fields
+        fields = [field.strip() for field in requested.split(',') if field.strip()]
+        unknown = sorted(set(fields) - set(self.fields))
+        if unknown:
+            abort(json_error(400, f"unknown fields: {', '.join(unknown)}"))
+        return fields
+
+    def serialize(self, row, fields):
+        item = {}
+        for field in fields:
+            value = getattr(row, field)
+            item[field] = value.isoformat() if isinstance(value, (date, datetime)) else value
+        return item
+
+
+def json_error(status, message):
+    response = jsonify({'error': message})
+    response.status_code = status
+    return response
+
+
+def conditional_json(payload):
+    """Compact JSON with a strong ETag of its bytes; answers a matching If-None-Match with a 304."""
+    body = json.dumps(payload, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    response = Response(body, mimetype='application/json')
+    response.set_etag(body_etag(body))
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response.make_conditional(request)
+
+
+class JSONAPI:
+    def __init__(self, read_session, url_prefix='/api/v1'):
+        """read_session() returns the SQLAlchemy session to read from."""
+        self.read_session = read_session
+        self.resources = {}
+        self.blueprint = Blueprint('api_v1', __name__, url_prefix=url_prefix)
+        self.blueprint.add_url_rule('/<resource>', 'list', self.list)
+        self.blueprint.add_url_rule('/<resource>/<int:item_id>', 'detail', self.detail)
+
+    def resource(self, name, model, fields, scope):
+        self.resources[name] = Resource(name, model, fields, scope)
+
+    def _query(self, resource_name):
+        if 'role' not in session:
+            abort(json_error(401, 'unauthorized'))
+        resource = self.resources.get(resource_name)
+        if resource is None:
+            abort(json_error(404, 'not found'))
+        fields = resource.selected_fields()
+        model = resource.model
+        query = self.read_session().query(model).options(
+            load_only(*(getattr(model, field) for field in {'id', *fields})))
+        query = resource.scope(query, session['role'], session['username'])
+        if query is None:
+            abort(json_error(403, 'forbidden'))
+        return resource, fields, query
+
+    def list(self, resource):
+        resource, fields, query = self._query(resource)
+        limit = max(1, min(request.args.get('limit', DEFAULT_LIMIT, type=int), MAX_LIMIT))
+        cursor, columns = request.args.get('cursor'), [resource.model.id]
+        if cursor and decode_cursor(cursor, columns) is None:
+            abort(json_error(400, 'invalid cursor'))
+        rows, next_cursor = keyset_page(query, columns, cursor, limit)
+        return conditional_json({
+            resource.name: [resource.serialize(row, fields) for row in rows],
+            'next_cursor': next_cursor
+        })
+
+    def detail(self, resource, item_id):
+        resource, fields, query = self._query(resource)
+        row = query.filter(resource.model.id == item_id).first()
+        if row is None:
+            abort(json_error(404, 'not found'))
+        return conditional_json(resource.serialize(row, fields))
@@ -1,26 +1,161 @@
-from flask import Flask, render_template, request, redirect, session, send_from_directory, make_response, flash, url_for
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from flask import Flask, Response, render_template, request, redirect, session, send_from_directory, send_file, flash, url_for, jsonify, has_request_context, g
+from werkzeug.security import generate_password_hash
+from datetime import datetime, timedelta
+from flask.globals import app_ctx
+from flask_migrate import Migrate, upgrade
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
-from io import BytesIO
-from xhtml2pdf import pisa
-import smtplib
-from email.message import EmailMessage
+import click
+import logging
 import os
+import secrets
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from api import JSONAPI
+from availability import AvailabilityService, DEFAULT_SCHEDULE
+from bulk import BulkLoader, FORMATS as BULK_FORMATS, KINDS as BULK_KINDS
+from cache import TTLCache
+from database import database_url, engine_options, install_sqlite_pragmas, is_sqlite_file, replica_url
+from fragments import FragmentCache, MemoryBackend, SQLiteBackend
+from history import PatientHistoryService
+from metrics import RequestMetrics
+from outbox import OutboxDispatcher, SMTPSettings
+from passwords import HasherBusy, PasswordHasher, TokenBucketLimiter
+from pagination import keyset_page
+from uploads import BlobStore, StreamingRequest
+from thumbnails import ThumbnailPipeline, thumbnail_path
+from reports import ReportRenderer, history_hash, READY, ERROR
+from reminders import EmailChannel, LogChannel, ReminderScheduler, ReminderStore, WebhookChannel
+from seeding import DEMO_DOCTORS, Seeder
 
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(app.instance_path, 'medtrack.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-UPLOAD_FOLDER = 'uploads'
+# Absolute, so files land in the same place whatever directory the server is started from,
+# and send_file doesn't resolve a relative path against app.root_path instead of the working directory
+UPLOAD_FOLDER = os.path.abspath(os.environ.get('UPLOAD_FOLDER', os.path.join(app.root_path, 'uploads')))
 ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg'}
+ALLOWED_MIME_TYPES = {'application/pdf', 'image/png', 'image/jpeg'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', 512)) * 1024 * 1024
+
+# Uploads stream to a temp file next to the blob store while being hashed (see uploads.py)
+app.request_class = StreamingRequest
+StreamingRequest.upload_tmp_dir = os.path.join(UPLOAD_FOLDER, 'tmp')
+blob_store = BlobStore(os.path.join(UPLOAD_FOLDER, 'blobs'))
+
+# Blobs never change once written, so clients may cache them for a year.
+# SENDFILE_MODE hands the byte pushing to a front proxy:
+#   'x-sendfile' for Apache/lighttpd (X-Sendfile header with the file path)
+#   'x-accel'    for nginx (X-Accel-Redirect to an internal location that maps to uploads/blobs/)
+app.config['BLOB_MAX_AGE'] = 365 * 24 * 3600
+app.config['SENDFILE_MODE'] = os.environ.get('SENDFILE_MODE')
+app.config['USE_X_SENDFILE'] = app.config['SENDFILE_MODE'] == 'x-sendfile'
+app.config['BLOB_ACCEL_PREFIX'] = os.environ.get('BLOB_ACCEL_PREFIX', '/_blobs/')
+
+# Email goes nowhere until MAIL_SERVER is set, e.g. MAIL_SERVER=smtp.gmail.com with MAIL_USERNAME and an
+# app password in MAIL_PASSWORD; until then queued emails wait in the outbox.
+app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER')
+app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 465))
+app.config['MAIL_USE_SSL'] = os.environ.get('MAIL_USE_SSL', '1') == '1'
+app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
+app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
+app.config['MAIL_SENDER'] = os.environ.get('MAIL_SENDER', app.config['MAIL_USERNAME'])
+app.config['OUTBOX_WORKERS'] = int(os.environ.get('OUTBOX_WORKERS', 2))
+
+# One pool per worker process: enough connections for its request threads and the outbox threads
+app.config['DB_POOL_SIZE'] = int(os.environ.get(
+    'DB_POOL_SIZE', int(os.environ.get('WEB_THREADS', 4)) + app.config['OUTBOX_WORKERS']))
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+    app.config['SQLALCHEMY_DATABASE_URI'], pool_size=app.config['DB_POOL_SIZE'])
+
+# Optional read replica for dashboard and history pages (see read_session). After a user writes,
+# their reads stay on the primary for REPLICA_LAG_SECONDS so they see their own changes.
+app.config['DATABASE_REPLICA_URL'] = replica_url()
+app.config['REPLICA_LAG_SECONDS'] = float(os.environ.get('REPLICA_LAG_SECONDS', 5))
+if app.config['DATABASE_REPLICA_URL']:
+    app.config['SQLALCHEMY_BINDS'] = {'replica': {
+        'url': app.config['DATABASE_REPLICA_URL'],
+        **engine_options(app.config['DATABASE_REPLICA_URL'], pool_size=app.config['DB_POOL_SIZE'])
+    }}
+
+app.config['REPORT_CACHE_FOLDER'] = os.environ.get('REPORT_CACHE_FOLDER', os.path.join(app.instance_path, 'report_cache'))
+app.config['REPORT_WORKERS'] = int(os.environ.get('REPORT_WORKERS', 2))
+
+# Rendered dashboards (see fragments.py). 'memory' is per process; use 'sqlite' with several workers.
+app.config['DASHBOARD_CACHE'] = os.environ.get('DASHBOARD_CACHE', 'memory')
+app.config['DASHBOARD_CACHE_PATH'] = os.environ.get(
+    'DASHBOARD_CACHE_PATH', os.path.join(app.instance_path, 'dashboard_cache.db'))
+
+# Medication reminders (see reminders.py): 'log', 'email' (through the outbox) or 'webhook'
+app.config['REMINDER_CHANNEL'] = os.environ.get('REMINDER_CHANNEL', 'log')
+app.config['REMINDER_WEBHOOK_URL'] = os.environ.get('REMINDER_WEBHOOK_URL')
+app.config['REMINDER_BATCH_SIZE'] = int(os.environ.get('REMINDER_BATCH_SIZE', 500))
+app.config['REMINDER_MAX_LATENESS'] = int(os.environ.get('REMINDER_MAX_LATENESS', 3600))  # seconds
+
+# Prometheus metrics on /metrics (see metrics.py); METRICS_TOKEN, if set, must be sent as a bearer token.
+# SLOW_REQUEST_MS turns on the slow-request log.
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+app.config['SLOW_REQUEST_MS'] = float(os.environ['SLOW_REQUEST_MS']) if os.environ.get('SLOW_REQUEST_MS') else None
+
+# Password hashing (see passwords.py): any Werkzeug method, e.g. 'scrypt:16384:8:1' or 'pbkdf2:sha256:600000'.
+# Hashes made with another method are replaced at the user's next login.
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+app.config['PASSWORD_HASH_QUEUE'] = int(os.environ.get('PASSWORD_HASH_QUEUE', 4 * app.config['PASSWORD_HASH_WORKERS']))
+# Login and signup attempts allowed per client IP and login attempts per account: a burst, refilled per minute.
+# A rate of 0 turns that limit off. Behind a reverse proxy, set TRUSTED_PROXIES to the number of proxies in
+# front of the app, so the client IP is read from their X-Forwarded-For instead of being the proxy's own.
+# Leave it 0 when clients connect directly: otherwise they could send any X-Forwarded-For they like.
+app.config['TRUSTED_PROXIES'] = int(os.environ.get('TRUSTED_PROXIES', 0))
+app.config['LOGIN_IP_PER_MINUTE'] = float(os.environ.get('LOGIN_IP_PER_MINUTE', 20))
+app.config['LOGIN_IP_BURST'] = int(os.environ.get('LOGIN_IP_BURST', 20))
+app.config['LOGIN_ACCOUNT_PER_MINUTE'] = float(os.environ.get('LOGIN_ACCOUNT_PER_MINUTE', 5))
+app.config['LOGIN_ACCOUNT_BURST'] = int(os.environ.get('LOGIN_ACCOUNT_BURST', 10))
+
+if app.config['TRUSTED_PROXIES']:
+    hops = app.config['TRUSTED_PROXIES']
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops, x_port=hops)
 
 db = SQLAlchemy(app)
-#migrate = Migrate(app, db)
+request_metrics = RequestMetrics(slow_request_ms=app.config['SLOW_REQUEST_MS'])
+replica_session = None
+with app.app_context():
+    install_sqlite_pragmas(db.engine)
+    if app.config['DATABASE_REPLICA_URL']:
+        install_sqlite_pragmas(db.engines['replica'])
+        # scoped to the app context like db.session, and removed with it below
+        replica_session = scoped_session(sessionmaker(bind=db.engines['replica']),
+                                         scopefunc=lambda: id(app_ctx._get_current_object()))
+    request_metrics.init_app(app, db.engines.values())
+report_renderer = ReportRenderer(app.config['REPORT_CACHE_FOLDER'], workers=app.config['REPORT_WORKERS'],
+                                 on_rendered=request_metrics.observe_pdf)
+password_hasher = PasswordHasher(app.config['PASSWORD_HASH_METHOD'], workers=app.config['PASSWORD_HASH_WORKERS'],
+                                 max_queued=app.config['PASSWORD_HASH_QUEUE'],
+                                 on_hashed=request_metrics.observe_password_hash)
+login_ip_limiter = (TokenBucketLimiter(app.config['LOGIN_IP_PER_MINUTE'], app.config['LOGIN_IP_BURST'])
+                    if app.config['LOGIN_IP_PER_MINUTE'] else None)
+login_account_limiter = (TokenBucketLimiter(app.config['LOGIN_ACCOUNT_PER_MINUTE'], app.config['LOGIN_ACCOUNT_BURST'])
+                         if app.config['LOGIN_ACCOUNT_PER_MINUTE'] else None)
+thumbnail_pipeline = ThumbnailPipeline(workers=int(os.environ.get('THUMBNAIL_WORKERS', 1)))
+dashboard_cache = FragmentCache(SQLiteBackend(app.config['DASHBOARD_CACHE_PATH'])
+                                if app.config['DASHBOARD_CACHE'] == 'sqlite' else MemoryBackend())
+# Schema changes live in migrations/ (`flask db upgrade`); each revision commits on its own
+# so the batched backfills in online_migrations.py can commit as they go
+migrate = Migrate(app, db, directory=os.path.join(app.root_path, 'migrations'), transaction_per_migration=True)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -34,32 +169,319 @@ class User(db.Model):
     password = db.Column(db.String(100))
     role = db.Column(db.String(20))  # 'doctor' or 'patient'
 
+# Patient list and search on the doctor dashboard: WHERE role = ? ORDER BY lower(username), id
+db.Index('ix_users_role_username_lower', User.role, func.lower(User.username))
+db.Index('ix_users_role_email_lower', User.role, func.lower(User.email))
+
 class Medicine(db.Model):
+    __table_args__ = (
+        db.Index('ix_medicine_patient_username', 'patient_username'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     patient_username = db.Column(db.String(100))
+    patient_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
     name = db.Column(db.String(100))
     dosage = db.Column(db.String(100))
     time = db.Column(db.String(100))
 
 class Diagnosis(db.Model):
+    __table_args__ = (
+        db.Index('ix_diagnosis_patient_username', 'patient_username'),
+        db.Index('ix_diagnosis_doctor_username', 'doctor_username'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     doctor_username = db.Column(db.String(100))
     patient_username = db.Column(db.String(100))
+    doctor_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
     diagnosis_text = db.Column(db.Text)
 
+# Statuses that hold a doctor's time slot; Rejected and Completed free it up again
+ACTIVE_STATUSES = ('Pending', 'Accepted', 'Upcoming')
+ACTIVE_SLOT_CLAUSE = "status IN (%s)" % ", ".join(f"'{status}'" for status in ACTIVE_STATUSES)
+
 class Appointment(db.Model):
+    __table_args__ = (
+        db.Index('ix_appointment_doctor_date_time', 'doctor_username', 'date', 'time'),
+        # one active booking per slot, enforced by the database rather than a read-then-insert check
+        db.Index('uq_appointment_active_slot', 'doctor_username', 'date', 'time', unique=True,
+                 sqlite_where=db.text(ACTIVE_SLOT_CLAUSE), postgresql_where=db.text(ACTIVE_SLOT_CLAUSE)),
+        # per-status listings sorted chronologically, e.g. a doctor's Upcoming appointments
+        db.Index('ix_appointment_doctor_status_date_time', 'doctor_username', 'status', 'date', 'time'),
+        # day/week calendar range queries
+        db.Index('ix_appointment_doctor_id_starts_at', 'doctor_id', 'starts_at'),
+        db.Index('ix_appointment_patient_status', 'patient_username', 'status'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     patient_username = db.Column(db.String(100))
     doctor_username = db.Column(db.String(100))
-    date = db.Column(db.String(20))
-    time = db.Column(db.String(20))
+    patient_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    date = db.Column(db.String(20))  # normalized to YYYY-MM-DD when booked
+    time = db.Column(db.String(20))  # normalized to HH:MM when booked
+    starts_at = db.Column(db.DateTime)  # date and time combined, for range queries and sorting
     reason = db.Column(db.String(200))
     status = db.Column(db.String(20), default='Pending')  # 'Pending', 'Accepted', 'Rejected', 'Upcoming', 'Completed'
 
 class Report(db.Model):
+    __table_args__ = (
+        db.Index('ix_report_patient_username', 'patient_username'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     patient_username = db.Column(db.String(100))
+    patient_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
     filename = db.Column(db.String(200))
+    sha256 = db.Column(db.String(64), index=True)  # blob in blob_store; NULL for files saved by name in UPLOAD_FOLDER
+    size = db.Column(db.BigInteger)
+    mime_type = db.Column(db.String(100))
+
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(100), nullable=False)
+    subject = db.Column(db.String(200))
+    body = db.Column(db.Text)
+    status = db.Column(db.String(20), default='queued')  # 'queued', 'sending', 'sent', 'failed'
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.Float, default=time.time)  # epoch seconds
+    claimed_by = db.Column(db.String(32))
+    claimed_at = db.Column(db.Float)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.Float, default=time.time)
+    sent_at = db.Column(db.Float)
+
+class DoctorPatient(db.Model):
+    # Which patients a doctor has seen, from appointments and diagnoses.
+    # The primary key doubles as the (doctor_id, patient_id) index the dashboard joins through.
+    __tablename__ = 'doctor_patient'
+    doctor_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+
+class DoctorStatusCount(db.Model):
+    # Appointment counts per doctor and status, maintained by the Appointment
+    # flush events below so the summary page never has to count rows
+    __tablename__ = 'doctor_status_count'
+    doctor_username = db.Column(db.String(100), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+def bump_status_count(connection, doctor_username, status, delta):
+    if doctor_username is None or status is None:
+        return
+    dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+    table = DoctorStatusCount.__table__
+    connection.execute(
+        dialect.insert(table)
+        .values(doctor_username=doctor_username, status=status, count=delta)
+        .on_conflict_do_update(
+            index_elements=[table.c.doctor_username, table.c.status],
+            set_={'count': table.c.count + delta}
+        )
+    )
+
+# These run inside the flush, so the counters commit or roll back with the appointment change.
+# Bulk statements that bypass the ORM need a `flask rebuild-status-counts` afterwards.
+@db.event.listens_for(Appointment, 'after_insert')
+def count_new_appointment(mapper, connection, target):
+    bump_status_count(connection, target.doctor_username, target.status, 1)
+
+@db.event.listens_for(Appointment, 'after_update')
+def count_status_change(mapper, connection, target):
+    history = db.inspect(target).attrs.status.history
+    if history.deleted and history.added:
+        bump_status_count(connection, target.doctor_username, history.deleted[0], -1)
+        bump_status_count(connection, target.doctor_username, history.added[0], 1)
+
+@db.event.listens_for(Appointment, 'after_delete')
+def count_deleted_appointment(mapper, connection, target):
+    bump_status_count(connection, target.doctor_username, target.status, -1)
+
+class DoctorProfile(db.Model):
+    # What find_doctor lists: one row per doctor user
+    __tablename__ = 'doctor_profile'
+    __table_args__ = (
+        db.Index('ix_doctor_profile_specialty_experience', 'specialty', 'experience'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), unique=True, nullable=False)
+    specialty = db.Column(db.String(50), nullable=False)
+    experience = db.Column(db.Integer, nullable=False, default=0)  # years
+    contact = db.Column(db.String(20))
+
+class DoctorSchedule(db.Model):
+    # One working block per row; a doctor's breaks are the gaps between blocks on the same weekday
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True, nullable=False)
+    weekday = db.Column(db.Integer, nullable=False)  # 0 = Monday
+    start_time = db.Column(db.String(5), nullable=False)  # HH:MM
+    end_time = db.Column(db.String(5), nullable=False)
+    slot_minutes = db.Column(db.Integer, nullable=False, default=30)
+
+class MedicationReminder(db.Model):
+    # When each medicine's next dose is due, parsed from Medicine.time; medicines
+    # whose time can't be read have no row. The scheduler reads it by next_due_at.
+    __tablename__ = 'medication_reminder'
+    medicine_id = db.Column(db.Integer, db.ForeignKey('medicine.id', ondelete='CASCADE'), primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    schedule = db.Column(db.String(100), nullable=False)  # HH:MM,HH:MM
+    next_due_at = db.Column(db.DateTime, nullable=False, index=True)
+    last_sent_at = db.Column(db.DateTime)
+
+reminder_store = ReminderStore(MedicationReminder.__table__, Medicine.__table__, User.__table__)
+
+# Like the status counters, reminders are kept in step inside the flush, so they commit or
+# roll back with the medicine. Bulk statements need a `flask rebuild-reminders` afterwards.
+@db.event.listens_for(Medicine, 'after_insert')
+def schedule_new_medicine(mapper, connection, target):
+    reminder_store.schedule(connection, [(target.id, target.patient_id, target.time)], datetime.now())
+
+@db.event.listens_for(Medicine, 'after_update')
+def reschedule_medicine(mapper, connection, target):
+    state = db.inspect(target)
+    if state.attrs.time.history.has_changes() or state.attrs.patient_id.history.has_changes():
+        reminder_store.schedule(connection, [(target.id, target.patient_id, target.time)], datetime.now())
+
+@db.event.listens_for(Medicine, 'after_delete')
+def unschedule_medicine(mapper, connection, target):
+    reminder_store.unschedule(connection, [target.id])
+
+def load_schedule(doctor_id):
+    return [(block.weekday, block.start_time, block.end_time, block.slot_minutes)
+            for block in DoctorSchedule.query.filter_by(doctor_id=doctor_id)]
+
+def load_bookings(doctor_id, since):
+    rows = db.session.query(Appointment.starts_at).filter(
+        Appointment.doctor_id == doctor_id,
+        Appointment.starts_at >= since,
+        Appointment.status.in_(ACTIVE_STATUSES)
+    )
+    return [row.starts_at for row in rows]
+
+availability_service = AvailabilityService(load_schedule, load_bookings)
+
+# Keep the in-memory availability in step with committed bookings: flush events note which
+# slots were taken or freed, and the changes are applied only once the transaction commits
+def note_availability_change(target, action):
+    session = db.inspect(target).session
+    if session is not None and target.doctor_id is not None:
+        session.info.setdefault('availability_changes', []).append((action, target.doctor_id, target.starts_at))
+
+@db.event.listens_for(Appointment, 'after_insert')
+def slot_taken(mapper, connection, target):
+    if target.status in ACTIVE_STATUSES:
+        note_availability_change(target, 'add')
+
+@db.event.listens_for(Appointment, 'after_update')
+def slot_status_changed(mapper, connection, target):
+    history = db.inspect(target).attrs.status.history
+    if history.deleted and history.added:
+        was_active, is_active = history.deleted[0] in ACTIVE_STATUSES, history.added[0] in ACTIVE_STATUSES
+        if was_active != is_active:
+            note_availability_change(target, 'add' if is_active else 'remove')
+
+@db.event.listens_for(Appointment, 'after_delete')
+def slot_freed(mapper, connection, target):
+    if target.status in ACTIVE_STATUSES:
+        note_availability_change(target, 'remove')
+
+@db.event.listens_for(Session, 'after_commit')
+def apply_availability_changes(session):
+    changes = session.info.pop('availability_changes', None)
+    if changes:
+        availability_service.apply(changes)
+
+@db.event.listens_for(Session, 'after_rollback')
+def discard_availability_changes(session):
+    session.info.pop('availability_changes', None)
+
+# Read/write split: writes always go through db.session (the primary); read_session() hands
+# dashboard and history views the replica session when there is one
+def read_session():
+    if (replica_session is None or g.get('read_primary')
+            or session.get('read_primary_until', 0) > time.time()):
+        return db.session
+    return replica_session
+
+@app.teardown_appcontext
+def remove_replica_session(exc):
+    if replica_session is not None:
+        replica_session.remove()
+
+@db.event.listens_for(Session, 'after_flush')
+def note_write(db_session, flush_context):
+    db_session.info['wrote'] = True
+
+@db.event.listens_for(Session, 'after_commit')
+def pin_reads_to_primary(db_session):
+    # the replica may lag behind; keep this user on the primary until it has caught up
+    if db_session.info.pop('wrote', False) and replica_session is not None and has_request_context():
+        session['read_primary_until'] = time.time() + app.config['REPLICA_LAG_SECONDS']
+
+@db.event.listens_for(Session, 'after_rollback')
+def forget_write(db_session):
+    db_session.info.pop('wrote', None)
+
+# The history page, its JSON and the PDF report all read a patient's history through one UNION ALL query
+history_service = PatientHistoryService({
+    'medicines': Medicine.__table__,
+    'diagnoses': Diagnosis.__table__,
+    'reports': Report.__table__,
+    'appointments': Appointment.__table__,
+})
+HISTORY_PER_PAGE = 50
+
+def count_appointments_by_status(doctor_username=None):
+    # One GROUP BY over the (doctor_username, status, ...) index; used to (re)build the counters
+    query = db.session.query(Appointment.doctor_username, Appointment.status, func.count()).group_by(
+        Appointment.doctor_username, Appointment.status)
+    if doctor_username is not None:
+        query = query.filter(Appointment.doctor_username == doctor_username)
+    return query.all()
+
+SLOT_DATE_FORMATS = ('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y')
+SLOT_TIME_FORMATS = ('%H:%M', '%H:%M:%S', '%I:%M %p', '%I:%M%p')
+
+def parse_slot(date_text, time_text):
+    # Returns the appointment start as a datetime, or None if either part can't be read
+    date_text, time_text = (date_text or '').strip(), (time_text or '').strip().upper()
+    for date_format in SLOT_DATE_FORMATS:
+        for time_format in SLOT_TIME_FORMATS:
+            try:
+                return datetime.strptime(f'{date_text} {time_text}', f'{date_format} {time_format}')
+            except ValueError:
+                continue
+    return None
+
+def appointments_between(doctor_id, start, end):
+    # Half-open [start, end) range scan on the (doctor_id, starts_at) index
+    return Appointment.query.filter(
+        Appointment.doctor_id == doctor_id,
+        Appointment.starts_at >= start,
+        Appointment.starts_at < end
+    ).order_by(Appointment.starts_at, Appointment.id).all()
+
+def user_id_for(username):
+    # username is unique on users, so this is a single index lookup
+    user = User.query.filter_by(username=username).with_entities(User.id).first()
+    return user.id if user else None
+
+def current_user_id():
+    # sessions from before user_id was stored at login only carry the username
+    return session.get('user_id') or user_id_for(session['username'])
+
+def link_doctor_patient(doctor_id, patient_id):
+    # Runs inside the caller's transaction; an existing link is left alone
+    if doctor_id is None or patient_id is None:
+        return
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    db.session.execute(
+        dialect.insert(DoctorPatient)
+        .values(doctor_id=doctor_id, patient_id=patient_id)
+        .on_conflict_do_nothing()
+    )
 
 # Routes
 
@@ -75,6 +497,22 @@ def aboutus():
 def contactus():
     return render_template('contactus.html')
 
+def login_throttled(template, *accounts):
+    """A 429 page if this client IP, or any of the accounts, is out of attempts; None to go ahead."""
+    # remote_addr is the client's address as resolved by ProxyFix when TRUSTED_PROXIES is set
+    waits = [login_ip_limiter.take(request.remote_addr)] if login_ip_limiter else []
+    if login_account_limiter:
+        waits += [login_account_limiter.take(account.strip().lower()) for account in accounts if account]
+    wait = max(waits, default=0)
+    if not wait:
+        return None
+    flash('Too many attempts, please wait a minute and try again.', 'danger')
+    return render_template(template), 429, {'Retry-After': str(int(wait) + 1)}
+
+def hashing_busy(template):
+    flash('We are very busy right now, please try again in a few seconds.', 'danger')
+    return render_template(template), 503, {'Retry-After': '5'}
+
 # Signup
 @app.route('/signup', methods=['GET', 'POST'])
 def signup():
@@ -88,14 +526,21 @@ def signup():
             flash('Please fill all fields', 'danger')
             return redirect(url_for('signup'))
 
-        hashed_password = generate_password_hash(password)
+        throttled = login_throttled('signup.html')
+        if throttled:
+            return throttled
 
-        # Check if email already exists
+        # Check if email already exists, before spending a hash on it
         existing_user = User.query.filter_by(email=email).first()
         if existing_user:
             flash('Email already exists!', 'danger')
             return redirect(url_for('signup'))
 
+        try:
+            hashed_password = password_hasher.hash(password)
+        except HasherBusy:
+            return hashing_busy('signup.html')
+
         new_user = User(username=name, email=email, password=hashed_password, role=role)
         db.session.add(new_user)
         db.session.commit()
@@ -111,9 +556,22 @@ def login():
         email = request.form.get('email')
         password = request.form.get('password')
 
+        throttled = login_throttled('login.html', email)
+        if throttled:
+            return throttled
+
         user = User.query.filter_by(email=email).first()
-        if user and check_password_hash(user.password, password):
+        try:
+            valid, upgraded_hash = password_hasher.verify(user.password, password) if user and password else (False, None)
+        except HasherBusy:
+            return hashing_busy('login.html')
+        if valid:
+            if upgraded_hash:
+                # made with an older hashing policy
+                user.password = upgraded_hash
+                db.session.commit()
             session['username'] = user.username
+            session['user_id'] = user.id
             session['role'] = user.role
             flash('Login successful!', 'success')
             if user.role == 'doctor':
@@ -130,12 +588,91 @@ def logout():
     session.clear()
     return redirect('/')
 
+def cached_page(key, render, shows_flashes=False):
+    """Serve the logged-in user's page from dashboard_cache, with an ETag so repeat visits get a 304.
+
+    Writes that change a dashboard call dashboard_cache.bump(username) after committing.
+    """
+    if shows_flashes and session.get('_flashes'):
+        # flash messages are shown once and must not end up in the cache
+        return render()
+    # A miss usually follows a write that bumped the version, so render from the primary:
+    # a lagging replica would put stale data in the cache under the new version
+    g.read_primary = True
+    etag, body = dashboard_cache.get_or_render(session['username'], key, render)
+    response = Response(body, mimetype='text/html')
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+PATIENTS_PER_PAGE = 50
+
+def search_patients(q=None, cursor=None, limit=PATIENTS_PER_PAGE, doctor_id=None):
+    username_key = func.lower(User.username)
+    if doctor_id is not None:
+        # Only that doctor's patients, driven from the doctor_patient primary key. Everyone in
+        # doctor_patient is a patient, and leaving out the role filter keeps SQLite from walking
+        # the whole (role, lower(username)) index to avoid sorting a handful of rows
+        query = read_session().query(User).join(DoctorPatient, DoctorPatient.patient_id == User.id).filter(
+            DoctorPatient.doctor_id == doctor_id)
+    else:
+        query = read_session().query(User).filter(User.role == 'patient')
+    q = (q or '').strip().lower()
+    if q:
+        # Case-insensitive prefix match on username or email. Each side is an index range scan
+        # (not LIKE, which can't use the lower(...) indexes) and the matches are unioned, so
+        # selective searches never walk the whole patient list
+        upper = q + '\U0010ffff'
+        email_key = func.lower(User.email)
+        by_username = db.select(User.id).where(User.role == 'patient', username_key >= q, username_key < upper)
+        by_email = db.select(User.id).where(User.role == 'patient', email_key >= q, email_key < upper)
+        matches = db.union(by_username, by_email).subquery()
+        query = query.join(matches, matches.c.id == User.id)
+    return keyset_page(query, [username_key, User.id], cursor=cursor, limit=limit)
+
 @app.route('/doctor_dashboard')
 def doctor_dashboard():
     if 'role' not in session or session['role'] != 'doctor':
         return redirect('/login')
-    patients = User.query.filter_by(role='patient').all()
-    return render_template('doctor_dashboard.html', username=session['username'], patients=patients)
+    q = request.args.get('q', '')
+
+    def render():
+        patients, next_cursor = search_patients(q, doctor_id=current_user_id())
+        return render_template('doctor_dashboard.html', username=session['username'], patients=patients,
+                               q=q, next_cursor=next_cursor, scope='mine')
+
+    return cached_page(f'doctor_dashboard?q={q}', render)
+
+@app.route('/all_patients')
+def all_patients():
+    if 'role' not in session or session['role'] != 'doctor':
+        return redirect('/login')
+    q = request.args.get('q', '')
+    patients, next_cursor = search_patients(q)
+    return render_template('doctor_dashboard.html', username=session['username'], patients=patients,
+                           q=q, next_cursor=next_cursor, scope='all')
+
+@app.route('/doctor_dashboard/patients')
+def doctor_dashboard_patients():
+    if 'role' not in session or session['role'] != 'doctor':
+        return jsonify({'error': 'unauthorized'}), 401
+    limit = min(request.args.get('limit', PATIENTS_PER_PAGE, type=int), 200)
+    doctor_id = None if request.args.get('scope') == 'all' else current_user_id()
+    patients, next_cursor = search_patients(request.args.get('q'), request.args.get('cursor'), limit, doctor_id)
+    return jsonify({
+        'patients': [{
+            'username': patient.username,
+            'email': patient.email,
+            'links': {
+                'add_diagnosis': url_for('add_diagnosis', patient_username=patient.username),
+                'view_patient_history': url_for('view_patient_history', patient_username=patient.username),
+                'view_reports': url_for('view_reports', patient_username=patient.username),
+                'add_medicine': url_for('add_medicine', patient_username=patient.username)
+            }
+        } for patient in patients],
+        'next_cursor': next_cursor
+    })
 
 @app.route('/add_diagnosis/<patient_username>', methods=['GET', 'POST'])
 def add_diagnosis(patient_username):
@@ -147,10 +684,16 @@ def add_diagnosis(patient_username):
         new_diag = Diagnosis(
             doctor_username=session['username'],
             patient_username=patient_username,
+            doctor_id=current_user_id(),
+            patient_id=user_id_for(patient_username),
             diagnosis_text=diagnosis_text
         )
         db.session.add(new_diag)
+        link_doctor_patient(new_diag.doctor_id, new_diag.patient_id)
         db.session.commit()
+        report_renderer.invalidate(patient_username)
+        # the patient may be new to this doctor's list
+        dashboard_cache.bump(session['username'])
         return redirect('/doctor_dashboard')
 
     return render_template('add_diagnosis.html', patient_username=patient_username)
@@ -160,9 +703,18 @@ def view_patient_history(patient_username):
     if 'role' not in session or session['role'] != 'doctor':
         return redirect('/login')
 
-    meds = Medicine.query.filter_by(patient_username=patient_username).all()
-    diagnoses = Diagnosis.query.filter_by(patient_username=patient_username).all()
-    return render_template('view_patient_history.html', patient_username=patient_username, meds=meds, diagnoses=diagnoses)
+    history = history_service.load(read_session(), patient_username, request.args.get('cursor'), HISTORY_PER_PAGE)
+    return render_template('view_patient_history.html', patient_username=patient_username,
+                           medicines=history.medicines, diagnoses=history.diagnoses, reports=history.reports,
+                           appointments=history.appointments, next_cursor=history.next_cursor)
+
+@app.route('/view_patient_history/<patient_username>/entries')
+def patient_history_entries(patient_username):
+    if 'role' not in session or session['role'] != 'doctor':
+        return jsonify({'error': 'unauthorized'}), 401
+    limit = min(request.args.get('limit', HISTORY_PER_PAGE, type=int), 200)
+    history = history_service.load(read_session(), patient_username, request.args.get('cursor'), limit)
+    return jsonify({'patient_username': patient_username, **history.to_dict()})
 
 @app.route('/book_appointment', methods=['GET', 'POST'])
 def book_appointment():
@@ -181,41 +733,62 @@ def book_appointment():
     if request.method == 'POST':
         patient_username = session['username']
         doctor_username = request.form['doctor_username']
-        date = request.form['date']
-        time = request.form['time']
         reason = request.form['reason']
-
-        # Prevent duplicate appointments for the same doctor, date, and time
-        existing = Appointment.query.filter_by(
-            doctor_username=doctor_username,
-            date=date,
-            time=time
-        ).first()
-        if existing:
-            flash("This time slot is already booked with the selected doctor. Please choose another time.", "danger")
+        starts_at = parse_slot(request.form['date'], request.form['time'])
+        if starts_at is None:
+            flash("Please enter a valid date and time.", "danger")
             return redirect(url_for('book_appointment'))
+        # Store one canonical spelling so the unique slot index sees '9:00' and '09:00' as the same slot
+        date = starts_at.strftime('%Y-%m-%d')
+        time = starts_at.strftime('%H:%M')
 
         new_appointment = Appointment(
             patient_username=patient_username,
             doctor_username=doctor_username,
+            patient_id=current_user_id(),
+            doctor_id=user_id_for(doctor_username),
             date=date,
             time=time,
+            starts_at=starts_at,
             reason=reason,
             status='Upcoming'
         )
         db.session.add(new_appointment)
-        db.session.commit()
+        # The unique slot index rejects a second active booking for the same doctor, date, and time,
+        # so concurrent requests can't both get through
+        try:
+            link_doctor_patient(new_appointment.doctor_id, new_appointment.patient_id)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash("This time slot is already booked with the selected doctor. Please choose another time.", "danger")
+            return redirect(url_for('book_appointment'))
+        dashboard_cache.bump(patient_username, doctor_username)
         flash(f"Appointment booked successfully with {doctor_username} on {date} at {time}!", "success")
         return redirect(url_for('patient_dashboard'))
 
     return render_template('book_appointment.html', doctor_names=doctor_names, now=datetime.now)
 
+APPOINTMENTS_PER_PAGE = 100
+
 @app.route('/doctor_appointments')
 def doctor_appointments():
     if 'role' not in session or session['role'] != 'doctor':
         return redirect('/login')
-    appointments = Appointment.query.filter_by(doctor_username=session['username']).all()
-    return render_template('doctor_appointments.html', appointments=appointments)
+    # a range scan on the (doctor_id, starts_at) index
+    cursor = request.args.get('cursor')
+    appointments, next_cursor = keyset_page(
+        Appointment.query.filter(Appointment.doctor_id == current_user_id(), Appointment.starts_at.isnot(None)),
+        [Appointment.starts_at, Appointment.id],
+        cursor=cursor,
+        limit=APPOINTMENTS_PER_PAGE
+    )
+    # Legacy rows whose date/time couldn't be read have no starts_at to page by; list them
+    # on the first page so the doctor can still answer them
+    unscheduled = [] if cursor else Appointment.query.filter(
+        Appointment.doctor_id == current_user_id(), Appointment.starts_at.is_(None)).order_by(Appointment.id).all()
+    return render_template('doctor_appointments.html', appointments=appointments, next_cursor=next_cursor,
+                           unscheduled=unscheduled)
 
 @app.route('/update_appointment/<int:appointment_id>/<action>')
 def update_appointment(appointment_id, action):
@@ -227,7 +800,13 @@ def update_appointment(appointment_id, action):
         appointment.status = 'Accepted'
     elif action == 'reject':
         appointment.status = 'Rejected'
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        flash("This time slot has already been given to another appointment.", "danger")
+    else:
+        dashboard_cache.bump(appointment.patient_username)
     return redirect('/doctor_appointments')
 
 @app.route('/add_medicine/<patient_username>', methods=['GET', 'POST'])
@@ -241,33 +820,66 @@ def add_medicine(patient_username):
         time = request.form['time']
         new_medicine = Medicine(
             patient_username=patient_username,
+            patient_id=user_id_for(patient_username),
             name=name,
             dosage=dosage,
             time=time
         )
         db.session.add(new_medicine)
         db.session.commit()
+        report_renderer.invalidate(patient_username)
+        dashboard_cache.bump(patient_username)
         flash('Medicine added successfully!', 'success')
         return redirect(url_for('doctor_dashboard'))
     return render_template('add_medicine.html', patient_username=patient_username)
 
+def patient_report_job(patient_username):
+    # the whole history, from the primary: the hash must match what was just committed
+    history = history_service.load(db.session, patient_username)
+    content_hash = history_hash(history)
+
+    def render_html():
+        return render_template('report_template.html', patient_username=patient_username,
+                               meds=history.medicines, diagnoses=history.diagnoses,
+                               appointments=history.appointments, reports=history.reports)
+
+    return content_hash, render_html
+
 @app.route('/download_report/<patient_username>')
 def download_report(patient_username):
     if 'role' not in session or session['role'] != 'doctor':
         return redirect('/login')
-    meds = Medicine.query.filter_by(patient_username=patient_username).all()
-    diagnoses = Diagnosis.query.filter_by(patient_username=patient_username).all()
-    rendered_html = render_template('report_template.html', patient_username=patient_username, meds=meds, diagnoses=diagnoses)
-    result = BytesIO()
-    pdf = pisa.pisaDocument(BytesIO(rendered_html.encode("UTF-8")), result)
-
-    if not pdf.err:
-        response = make_response(result.getvalue())
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = f'attachment; filename={patient_username}_report.pdf'
-        return response
-    else:
-        return "Error generating PDF"
+    content_hash, render_html = patient_report_job(patient_username)
+
+    if report_renderer.status(patient_username, content_hash) == READY:
+        return send_file(
+            report_renderer.path_for(patient_username, content_hash),
+            mimetype='application/pdf',
+            as_attachment=True,
+            download_name=f'{patient_username}_report.pdf',
+            conditional=True,
+            etag=content_hash
+        )
+
+    # Not rendered yet: start a background job and let the page poll report_status
+    report_renderer.submit(patient_username, content_hash, render_html)
+    return render_template('report_status.html', patient_username=patient_username)
+
+@app.route('/report_status/<patient_username>')
+def report_status(patient_username):
+    if 'role' not in session or session['role'] != 'doctor':
+        return jsonify({'error': 'unauthorized'}), 401
+    content_hash, render_html = patient_report_job(patient_username)
+    status = report_renderer.status(patient_username, content_hash)
+    if status is None:
+        # the history changed since the download was requested, or another worker took the job
+        report_renderer.submit(patient_username, content_hash, render_html)
+        status = report_renderer.status(patient_username, content_hash)
+    return jsonify({
+        'status': status,
+        'download_url': url_for('download_report', patient_username=patient_username) if status == READY else None,
+        'error': "Error generating PDF" if status == ERROR else None
+    })
 
 @app.route('/upload_report', methods=['GET', 'POST'])
 def upload_report():
@@ -276,13 +888,20 @@ def upload_report():
 
     if request.method == 'POST':
         file = request.files['report']
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-
-            report = Report(patient_username=session['username'], filename=filename)
+        upload = file.stream
+        if file and allowed_file(file.filename) and upload.mime_type in ALLOWED_MIME_TYPES:
+            sha256 = blob_store.store(upload)
+            report = Report(
+                patient_username=session['username'],
+                patient_id=current_user_id(),
+                filename=secure_filename(file.filename),
+                sha256=sha256,
+                size=upload.size,
+                mime_type=upload.mime_type
+            )
             db.session.add(report)
             db.session.commit()
+            thumbnail_pipeline.submit(blob_store.path_for(sha256), report.mime_type)
             return redirect('/patient_dashboard')
         else:
             return "Invalid file type"
@@ -291,9 +910,14 @@ def upload_report():
 @app.route('/patient_dashboard')
 def patient_dashboard():
     if 'role' in session and session['role'] == 'patient':
-        medicines = Medicine.query.filter_by(patient_username=session['username']).all()
-        appointments = Appointment.query.filter_by(patient_username=session['username']).all()
-        return render_template('patient_dashboard.html', username=session['username'], medicines=medicines, appointments=appointments)
+        def render():
+            reads = read_session()
+            medicines = reads.query(Medicine).filter_by(patient_username=session['username']).all()
+            appointments = reads.query(Appointment).filter_by(patient_username=session['username']).order_by(
+                Appointment.starts_at, Appointment.id).all()
+            return render_template('patient_dashboard.html', username=session['username'], medicines=medicines, appointments=appointments)
+
+        return cached_page('patient_dashboard', render, shows_flashes=True)
     return redirect('/login')
 
 @app.route('/cancel_appointment/<int:appointment_id>', methods=['POST'])
@@ -306,19 +930,80 @@ def cancel_appointment(appointment_id):
         return redirect(url_for('patient_dashboard'))
     db.session.delete(appointment)
     db.session.commit()
+    dashboard_cache.bump(session['username'])
     flash("Appointment cancelled successfully.", "success")
     return redirect(url_for('patient_dashboard'))
 
+@app.errorhandler(413)
+def upload_too_large(e):
+    limit_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    return f"File too large. Reports can be at most {limit_mb} MB.", 413
+
+def send_blob(path, etag, mimetype, download_name, as_attachment=False):
+    # Conditional GET on the content hash, byte ranges for partial PDF/image loads,
+    # and private caching since these are medical records
+    mode = app.config['SENDFILE_MODE']
+    if mode == 'x-accel':
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = app.config['BLOB_ACCEL_PREFIX'] + os.path.relpath(path, blob_store.root)
+        response.headers.set('Content-Disposition', 'attachment' if as_attachment else 'inline',
+                             filename=download_name)
+        response.set_etag(etag)
+        response.cache_control.max_age = app.config['BLOB_MAX_AGE']
+    else:
+        # with USE_X_SENDFILE this only sets the X-Sendfile header and leaves the body to the proxy
+        response = send_file(path, mimetype=mimetype, as_attachment=as_attachment,
+                             download_name=download_name, etag=etag, conditional=mode is None,
+                             max_age=app.config['BLOB_MAX_AGE'])
+    if mode:
+        # answer If-None-Match with a 304 here; the proxy sends the body and handles Range itself
+        response = response.make_conditional(request)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
+    if 'role' not in session:
+        return redirect('/login')
+    if session['role'] != 'doctor' and not Report.query.filter_by(
+            patient_username=session['username'], filename=filename).first():
+        return redirect('/login')
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
+@app.route('/reports/<int:report_id>/file')
+def report_file(report_id):
+    if 'role' not in session:
+        return redirect('/login')
+    report = Report.query.get_or_404(report_id)
+    if session['role'] != 'doctor' and report.patient_username != session['username']:
+        return redirect('/login')
+    if not report.sha256:
+        return redirect(url_for('uploaded_file', filename=report.filename))
+    return send_blob(blob_store.path_for(report.sha256), report.sha256, report.mime_type, report.filename,
+                     as_attachment=request.args.get('download') == '1')
+
+@app.route('/reports/<int:report_id>/thumbnail')
+def report_thumbnail(report_id):
+    if 'role' not in session:
+        return redirect('/login')
+    report = Report.query.get_or_404(report_id)
+    if session['role'] != 'doctor' and report.patient_username != session['username']:
+        return redirect('/login')
+    path = thumbnail_path(blob_store.path_for(report.sha256)) if report.sha256 else None
+    if path is None or not os.path.exists(path):
+        return "No preview available", 404
+    return send_blob(path, f'{report.sha256}-thumb', 'image/jpeg', f'{report.filename}.jpg')
+
 @app.route('/view_reports/<patient_username>')
 def view_reports(patient_username):
     if 'role' not in session or session['role'] != 'doctor':
         return redirect('/login')
 
     reports = Report.query.filter_by(patient_username=patient_username).all()
+    previews = {report.id for report in reports
+                if report.sha256 and os.path.exists(thumbnail_path(blob_store.path_for(report.sha256)))}
     latest_appointment = Appointment.query.filter_by(
         patient_username=patient_username,
         doctor_username=session['username']
@@ -329,6 +1014,7 @@ def view_reports(patient_username):
         'view_reports.html',
         patient_username=patient_username,
         reports=reports,
+        previews=previews,
         latest_appointment_id=latest_appointment_id
     )
 
@@ -339,18 +1025,122 @@ def view_diagnosis():
     diagnoses = Diagnosis.query.filter_by(patient_username=session['username']).all()
     return render_template('view_diagnosis.html', diagnoses=diagnoses)
 
+@app.route('/doctor_calendar/<view>')
+def doctor_calendar(view):
+    if 'role' not in session or session['role'] != 'doctor':
+        return jsonify({'error': 'unauthorized'}), 401
+    if view not in ('day', 'week'):
+        return jsonify({'error': "view must be 'day' or 'week'"}), 404
+    try:
+        start = datetime.strptime(request.args.get('date', ''), '%Y-%m-%d')
+    except ValueError:
+        start = datetime.combine(datetime.now().date(), datetime.min.time())
+    if view == 'week':
+        start -= timedelta(days=start.weekday())  # weeks start on Monday
+    end = start + timedelta(days=1 if view == 'day' else 7)
+
+    appointments = appointments_between(current_user_id(), start, end)
+    return jsonify({
+        'start': start.date().isoformat(),
+        'end': end.date().isoformat(),
+        'appointments': [{
+            'id': appointment.id,
+            'patient_username': appointment.patient_username,
+            'starts_at': appointment.starts_at.isoformat(),
+            'reason': appointment.reason,
+            'status': appointment.status
+        } for appointment in appointments]
+    })
+
+MAX_SLOT_DAYS = 31
+
+@app.route('/doctors/<doctor_username>/free_slots')
+def free_slots(doctor_username):
+    if 'role' not in session:
+        return jsonify({'error': 'unauthorized'}), 401
+    doctor_id = user_id_for(doctor_username)
+    if doctor_id is None:
+        return jsonify({'error': 'unknown doctor'}), 404
+    try:
+        first_day = datetime.strptime(request.args.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        first_day = datetime.now().date()
+    days = max(1, min(request.args.get('days', 1, type=int), MAX_SLOT_DAYS))
+    slots = availability_service.free_slots(doctor_id, first_day, first_day + timedelta(days=days - 1))
+    return jsonify({
+        'doctor_username': doctor_username,
+        'slots': [{'date': slot.strftime('%Y-%m-%d'), 'time': slot.strftime('%H:%M')} for slot in slots]
+    })
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+@app.route('/doctor_schedule', methods=['GET', 'POST'])
+def doctor_schedule():
+    if 'role' not in session or session['role'] != 'doctor':
+        return redirect('/login')
+    doctor_id = current_user_id()
+
+    if request.method == 'POST':
+        # Each weekday field holds comma-separated blocks, e.g. "09:00-13:00, 14:00-17:00"
+        slot_minutes = request.form.get('slot_minutes', 30, type=int)
+        blocks = []
+        for weekday in range(7):
+            for block in filter(None, (b.strip() for b in request.form.get(f'day{weekday}', '').split(','))):
+                start, _, end = block.partition('-')
+                start_at, end_at = parse_slot('2000-01-01', start), parse_slot('2000-01-01', end)
+                if start_at is None or end_at is None or end_at <= start_at or not 5 <= slot_minutes <= 240:
+                    flash(f"Could not read {WEEKDAYS[weekday]} hours \"{block}\".", "danger")
+                    return redirect(url_for('doctor_schedule'))
+                blocks.append(DoctorSchedule(doctor_id=doctor_id, weekday=weekday,
+                                             start_time=start_at.strftime('%H:%M'),
+                                             end_time=end_at.strftime('%H:%M'), slot_minutes=slot_minutes))
+        DoctorSchedule.query.filter_by(doctor_id=doctor_id).delete()
+        db.session.add_all(blocks)
+        db.session.commit()
+        availability_service.invalidate(doctor_id)
+        flash("Schedule saved.", "success")
+        return redirect(url_for('doctor_schedule'))
+
+    schedule = load_schedule(doctor_id) or DEFAULT_SCHEDULE
+    days = {weekday: ', '.join(f'{start}-{end}' for day, start, end, _ in sorted(schedule) if day == weekday)
+            for weekday in range(7)}
+    slot_minutes = schedule[0][3] if schedule else 30
+    return render_template('doctor_schedule.html', weekdays=WEEKDAYS, days=days, slot_minutes=slot_minutes)
+
+UPCOMING_LIMIT = 50
+
+def appointment_summary(doctor):
+    counts = {row.status: row.count for row in DoctorStatusCount.query.filter_by(doctor_username=doctor) if row.count}
+    upcoming = Appointment.query.filter_by(doctor_username=doctor, status='Upcoming').order_by(
+        Appointment.starts_at.asc().nulls_last(), Appointment.id).limit(UPCOMING_LIMIT).all()
+    return counts, upcoming
+
 @app.route("/doctor_view_appointments")
 def doctor_view_appointments():
     if 'username' not in session or session['role'] != 'doctor':
         return redirect('/login')
 
-    doctor = session['username']
-    total = Appointment.query.filter_by(doctor_username=doctor).count()
-    completed = Appointment.query.filter_by(doctor_username=doctor, status='Completed').count()
-    appointments = Appointment.query.filter_by(doctor_username=doctor, status='Upcoming').all()
+    counts, appointments = appointment_summary(session['username'])
+    return render_template("doctor_appointments_summary.html", total=sum(counts.values()),
+                           completed=counts.get('Completed', 0), counts=counts, appointments=appointments)
 
-    # appointments is a list of Appointment objects, not tuples!
-    return render_template("doctor_appointments_summary.html", total=total, completed=completed, appointments=appointments)
+@app.route("/doctor_view_appointments/summary")
+def doctor_appointment_summary():
+    if 'username' not in session or session['role'] != 'doctor':
+        return jsonify({'error': 'unauthorized'}), 401
+
+    counts, upcoming = appointment_summary(session['username'])
+    return jsonify({
+        'total': sum(counts.values()),
+        'counts': counts,
+        'upcoming': [{
+            'id': appointment.id,
+            'patient_username': appointment.patient_username,
+            'date': appointment.date,
+            'time': appointment.time,
+            'reason': appointment.reason
+        } for appointment in upcoming]
+    })
 
 @app.route("/solve_appointment/<int:appointment_id>", methods=['GET', 'POST'])
 def solve_appointment(appointment_id):
@@ -367,7 +1157,6 @@ def solve_appointment(appointment_id):
     if request.method == 'POST':
         solution = request.form['diagnosis']
         appointment.status = 'Completed'
-        db.session.commit()
 
         if patient_email:
             subject = f"Diagnosis from Dr. {doctor}"
@@ -383,6 +1172,9 @@ MedTrack Team
 """
             send_email(patient_email, subject, body)
 
+        # the status change and the queued email are committed together
+        db.session.commit()
+        dashboard_cache.bump(patient)
         return redirect("/doctor_view_appointments")
 
     # For GET requests, render the template and pass the appointment object
@@ -408,137 +1200,370 @@ def profile():
         flash("Please log in to access your profile.", "warning")
         return redirect(url_for('login'))
 
+DOCTORS_PER_PAGE = 10
+
+# find_doctor reads through this cache; doctor_profile invalidates the specialties it touches
+doctor_directory = TTLCache(ttl=int(os.environ.get('DOCTOR_DIRECTORY_TTL', 300)))
+
+def load_specialties():
+    return [row.specialty for row in
+            db.session.query(DoctorProfile.specialty).distinct().order_by(DoctorProfile.specialty)]
+
+def load_specialty_doctors(specialty):
+    # Most experienced first; served from ix_doctor_profile_specialty_experience
+    rows = db.session.query(User.username, User.email, DoctorProfile.specialty, DoctorProfile.experience,
+                            DoctorProfile.contact).join(User, User.id == DoctorProfile.user_id).filter(
+        DoctorProfile.specialty == specialty
+    ).order_by(DoctorProfile.experience.desc(), User.username)
+    return [{
+        'name': row.username,
+        'specialty': row.specialty,
+        'experience': row.experience,
+        'contact': row.contact,
+        'email': row.email
+    } for row in rows]
+
+def invalidate_doctor_directory(*specialties):
+    doctor_directory.invalidate('specialties', *(('specialty', s) for s in specialties if s))
+
 @app.route('/find_doctor', methods=['GET', 'POST'])
 def find_doctor():
-    doctor_data = {
-        'Cardiologist': {
-            'name': 'Dr. A. Sharma',
-            'specialty': 'Cardiologist',
-            'experience': 10,
-            'contact': '9876543210',
-            'email': 'asharma@medtrack.com'
-        },
-        'Neurologist': {
-            'name': 'Dr. R. Mehta',
-            'specialty': 'Neurologist',
-            'experience': 8,
-            'contact': '8765432109',
-            'email': 'rmehta@medtrack.com'
-        },
-        'Dermatologist': {
-            'name': 'Dr. K. Patel',
-            'specialty': 'Dermatologist',
-            'experience': 7,
-            'contact': '9876234560',
-            'email': 'kpatel@medtrack.com'
-        },
-        'Pediatrician': {
-            'name': 'Dr. S. Verma',
-            'specialty': 'Pediatrician',
-            'experience': 12,
-            'contact': '9811122334',
-            'email': 'sverma@medtrack.com'
-        },
-        'Gynecologist': {
-            'name': 'Dr. R. Joshi',
-            'specialty': 'Gynecologist',
-            'experience': 15,
-            'contact': '9822233445',
-            'email': 'rjoshi@medtrack.com'
-        },
-        'Orthopedic': {
-            'name': 'Dr. M. Singh',
-            'specialty': 'Orthopedic',
-            'experience': 9,
-            'contact': '9833344556',
-            'email': 'msingh@medtrack.com'
-        },
-        'General Physician': {
-            'name': 'Dr. L. Nair',
-            'specialty': 'General Physician',
-            'experience': 5,
-            'contact': '9844455667',
-            'email': 'lnair@medtrack.com'
-        },
-        'ENT Specialist': {
-            'name': 'Dr. V. Reddy',
-            'specialty': 'ENT Specialist',
-            'experience': 11,
-            'contact': '9855566778',
-            'email': 'vreddy@medtrack.com'
-        },
-        'Psychiatrist': {
-            'name': 'Dr. A. Khan',
-            'specialty': 'Psychiatrist',
-            'experience': 6,
-            'contact': '9866677889',
-            'email': 'akhan@medtrack.com'
-        },
-        'Dentist': {
-            'name': 'Dr. P. Desai',
-            'specialty': 'Dentist',
-            'experience': 4,
-            'contact': '9877788990',
-            'email': 'pdesai@medtrack.com'
-        },
-        'Urologist': {
-            'name': 'Dr. R. Kapoor',
-            'specialty': 'Urologist',
-            'experience': 10,
-            'contact': '9888899001',
-            'email': 'rkapoor@medtrack.com'
-        },
-        'Oncologist': {
-            'name': 'Dr. T. Iyer',
-            'specialty': 'Oncologist',
-            'experience': 14,
-            'contact': '9899900112',
-            'email': 'tiyer@medtrack.com'
-        },
-        'Gastroenterologist': {
-            'name': 'Dr. D. Mukherjee',
-            'specialty': 'Gastroenterologist',
-            'experience': 13,
-            'contact': '9900011223',
-            'email': 'dmukherjee@medtrack.com'
-        },
-        'Nephrologist': {
-            'name': 'Dr. S. Rao',
-            'specialty': 'Nephrologist',
-            'experience': 11,
-            'contact': '9911122334',
-            'email': 'srao@medtrack.com'
-        },
-        'Rheumatologist': {
-            'name': 'Dr. B. Das',
-            'specialty': 'Rheumatologist',
-            'experience': 9,
-            'contact': '9922233445',
-            'email': 'bdas@medtrack.com'
-        }
-    }
-
-    doctor = None
+    specialties = doctor_directory.get_or_load('specialties', load_specialties)
+    selected = request.values.get('specialty')
+    page = max(1, request.args.get('page', 1, type=int))
+
+    doctors, has_next = [], False
+    if selected:
+        ranked = doctor_directory.get_or_load(('specialty', selected), lambda: load_specialty_doctors(selected))
+        offset = (page - 1) * DOCTORS_PER_PAGE
+        doctors = ranked[offset:offset + DOCTORS_PER_PAGE]
+        has_next = len(ranked) > offset + DOCTORS_PER_PAGE
+
+    return render_template('find_doctor.html', specialties=specialties, selected=selected, doctors=doctors,
+                           page=page, has_next=has_next)
+
+@app.route('/doctor_profile', methods=['GET', 'POST'])
+def doctor_profile():
+    if 'role' not in session or session['role'] != 'doctor':
+        return redirect('/login')
+    doctor_id = current_user_id()
+    profile = DoctorProfile.query.filter_by(user_id=doctor_id).first()
+
     if request.method == 'POST':
-        selected = request.form.get('specialty')
-        doctor = doctor_data.get(selected)
+        specialty = request.form.get('specialty', '').strip()
+        experience = request.form.get('experience', 0, type=int)
+        if not specialty or not 0 <= experience <= 80:
+            flash("Please enter your specialty and years of experience.", "danger")
+            return redirect(url_for('doctor_profile'))
+        old_specialty = profile.specialty if profile else None
+        if profile is None:
+            profile = DoctorProfile(user_id=doctor_id)
+            db.session.add(profile)
+        profile.specialty = specialty
+        profile.experience = experience
+        profile.contact = request.form.get('contact', '').strip()
+        db.session.commit()
+        invalidate_doctor_directory(old_specialty, specialty)
+        flash("Profile saved.", "success")
+        return redirect(url_for('doctor_profile'))
+
+    return render_template('doctor_profile.html', profile=profile,
+                           specialties=doctor_directory.get_or_load('specialties', load_specialties))
+
+@app.route('/metrics')
+def metrics():
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response("unauthorized\n", status=401, mimetype='text/plain')
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# JSON API for the mobile client; see api.py. Patients only ever see their own rows,
+# doctors see every patient's records (narrowed with ?patient=) and their own appointments
+def scope_patients(query, role, username):
+    query = query.filter(User.role == 'patient')
+    return query.filter(User.username == username) if role == 'patient' else query
+
+def patient_records_scope(model, doctor_column=None):
+    def scope(query, role, username):
+        if role == 'patient':
+            return query.filter(model.patient_username == username)
+        if role != 'doctor':
+            return None
+        if doctor_column is not None:
+            query = query.filter(doctor_column == username)
+        patient = request.args.get('patient')
+        return query.filter(model.patient_username == patient) if patient else query
+    return scope
+
+api = JSONAPI(read_session)
+api.resource('patients', User, ['id', 'username', 'email'], scope_patients)
+api.resource('appointments', Appointment,
+             ['id', 'patient_username', 'doctor_username', 'date', 'time', 'starts_at', 'reason', 'status'],
+             patient_records_scope(Appointment, Appointment.doctor_username))
+api.resource('medicines', Medicine, ['id', 'patient_username', 'name', 'dosage', 'time'],
+             patient_records_scope(Medicine))
+api.resource('diagnoses', Diagnosis, ['id', 'patient_username', 'doctor_username', 'diagnosis_text'],
+             patient_records_scope(Diagnosis))
+api.resource('reports', Report, ['id', 'patient_username', 'filename', 'sha256', 'size', 'mime_type'],
+             patient_records_scope(Report))
+app.register_blueprint(api.blueprint)
 
-    return render_template('find_doctor.html', doctor=doctor)
 def send_email(to, subject, body):
-    import smtplib
-    from email.message import EmailMessage
-
-    msg = EmailMessage()
-    msg.set_content(body)
-    msg['Subject'] = subject
-    msg['From'] = "meenakumarimindi@gmail.com"  # Replace with your email
-    msg['To'] = to
-
-    # Use your real email and app password below
-    with smtplib.SMTP_SSL('smtp.gmail.com', 465) as smtp:
-        smtp.login("meenakumarimindi@gmail.com", "Meena@l7")
-        smtp.send_message(msg)
+    # Only queue the message here; the outbox dispatcher delivers it in the background.
+    # The caller commits, so the email is stored atomically with the change that caused it.
+    db.session.add(EmailOutbox(recipient=to, subject=subject, body=body))
+
+outbox_dispatcher = None
+
+def start_background_workers():
+    global outbox_dispatcher
+    with app.app_context():
+        engine = db.engine
+    outbox_dispatcher = OutboxDispatcher(
+        engine, EmailOutbox.__table__, SMTPSettings.from_config(app.config),
+        workers=app.config['OUTBOX_WORKERS'], on_sent=request_metrics.observe_email)
+    outbox_dispatcher.start()
+
+@app.cli.command('rebuild-status-counts')
+def rebuild_status_counts_command():
+    """Recompute doctor_status_count from the appointment table."""
+    DoctorStatusCount.query.delete()
+    db.session.add_all(DoctorStatusCount(doctor_username=doctor, status=status, count=count)
+                       for doctor, status, count in count_appointments_by_status())
+    db.session.commit()
+    print(f"Rebuilt {DoctorStatusCount.query.count()} counters.")
+
+@app.cli.command('generate-thumbnails')
+def generate_thumbnails_command():
+    """Render previews for stored reports that don't have one yet."""
+    from thumbnails import render_thumbnail
+    rendered = 0
+    for report in Report.query.filter(Report.sha256.isnot(None)).yield_per(500):
+        blob_path = blob_store.path_for(report.sha256)
+        if os.path.exists(blob_path) and not os.path.exists(thumbnail_path(blob_path)):
+            rendered += bool(render_thumbnail(blob_path, report.mime_type))
+    print(f"Rendered {rendered} previews.")
+
+@app.cli.command('rebuild-reminders')
+@click.option('--batch-size', default=5000, show_default=True)
+def rebuild_reminders_command(batch_size):
+    """Reschedule every medicine's reminders from its time, e.g. after a bulk import."""
+    medicines = Medicine.__table__
+    now = datetime.now()
+    last_id = scheduled = 0
+    while True:
+        with db.engine.begin() as conn:
+            rows = conn.execute(
+                db.select(medicines.c.id, medicines.c.patient_id, medicines.c.time)
+                .where(medicines.c.id > last_id).order_by(medicines.c.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            scheduled += reminder_store.schedule(conn, rows, now)
+        last_id = rows[-1].id
+    print(f"Scheduled reminders for {scheduled} medicines.")
+
+def reminder_channel():
+    channel = app.config['REMINDER_CHANNEL']
+    if channel == 'email':
+        return EmailChannel(EmailOutbox.__table__)
+    if channel == 'webhook':
+        return WebhookChannel(app.config['REMINDER_WEBHOOK_URL'])
+    return LogChannel()
+
+@app.cli.command('reminder-worker')
+def reminder_worker_command():
+    """Send medication reminders as they fall due, until interrupted. Run one of these."""
+    logging.basicConfig(level=logging.INFO)
+    scheduler = ReminderScheduler(db.engine, reminder_store, reminder_channel(),
+                                  batch_size=app.config['REMINDER_BATCH_SIZE'],
+                                  max_lateness=app.config['REMINDER_MAX_LATENESS'])
+    scheduler.start()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        scheduler.stop()
+
+@app.cli.command('outbox-worker')
+def outbox_worker_command():
+    """Deliver queued emails in this process until interrupted."""
+    start_background_workers()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        outbox_dispatcher.stop()
+
+@app.cli.command('db-dry-run')
+@click.option('--url', help="Database to run the upgrade on. Defaults to a scratch copy of the SQLite database.")
+@click.option('--in-place', is_flag=True, help="Upgrade the configured database itself, e.g. a staging copy.")
+def migration_dry_run_command(url, in_place):
+    """Time each pending migration on a copy of the database."""
+    if in_place:
+        timed_upgrade()
+        return
+
+    scratch_dir = None
+    if url is None:
+        source = db.engine.url
+        if not is_sqlite_file(source):
+            raise click.UsageError("Pass --url with a scratch copy of the database to time the upgrade on.")
+        scratch_dir = tempfile.mkdtemp(prefix='medtrack-dry-run-')
+        copy_path = os.path.join(scratch_dir, 'medtrack.db')
+        # the backup API takes a consistent copy even while the app is writing
+        with sqlite3.connect(source.database) as src, sqlite3.connect(copy_path) as dst:
+            src.backup(dst)
+        url = 'sqlite:///' + copy_path
+
+    # run the upgrade in a process of its own, so the app's engines all point at the copy
+    env = {k: v for k, v in os.environ.items() if k != 'DATABASE_REPLICA_URL'}
+    env['DATABASE_URL'] = url
+    try:
+        result = subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'db-dry-run', '--in-place'],
+                                cwd=app.root_path, env=env)
+    finally:
+        if scratch_dir is not None:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+    if result.returncode != 0:
+        raise click.ClickException("The upgrade failed on the copy; see above.")
+
+def timed_upgrade():
+    """flask db upgrade, printing how long each revision took."""
+    timings = []
+    started = [time.perf_counter()]
+
+    def record(ctx, step, heads, run_args):
+        now = time.perf_counter()
+        timings.append((step.up_revision_id, step.up_revision.doc, now - started[0]))
+        started[0] = now
+
+    configure_args = app.extensions['migrate'].configure_args
+    configure_args['on_version_apply'] = record
+    try:
+        upgrade()
+    finally:
+        del configure_args['on_version_apply']
+        if timings:
+            print(f"{len(timings)} migrations:")
+            for revision, doc, elapsed in timings:
+                print(f"  {revision}  {elapsed:8.2f}s  {doc}")
+            print(f"Total {sum(elapsed for _, _, elapsed in timings):.2f}s")
+        else:
+            print("Nothing to do: the database is up to date.")
+
+@app.cli.group('medtrack')
+def medtrack_cli():
+    """Bulk data tools."""
+
+def bulk_loader(batch_size=None, hash_workers=None):
+    return BulkLoader(db.engine, {
+        'users': User.__table__,
+        'medicine': Medicine.__table__,
+        'appointment': Appointment.__table__,
+        'doctor_patient': DoctorPatient.__table__,
+        'doctor_status_count': DoctorStatusCount.__table__,
+    }, parse_slot, reminder_store, batch_size=batch_size, hash_workers=hash_workers,
+        password_method=app.config['PASSWORD_HASH_METHOD'])
+
+@medtrack_cli.command('import')
+@click.argument('kind', type=click.Choice(BULK_KINDS))
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(BULK_FORMATS), help="Defaults to jsonl for .jsonl files, else csv.")
+@click.option('--batch-size', type=int, help="Rows per transaction (default BULK_BATCH_SIZE or 1000).")
+@click.option('--hash-workers', type=int, help="Password hashing processes (default one per CPU).")
+def import_command(kind, path, fmt, batch_size, hash_workers):
+    """Import users, medicines or appointments from a CSV or JSON Lines file ('-' for stdin)."""
+    def after_batch(rows):
+        # the memory backend only lives in the web workers; the SQLite one is shared with them
+        dashboard_cache.bump(*(row.get(column) for row in rows for column in ('patient_username', 'doctor_username')))
+
+    inserted, rejected = bulk_loader(batch_size, hash_workers).import_file(
+        kind, path, fmt, after_batch=None if kind == 'users' else after_batch)
+    print(f"Imported {inserted} {kind}, rejected {rejected}.", file=sys.stderr)
+
+@medtrack_cli.command('export')
+@click.argument('kind', type=click.Choice(BULK_KINDS))
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(BULK_FORMATS), help="Defaults to jsonl for .jsonl files, else csv.")
+@click.option('--password-hashes', is_flag=True, help="Include users' password hashes, so they can log in after an import.")
+def export_command(kind, path, fmt, password_hashes):
+    """Export users, medicines or appointments to a CSV or JSON Lines file ('-' for stdout)."""
+    count = bulk_loader().export_file(kind, path, fmt, password_hashes=password_hashes)
+    print(f"Exported {count} {kind}.", file=sys.stderr)
+
+@medtrack_cli.command('seed')
+@click.option('--patients', default=1000, show_default=True)
+@click.option('--doctors', default=50, show_default=True)
+@click.option('--appointments', default=20000, show_default=True, help="Total, spread over the doctors.")
+@click.option('--medicines-per-patient', default=3.0, show_default=True, help="Mean prescriptions per patient.")
+@click.option('--seed', default=0, show_default=True, help="The same seed gives the same data.")
+@click.option('--today', type=click.DateTime(['%Y-%m-%d']),
+              help="Date the history runs up to (default now); fix it to reproduce a data set exactly.")
+@click.option('--password', default='medtrack', show_default=True, help="Password of every seeded user.")
+@click.option('--batch-size', default=20000, show_default=True, help="Rows per transaction.")
+def seed_command(patients, doctors, appointments, medicines_per_patient, seed, today, password, batch_size):
+    """Fill the database with deterministic fake doctors, patients and their history.
+
+    Secondary indexes are dropped while the rows go in, so don't seed a database that is being used.
+    """
+    seeder = Seeder(db.engine, {
+        'users': User.__table__,
+        'doctor_profile': DoctorProfile.__table__,
+        'appointment': Appointment.__table__,
+        'diagnosis': Diagnosis.__table__,
+        'medicine': Medicine.__table__,
+        'medication_reminder': MedicationReminder.__table__,
+        'doctor_patient': DoctorPatient.__table__,
+        'doctor_status_count': DoctorStatusCount.__table__,
+    }, DEFAULT_SCHEDULE, generate_password_hash(password, app.config['PASSWORD_HASH_METHOD']),
+        batch_size=batch_size)
+    try:
+        inserted = seeder.run(patients, doctors, appointments, seed, today or datetime.now(),
+                              medicines_per_patient=medicines_per_patient)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    for table, count in sorted(inserted.items()):
+        print(f"  {table:22} {count}", file=sys.stderr)
+
+@medtrack_cli.command('demo-doctors')
+def demo_doctors_command():
+    """Add the demo doctor directory: 15 doctor accounts with profiles, for development databases."""
+    added = 0
+    for name, specialty, experience, contact, email in DEMO_DOCTORS:
+        user = User.query.filter_by(email=email).first()
+        if user is None:
+            # a random password: nobody can log in as them until one is set, but patients can book
+            user = User(username=name, email=email, password=generate_password_hash(
+                secrets.token_urlsafe(32), app.config['PASSWORD_HASH_METHOD']), role='doctor')
+            db.session.add(user)
+            db.session.flush()
+        if DoctorProfile.query.filter_by(user_id=user.id).first() is None:
+            db.session.add(DoctorProfile(user_id=user.id, specialty=specialty, experience=experience, contact=contact))
+            added += 1
+    db.session.commit()
+    invalidate_doctor_directory(*{specialty for _, specialty, _, _, _ in DEMO_DOCTORS})
+    print(f"Added {added} demo doctors.", file=sys.stderr)
+
+def unversioned_database():
+    """True if the database has tables but no Alembic revision, like one made by the old db.create_all()."""
+    tables = set(db.inspect(db.engine).get_table_names())
+    if 'alembic_version' in tables:
+        return db.session.execute(db.text('SELECT count(*) FROM alembic_version')).scalar() == 0
+    return bool(tables)
+
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
-    app.run(debug=True)
\ No newline at end of file
+        if unversioned_database():
+            # upgrading would try to create the tables again; which revision the schema matches
+            # depends on which of the old migrate_*.py scripts were run, so ask rather than guess
+            sys.exit(f"{db.engine.url.render_as_string(hide_password=True)} has tables but no migration history. Stamp it with "
+                     "the revision its schema matches, then start the app again:\n\n"
+                     "    flask db stamp 5d0c3b1e7a90   # made by the original db.create_all()\n\n"
+                     "or `flask db stamp head` if every migrate_*.py script was run. See migrations/README.")
+        upgrade()
+    # The debug reloader runs this block in a watcher process and a serving child;
+    # only the child should deliver email
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_workers()
+    app.run(debug=True)
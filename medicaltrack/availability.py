@@ -0,0 +1,132 @@
+"""Free appointment slots per doctor, answered from memory.
+
+A doctor's week is a list of working blocks per weekday, each with its own
+slot length; breaks are simply the gaps between blocks. Booked appointment
+start times are kept per doctor in a sorted list of minute offsets, so
+checking a candidate slot is one bisect, plus a look at the booking just
+before it: a booking lasts one slot of the block it starts in, so an
+off-grid one (say a legacy 09:15 booking) also takes the slot it runs into. Bookings are loaded from the
+database the first time a doctor is asked about (and again after ttl seconds,
+to pick up bookings made by other processes) and patched in place when this
+process commits an appointment change.
+
+Times are naive local clinic time, like Appointment.starts_at.
+"""
+import bisect
+import threading
+import time
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_WEEKDAY = EPOCH.weekday()
+MINUTES_PER_DAY = 24 * 60
+
+# (weekday, start, end, slot minutes) used for doctors who haven't set a schedule:
+# Monday to Friday, 09:00-13:00 and 14:00-17:00 in 30 minute slots
+DEFAULT_SCHEDULE = [
+    (weekday, start, end, 30)
+    for weekday in range(5)
+    for start, end in (('09:00', '13:00'), ('14:00', '17:00'))
+]
+
+
+def to_minutes(value):
+    return int((value - EPOCH).total_seconds() // 60)
+
+
+def clock_minutes(text):
+    hours, minutes = text.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+class DoctorAvailability:
+    def __init__(self, blocks, booked):
+        # weekday -> [(start minute of day, end minute of day, slot minutes)]
+        self.blocks = {}
+        for weekday, start, end, slot_minutes in blocks:
+            self.blocks.setdefault(weekday, []).append((clock_minutes(start), clock_minutes(end), slot_minutes))
+        for day_blocks in self.blocks.values():
+            day_blocks.sort()
+        self.booked = sorted(to_minutes(starts_at) for starts_at in booked)
+        self.loaded_at = time.monotonic()
+
+    def is_free(self, start, length):
+        # free if no booking starts inside [start, start + length) and the one before has ended
+        i = bisect.bisect_left(self.booked, start)
+        if i < len(self.booked) and self.booked[i] < start + length:
+            return False
+        return i == 0 or self.booked[i - 1] + self.booking_length(self.booked[i - 1], length) <= start
+
+    def booking_length(self, minute, default):
+        """Slot length of the block a booking at minute starts in, or default outside the working week."""
+        day, minute_of_day = divmod(minute, MINUTES_PER_DAY)
+        for block_start, block_end, slot_minutes in self.blocks.get((day + EPOCH_WEEKDAY) % 7, ()):
+            if block_start <= minute_of_day < block_end:
+                return slot_minutes
+        return default
+
+    def free_slots(self, first_day, last_day, not_before):
+        slots = []
+        earliest = to_minutes(not_before)
+        day = first_day
+        while day <= last_day:
+            day_start = to_minutes(datetime(day.year, day.month, day.day))
+            for block_start, block_end, slot_minutes in self.blocks.get(day.weekday(), ()):
+                for minute in range(block_start, block_end - slot_minutes + 1, slot_minutes):
+                    start = day_start + minute
+                    if start >= earliest and self.is_free(start, slot_minutes):
+                        slots.append(EPOCH + timedelta(minutes=start))
+            day += timedelta(days=1)
+        return slots
+
+    def add(self, starts_at):
+        bisect.insort(self.booked, to_minutes(starts_at))
+
+    def remove(self, starts_at):
+        minute = to_minutes(starts_at)
+        i = bisect.bisect_left(self.booked, minute)
+        if i < len(self.booked) and self.booked[i] == minute:
+            del self.booked[i]
+
+
+class AvailabilityService:
+    def __init__(self, load_schedule, load_bookings, ttl=60):
+        """load_schedule(doctor_id) returns (weekday, 'HH:MM', 'HH:MM', slot minutes) rows or an empty list;
+        load_bookings(doctor_id, since) returns start datetimes of active appointments from since on."""
+        self.load_schedule = load_schedule
+        self.load_bookings = load_bookings
+        self.ttl = ttl
+        self._doctors = {}
+        self._lock = threading.Lock()
+
+    def _get(self, doctor_id):
+        with self._lock:
+            availability = self._doctors.get(doctor_id)
+        if availability is None or time.monotonic() - availability.loaded_at > self.ttl:
+            since = datetime.now() - timedelta(days=1)
+            availability = DoctorAvailability(self.load_schedule(doctor_id) or DEFAULT_SCHEDULE,
+                                              self.load_bookings(doctor_id, since))
+            with self._lock:
+                self._doctors[doctor_id] = availability
+        return availability
+
+    def free_slots(self, doctor_id, first_day, last_day, now=None):
+        availability = self._get(doctor_id)
+        with self._lock:
+            return availability.free_slots(first_day, last_day, now or datetime.now())
+
+    def apply(self, changes):
+        """Patch loaded doctors with committed ('add' | 'remove', doctor_id, starts_at) changes."""
+        with self._lock:
+            for action, doctor_id, starts_at in changes:
+                availability = self._doctors.get(doctor_id)
+                if availability is None or starts_at is None:
+                    continue
+                if action == 'add':
+                    availability.add(starts_at)
+                else:
+                    availability.remove(starts_at)
+
+    def invalidate(self, doctor_id):
+        with self._lock:
+            self._doctors.pop(doctor_id, None)
@@ -0,0 +1,152 @@
+"""Concurrency stress test for book_appointment.
+
+Spawns --processes worker processes with --threads threads each. Every thread
+logs in as its own patient and books random slots from a deliberately small
+pool, so most requests race for a slot someone else is booking at the same
+moment. Afterwards the database is checked for double-booked active slots and
+the booking throughput is printed. Exits non-zero if any slot was booked twice.
+
+    python benchmarks/bench_booking_concurrency.py --processes 4 --threads 8
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(db_path):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+    sys.path.insert(0, APP_DIR)
+    import app as medtrack
+    return medtrack
+
+
+def setup(db_path, doctors, patients):
+    medtrack = load_app(db_path)
+    with medtrack.app.app_context():
+        medtrack.db.create_all()
+        medtrack.db.session.add_all(
+            [medtrack.User(username=f'doctor{i}', email=f'doctor{i}@example.com', password='x', role='doctor')
+             for i in range(doctors)]
+            + [medtrack.User(username=f'patient{i}', email=f'patient{i}@example.com', password='x', role='patient')
+               for i in range(patients)]
+        )
+        medtrack.db.session.commit()
+
+
+def book_loop(medtrack, patient_index, args, seed, counts, lock):
+    rng = random.Random(seed)
+    client = medtrack.app.test_client()
+    with client.session_transaction() as sess:
+        sess['username'] = f'patient{patient_index}'
+        sess['user_id'] = args.doctors + patient_index + 1
+        sess['role'] = 'patient'
+    local = {'booked': 0, 'taken': 0, 'errors': 0}
+    for _ in range(args.requests):
+        response = client.post('/book_appointment', data={
+            'doctor_username': f'doctor{rng.randrange(args.doctors)}',
+            'date': f'2030-01-{rng.randint(1, args.days):02d}',
+            'time': f'{rng.randint(9, 8 + args.slots_per_day):02d}:00',
+            'reason': 'stress test',
+        })
+        if response.status_code == 302 and response.location.endswith('/patient_dashboard'):
+            local['booked'] += 1
+        elif response.status_code == 302 and response.location.endswith('/book_appointment'):
+            local['taken'] += 1
+        else:
+            local['errors'] += 1
+    with lock:
+        for key, value in local.items():
+            counts[key] += value
+
+
+def worker(db_path, worker_id, args, ready, go, queue):
+    medtrack = load_app(db_path)
+    # lock timeouts are counted as errors below; keep their tracebacks out of the report
+    medtrack.app.logger.disabled = True
+    counts = {'booked': 0, 'taken': 0, 'errors': 0}
+    lock = threading.Lock()
+    threads = []
+    for t in range(args.threads):
+        patient_index = worker_id * args.threads + t
+        threads.append(threading.Thread(
+            target=book_loop,
+            args=(medtrack, patient_index, args, args.seed * 1000 + worker_id * args.threads + t, counts, lock),
+        ))
+    # importing the app is slow; only start the clock once every worker is loaded
+    ready.put(worker_id)
+    go.wait()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    queue.put(counts)
+
+
+def count_double_bookings(db_path):
+    medtrack = load_app(db_path)
+    with medtrack.app.app_context():
+        rows = medtrack.db.session.execute(medtrack.db.text(f"""
+            SELECT doctor_username, date, time, COUNT(*)
+            FROM appointment
+            WHERE {medtrack.ACTIVE_SLOT_CLAUSE}
+            GROUP BY doctor_username, date, time
+            HAVING COUNT(*) > 1
+        """)).fetchall()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=50, help='bookings attempted per thread')
+    parser.add_argument('--doctors', type=int, default=3)
+    parser.add_argument('--days', type=int, default=5)
+    parser.add_argument('--slots-per-day', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'stress.db')
+        ctx = multiprocessing.get_context('spawn')
+        setup_process = ctx.Process(target=setup, args=(db_path, args.doctors, args.processes * args.threads))
+        setup_process.start()
+        setup_process.join()
+
+        ready, go, queue = ctx.Queue(), ctx.Event(), ctx.Queue()
+        processes = [ctx.Process(target=worker, args=(db_path, i, args, ready, go, queue))
+                     for i in range(args.processes)]
+        for process in processes:
+            process.start()
+        for _ in processes:
+            ready.get()
+        start = time.perf_counter()
+        go.set()
+        results = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+        totals = {key: sum(result[key] for result in results) for key in results[0]}
+        attempts = sum(totals.values())
+        duplicates = count_double_bookings(db_path)
+
+    capacity = args.doctors * args.days * args.slots_per_day
+    print(f"{args.processes} processes x {args.threads} threads, {attempts} booking attempts on {capacity} slots")
+    print(f"booked={totals['booked']} already_taken={totals['taken']} errors={totals['errors']}")
+    print(f"throughput: {attempts / elapsed:.0f} requests/s over {elapsed:.2f}s")
+    print(f"double-booked slots: {len(duplicates)}")
+    for row in duplicates:
+        print("  ", tuple(row))
+    sys.exit(1 if duplicates or totals['booked'] > capacity else 0)
+
+
+if __name__ == '__main__':
+    main()
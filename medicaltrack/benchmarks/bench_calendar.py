@@ -0,0 +1,106 @@
+"""Calendar range queries over a large appointment table.
+
+Seeds --rows appointments into a scratch database through the app's own
+schema and times "appointments for doctor X in the next day / 7 days" three
+ways: loading all of the doctor's appointments and filtering in Python (what
+the string date/time columns forced on callers), a string range over the
+(doctor_username, date, time) index, and appointments_between() on the
+(doctor_id, starts_at) index.
+
+    python benchmarks/bench_calendar.py --rows 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATUSES = ['Pending', 'Accepted', 'Rejected', 'Upcoming', 'Completed']
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--doctors', type=int, default=100)
+    parser.add_argument('--days', type=int, default=730, help='spread appointments over this many days')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    first_day = datetime(2025, 1, 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        sys.path.insert(0, APP_DIR)
+        import app as medtrack
+
+        app, db, Appointment = medtrack.app, medtrack.db, medtrack.Appointment
+        with app.app_context():
+            db.create_all()
+            db.session.execute(medtrack.User.__table__.insert(), [
+                {'username': f'doctor{i}', 'email': f'doctor{i}@example.com', 'password': 'x', 'role': 'doctor'}
+                for i in range(args.doctors)
+            ])
+            start = time.perf_counter()
+            batch = []
+            taken = set()
+            for i in range(args.rows):
+                # redraw slots that are already booked, so the unique active-slot index never trips
+                while True:
+                    doctor = rng.randrange(args.doctors)
+                    starts_at = first_day + timedelta(days=rng.randrange(args.days), minutes=rng.randrange(48) * 15)
+                    if (doctor, starts_at) not in taken:
+                        taken.add((doctor, starts_at))
+                        break
+                batch.append({
+                    'patient_username': f'patient{i}', 'doctor_username': f'doctor{doctor}', 'doctor_id': doctor + 1,
+                    'date': starts_at.strftime('%Y-%m-%d'), 'time': starts_at.strftime('%H:%M'),
+                    'starts_at': starts_at, 'reason': 'checkup', 'status': rng.choice(STATUSES),
+                })
+                if len(batch) == 50_000:
+                    db.session.execute(Appointment.__table__.insert(), batch)
+                    batch = []
+            if batch:
+                db.session.execute(Appointment.__table__.insert(), batch)
+            db.session.commit()
+            print(f"Seeded {args.rows} appointments in {time.perf_counter() - start:.1f}s")
+
+            doctor = rng.randrange(args.doctors)
+            day = first_day + timedelta(days=args.days // 2)
+            results = []
+            for label, span in (('1 day', 1), ('7 days', 7)):
+                end = day + timedelta(days=span)
+
+                def python_filter():
+                    return [a for a in Appointment.query.filter_by(doctor_username=f'doctor{doctor}').all()
+                            if day <= datetime.strptime(f'{a.date} {a.time}', '%Y-%m-%d %H:%M') < end]
+
+                def string_range():
+                    return Appointment.query.filter(
+                        Appointment.doctor_username == f'doctor{doctor}',
+                        Appointment.date >= day.strftime('%Y-%m-%d'),
+                        Appointment.date < end.strftime('%Y-%m-%d')
+                    ).order_by(Appointment.date, Appointment.time).all()
+
+                results.append((f'{label}: load all + filter', *timed(python_filter, max(1, args.repeat // 10))))
+                results.append((f'{label}: date string range', *timed(string_range, args.repeat)))
+                results.append((f'{label}: starts_at range',
+                                *timed(lambda: medtrack.appointments_between(doctor + 1, day, end), args.repeat)))
+
+    print(f"\n{'query':<32}{'ms':>10}{'rows':>8}")
+    for name, ms, rows in results:
+        print(f"{name:<32}{ms:>10.2f}{rows:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Before/after latency of the hot dashboard queries on a seeded SQLite database.
+
+Seeds the pre-migration schema (revision a21b427114f5) with --rows appointments
+(plus a quarter as many medicines, diagnoses and reports), times the queries
+behind doctor_appointments, patient_dashboard and view_patient_history, upgrades
+to revision 8e4f2a6c1b37 (user id foreign keys and indexes) and times them again.
+
+    python benchmarks/bench_indexes.py --rows 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA_REVISION = 'a21b427114f5'
+INDEX_REVISION = '8e4f2a6c1b37'
+
+STATUSES = ['Pending', 'Accepted', 'Rejected', 'Upcoming', 'Completed']
+
+QUERIES = {
+    'doctor_appointments': ("SELECT * FROM appointment WHERE doctor_username = ?", 'doctor'),
+    'doctor_upcoming': ("SELECT * FROM appointment WHERE doctor_username = ? AND status = 'Upcoming'", 'doctor'),
+    'slot_check': ("SELECT id FROM appointment WHERE doctor_username = ? AND date = '2025-01-01' AND time = '09:00'",
+                   'doctor'),
+    'patient_dashboard': ("SELECT * FROM appointment WHERE patient_username = ?", 'patient'),
+    'patient_medicines': ("SELECT * FROM medicine WHERE patient_username = ?", 'patient'),
+    'patient_history': ("SELECT * FROM diagnosis WHERE patient_username = ?", 'patient'),
+    'patient_reports': ("SELECT * FROM report WHERE patient_username = ?", 'patient'),
+}
+
+
+def upgrade(db_path, revision):
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'db', 'upgrade', revision], cwd=APP_DIR,
+                   env={**os.environ, 'DATABASE_URL': 'sqlite:///' + db_path}, check=True, capture_output=True)
+
+
+def seed(conn, rows, doctors, patients, rng):
+    conn.executemany(
+        "INSERT INTO users (username, email, password, role) VALUES (?, ?, 'x', ?)",
+        [(f'doctor{i}', f'doctor{i}@example.com', 'doctor') for i in range(doctors)]
+        + [(f'patient{i}', f'patient{i}@example.com', 'patient') for i in range(patients)],
+    )
+    conn.executemany(
+        "INSERT INTO appointment (patient_username, doctor_username, date, time, reason, status) "
+        "VALUES (?, ?, ?, ?, 'checkup', ?)",
+        ((f'patient{rng.randrange(patients)}', f'doctor{rng.randrange(doctors)}',
+          f'2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}', f'{rng.randint(8, 17):02d}:00',
+          rng.choice(STATUSES)) for _ in range(rows)),
+    )
+    side = rows // 4
+    conn.executemany(
+        "INSERT INTO medicine (patient_username, name, dosage, time) VALUES (?, 'Paracetamol', '500mg', 'morning')",
+        ((f'patient{rng.randrange(patients)}',) for _ in range(side)),
+    )
+    conn.executemany(
+        "INSERT INTO diagnosis (doctor_username, patient_username, diagnosis_text) VALUES (?, ?, 'Seasonal flu')",
+        ((f'doctor{rng.randrange(doctors)}', f'patient{rng.randrange(patients)}') for _ in range(side)),
+    )
+    conn.executemany(
+        "INSERT INTO report (patient_username, filename) VALUES (?, 'scan.pdf')",
+        ((f'patient{rng.randrange(patients)}',) for _ in range(side)),
+    )
+    conn.commit()
+
+
+def time_queries(conn, doctors, patients, repeat, rng):
+    results = {}
+    for name, (sql, kind) in QUERIES.items():
+        population = doctors if kind == 'doctor' else patients
+        start = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, (f'{kind}{rng.randrange(population)}',)).fetchall()
+        results[name] = (time.perf_counter() - start) / repeat * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--doctors', type=int, default=200)
+    parser.add_argument('--patients', type=int, default=50_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        upgrade(db_path, SCHEMA_REVISION)
+        conn = sqlite3.connect(db_path)
+        start = time.perf_counter()
+        seed(conn, args.rows, args.doctors, args.patients, rng)
+        print(f"Seeded {args.rows} appointments in {time.perf_counter() - start:.1f}s")
+
+        before = time_queries(conn, args.doctors, args.patients, args.repeat, rng)
+        start = time.perf_counter()
+        upgrade(db_path, INDEX_REVISION)
+        print(f"Migration took {time.perf_counter() - start:.1f}s")
+        conn.execute("ANALYZE")
+        after = time_queries(conn, args.doctors, args.patients, args.repeat, rng)
+        conn.close()
+
+    print(f"\n{'query':<22}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for name in QUERIES:
+        print(f"{name:<22}{before[name]:>12.2f}{after[name]:>12.2f}{before[name] / after[name]:>9.0f}x")
+
+
+if __name__ == '__main__':
+    main()
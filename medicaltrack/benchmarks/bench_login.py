@@ -0,0 +1,111 @@
+"""Logins per second per core for each password hashing policy.
+
+For each --methods entry, every seeded user's password is hashed with that
+method and --threads clients post /login as fast as they can for --duration
+seconds, backing off briefly after a 503. Logins go through a PasswordHasher
+with --workers threads and a --queue slot queue, like the app's. Rate limits are off. Meanwhile one more client keeps
+fetching /aboutus, to show how responsive the rest of the site stays while
+logins are saturating the hashing pool. Prints per method:
+
+- successful logins per second, and per core
+- how many logins got a 503 because the hashing queue was full
+- p50/p95 /aboutus latency during the run
+
+    python benchmarks/bench_login.py --methods scrypt,scrypt:16384:8:1,pbkdf2:sha256:600000 --threads 16
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--methods', default='scrypt,scrypt:16384:8:1,pbkdf2:sha256:600000')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8, help="concurrent login clients")
+    parser.add_argument('--workers', type=int, help="hashing threads (default one per core)")
+    parser.add_argument('--queue', type=int, help="hashes allowed to wait (default four per worker)")
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(DATABASE_URL='sqlite:///' + os.path.join(tmp, 'login.db'),
+                          LOGIN_IP_PER_MINUTE='0', LOGIN_ACCOUNT_PER_MINUTE='0')
+        sys.path.insert(0, APP_DIR)
+        import app as medtrack
+        from passwords import PasswordHasher
+
+        medtrack.app.config['TESTING'] = True
+        with medtrack.app.app_context():
+            medtrack.db.create_all()
+            with medtrack.db.engine.begin() as conn:
+                conn.execute(medtrack.User.__table__.insert(), [
+                    {'username': f'user{i}', 'email': f'user{i}@example.com', 'password': '', 'role': 'patient'}
+                    for i in range(args.users)])
+
+        print(f"{cores} cores, {args.threads} clients")
+        print(f"{'method':26} {'logins/s':>9} {'per core':>9} {'503s':>6} {'page p50':>9} {'page p95':>9}")
+        for method in args.methods.split(','):
+            hasher = PasswordHasher(method, workers=args.workers or cores, max_queued=args.queue)
+            password_hash = hasher.hash('password')
+            with medtrack.app.app_context(), medtrack.db.engine.begin() as conn:
+                conn.execute(medtrack.User.__table__.update().values(password=password_hash))
+            medtrack.password_hasher = hasher
+
+            counts = {'ok': 0, 'busy': 0, 'other': 0}
+            page_latency = []
+            lock = threading.Lock()
+            deadline = time.monotonic() + args.duration
+
+            def login_client(i):
+                client = medtrack.app.test_client()
+                n = i
+                while time.monotonic() < deadline:
+                    response = client.post('/login', data={'email': f'user{n % args.users}@example.com',
+                                                           'password': 'password'})
+                    outcome = {302: 'ok', 503: 'busy'}.get(response.status_code, 'other')
+                    with lock:
+                        counts[outcome] += 1
+                    if outcome == 'busy':
+                        time.sleep(0.2)  # back off a little, rather than spin on the full queue
+                    n += args.threads
+
+            def page_client():
+                client = medtrack.app.test_client()
+                while time.monotonic() < deadline:
+                    started = time.perf_counter()
+                    client.get('/aboutus')
+                    page_latency.append(time.perf_counter() - started)
+                    time.sleep(0.05)
+
+            threads = [threading.Thread(target=login_client, args=(i,)) for i in range(args.threads)]
+            threads.append(threading.Thread(target=page_client))
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            hasher.shutdown()
+
+            rate = counts['ok'] / elapsed
+            print(f"{method:26} {rate:9.1f} {rate / cores:9.1f} {counts['busy']:6d} "
+                  f"{statistics.median(page_latency) * 1000:7.1f}ms {percentile(page_latency, 0.95) * 1000:7.1f}ms")
+            if counts['other']:
+                print(f"  {counts['other']} logins failed unexpectedly")
+
+
+if __name__ == '__main__':
+    main()
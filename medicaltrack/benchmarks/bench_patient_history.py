@@ -0,0 +1,120 @@
+"""Query counts and timings for loading a patient's history.
+
+Seeds a temporary database with one patient who has --entries medicines,
+diagnoses, appointments and reports, then loads the history the old way (one
+query per table) and through history_service, both whole and a page at a
+time. Every history_service load must be exactly one SQL statement; the
+script exits non-zero if one isn't.
+
+    python benchmarks/bench_patient_history.py --entries 2000 --repeat 50
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import event
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self.on_execute)
+
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def seed(medtrack, entries):
+    db = medtrack.db
+    db.create_all()
+    db.session.add_all([
+        medtrack.User(username='patient', email='patient@example.com', password='x', role='patient'),
+        medtrack.User(username='doctor', email='doctor@example.com', password='x', role='doctor'),
+    ])
+    db.session.flush()
+    for i in range(entries):
+        db.session.add_all([
+            medtrack.Medicine(patient_username='patient', patient_id=1, name=f'medicine {i}', dosage='500mg', time='morning'),
+            medtrack.Diagnosis(patient_username='patient', patient_id=1, doctor_username='doctor', doctor_id=2,
+                               diagnosis_text=f'diagnosis {i}'),
+            medtrack.Appointment(patient_username='patient', patient_id=1, doctor_username='doctor', doctor_id=2,
+                                 date='2024-01-01', time=f'{i // 60 % 24:02d}:{i % 60:02d}', reason='checkup',
+                                 status='Completed'),
+            medtrack.Report(patient_username='patient', patient_id=1, filename=f'report{i}.pdf', size=1024,
+                            mime_type='application/pdf'),
+        ])
+    db.session.commit()
+
+
+def per_table(medtrack):
+    session = medtrack.db.session
+    return [session.query(model).filter_by(patient_username='patient').all()
+            for model in (medtrack.Medicine, medtrack.Diagnosis, medtrack.Report, medtrack.Appointment)]
+
+
+def measure(label, counter, load, repeat):
+    counter.count = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        load()
+    elapsed = (time.perf_counter() - start) / repeat
+    statements = counter.count / repeat
+    print(f"{label:>28}: {elapsed * 1000:8.2f} ms  {statements:5.1f} statements per load")
+    return statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=2000, help="rows per section")
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp, 'history.db')
+        sys.path.insert(0, APP_DIR)
+        import app as medtrack
+
+        failures = []
+        with medtrack.app.app_context():
+            seed(medtrack, args.entries)
+            counter = StatementCounter(medtrack.db.engine)
+            service, session = medtrack.history_service, medtrack.db.session
+
+            measure('one query per table', counter, lambda: per_table(medtrack), args.repeat)
+            if measure('history_service, whole', counter,
+                       lambda: service.load(session, 'patient'), args.repeat) != 1:
+                failures.append('whole history')
+            if measure(f'history_service, page of {args.page_size}', counter,
+                       lambda: service.load(session, 'patient', limit=args.page_size), args.repeat) != 1:
+                failures.append('first page')
+
+            # walk every page: one statement each, and every row exactly once
+            counter.count = 0
+            seen = {name: 0 for name in ('medicines', 'diagnoses', 'reports', 'appointments')}
+            cursor, pages = None, 0
+            while True:
+                history = service.load(session, 'patient', cursor, args.page_size)
+                pages += 1
+                for name in seen:
+                    seen[name] += len(getattr(history, name))
+                cursor = history.next_cursor
+                if cursor is None:
+                    break
+            print(f"{'paging through':>28}: {pages} pages, {counter.count} statements")
+            if counter.count != pages:
+                failures.append('paging')
+            if any(count != args.entries for count in seen.values()):
+                failures.append(f'paging returned {seen}')
+
+    if failures:
+        print("FAILED: " + ", ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
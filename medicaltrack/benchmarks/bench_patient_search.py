@@ -0,0 +1,81 @@
+"""Doctor dashboard patient list timings with a large patient table.
+
+Seeds --patients patients into a scratch database and compares loading and
+rendering every patient (the old dashboard) against the first keyset page, a
+page deep into the list and a prefix search.
+
+    python benchmarks/bench_patient_search.py --patients 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        sys.path.insert(0, APP_DIR)
+        import app as medtrack
+        from flask import render_template
+
+        app, db, User = medtrack.app, medtrack.db, medtrack.User
+        with app.app_context():
+            db.create_all()
+            db.session.execute(User.__table__.insert(), [
+                {'username': f'Patient {i:07d}', 'email': f'patient{i}@example.com', 'password': 'x', 'role': 'patient'}
+                for i in range(args.patients)
+            ])
+            db.session.commit()
+
+            deep_cursor = None
+            for _ in range(int(args.patients * 0.9) // medtrack.PATIENTS_PER_PAGE):
+                deep_cursor = medtrack.search_patients(cursor=deep_cursor)[1]
+
+            with app.test_request_context():
+                def render_all():
+                    patients = User.query.filter_by(role='patient').all()
+                    return render_template('doctor_dashboard.html', username='bench', patients=patients, q='',
+                                           next_cursor=None)
+
+                def render_page():
+                    patients, next_cursor = medtrack.search_patients()
+                    return render_template('doctor_dashboard.html', username='bench', patients=patients, q='',
+                                           next_cursor=next_cursor)
+
+                results = [
+                    ('all patients, query + render (old)', *timed(render_all, max(1, args.repeat // 5))),
+                    ('first page, query + render', *timed(render_page, args.repeat)),
+                    ('first page, query only', *timed(lambda: medtrack.search_patients()[0], args.repeat)),
+                    ('page at 90%, query only', *timed(lambda: medtrack.search_patients(cursor=deep_cursor)[0],
+                                                        args.repeat)),
+                    ("search 'patient 00123'", *timed(lambda: medtrack.search_patients('patient 00123')[0],
+                                                      args.repeat)),
+                    ("search 'patient1234'", *timed(lambda: medtrack.search_patients('patient1234')[0],
+                                                    args.repeat)),
+                ]
+
+    print(f"{args.patients} patients\n")
+    print(f"{'case':<38}{'ms':>10}{'size':>14}")
+    for name, ms, result in results:
+        size = f'{len(result) // 1024} KiB' if isinstance(result, str) else f'{len(result)} rows'
+        print(f"{name:<38}{ms:>10.2f}{size:>14}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Reminder scheduling and dispatch at scale.
+
+Fills a temporary database with --prescriptions medicines whose times are
+drawn from typical free-text schedules and schedules them all, the way
+`flask rebuild-reminders` does. Then it runs ReminderScheduler over
+--hours of simulated time with a channel that only counts, and prints:
+
+- the scheduling rate
+- reminders dispatched per second of wall time
+- how long each refill query took
+- the largest the in-memory heap got
+
+The heap only ever holds the lookahead window, not the whole table.
+
+    python benchmarks/bench_reminders.py --prescriptions 1000000 --hours 2
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TIMES = ['morning', 'morning and night', 'twice daily', '1-0-1', '8am, 2pm, 8pm', 'every 6 hours',
+         'TDS', 'bedtime', '9:30 pm', 'after food']
+
+
+class CountingChannel:
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, conn, reminders):
+        self.sent += len(reminders)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--prescriptions', type=int, default=200000)
+    parser.add_argument('--patients', type=int, default=20000)
+    parser.add_argument('--hours', type=float, default=2)
+    parser.add_argument('--tick', type=float, default=10, help="simulated seconds between scheduler runs")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp, 'reminders.db')
+        sys.path.insert(0, APP_DIR)
+        import app as medtrack
+        from reminders import ReminderScheduler
+
+        with medtrack.app.app_context():
+            db = medtrack.db
+            db.create_all()
+            with db.engine.begin() as conn:
+                conn.execute(medtrack.User.__table__.insert(), [
+                    {'username': f'patient{i}', 'email': f'patient{i}@example.com', 'password': 'x', 'role': 'patient'}
+                    for i in range(args.patients)])
+                for start in range(0, args.prescriptions, 10000):
+                    conn.execute(medtrack.Medicine.__table__.insert(), [
+                        {'patient_username': f'patient{i % args.patients}', 'patient_id': i % args.patients + 1,
+                         'name': 'paracetamol', 'dosage': '500mg', 'time': rng.choice(TIMES)}
+                        for i in range(start, min(start + 10000, args.prescriptions))])
+
+            started = time.perf_counter()
+            medicines = medtrack.Medicine.__table__
+            now = datetime(2026, 1, 1, 7, 0)
+            scheduled = 0
+            with db.engine.begin() as conn:
+                rows = conn.execute(db.select(medicines.c.id, medicines.c.patient_id, medicines.c.time)).all()
+                for start in range(0, len(rows), 5000):
+                    scheduled += medtrack.reminder_store.schedule(conn, rows[start:start + 5000], now)
+            elapsed = time.perf_counter() - started
+            print(f"scheduled {scheduled} of {args.prescriptions} prescriptions in {elapsed:.1f}s "
+                  f"({scheduled / elapsed:.0f}/s)")
+
+            clock = [now]
+            channel = CountingChannel()
+            scheduler = ReminderScheduler(db.engine, medtrack.reminder_store, channel, clock=lambda: clock[0])
+            refills, refill_time, max_heap = 0, 0.0, 0
+            original_refill = scheduler.refill
+
+            def timed_refill(moment):
+                nonlocal refills, refill_time
+                refill_started = time.perf_counter()
+                original_refill(moment)
+                refill_time += time.perf_counter() - refill_started
+                refills += 1
+            scheduler.refill = timed_refill
+
+            started = time.perf_counter()
+            end = now + timedelta(hours=args.hours)
+            while clock[0] < end:
+                while scheduler.run_once():
+                    max_heap = max(max_heap, len(scheduler._heap))
+                max_heap = max(max_heap, len(scheduler._heap))
+                clock[0] += timedelta(seconds=args.tick)
+            elapsed = time.perf_counter() - started
+            print(f"dispatched {channel.sent} reminders over {args.hours:g} simulated hours in {elapsed:.1f}s "
+                  f"({channel.sent / elapsed:.0f}/s)")
+            print(f"{refills} refills, {refill_time / max(refills, 1) * 1000:.1f} ms each; largest heap {max_heap}")
+
+
+if __name__ == '__main__':
+    main()
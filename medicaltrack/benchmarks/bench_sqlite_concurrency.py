@@ -0,0 +1,136 @@
+"""Multi-process read/write load test for the SQLite settings in database.py.
+
+Runs the same workload twice on a fresh database: first with DB_TUNING=off
+(SQLite's rollback journal, full sync and SQLAlchemy's default pool) and then
+with the tuned settings. Each of --processes worker processes runs --threads
+threads that read a patient's medicines and appointments, the queries behind
+the patient dashboard, and with probability --write-ratio add a medicine
+instead. Throughput and "database is locked" errors are printed per mode.
+
+    python benchmarks/bench_sqlite_concurrency.py --processes 4 --threads 4 --seconds 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(db_path, tuning):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+    os.environ['DB_TUNING'] = tuning
+    sys.path.insert(0, APP_DIR)
+    import app as medtrack
+    return medtrack
+
+
+def setup(db_path, tuning, patients):
+    medtrack = load_app(db_path, tuning)
+    with medtrack.app.app_context():
+        medtrack.db.create_all()
+        medtrack.db.session.add_all(
+            [medtrack.User(username=f'patient{i}', email=f'patient{i}@example.com', password='x', role='patient')
+             for i in range(patients)]
+        )
+        medtrack.db.session.add_all(
+            [medtrack.Medicine(patient_username=f'patient{i % patients}', patient_id=i % patients + 1,
+                               name='paracetamol', dosage='500mg', time='morning')
+             for i in range(patients * 20)]
+        )
+        medtrack.db.session.commit()
+
+
+def run_thread(medtrack, args, seed, deadline, counts, lock):
+    rng = random.Random(seed)
+    local = {'reads': 0, 'writes': 0, 'locked': 0, 'errors': 0}
+    while time.perf_counter() < deadline:
+        patient = rng.randrange(args.patients)
+        with medtrack.app.app_context():
+            try:
+                if rng.random() < args.write_ratio:
+                    medtrack.db.session.add(medtrack.Medicine(
+                        patient_username=f'patient{patient}', patient_id=patient + 1,
+                        name='ibuprofen', dosage='200mg', time='night'))
+                    medtrack.db.session.commit()
+                    local['writes'] += 1
+                else:
+                    medtrack.Medicine.query.filter_by(patient_username=f'patient{patient}').all()
+                    medtrack.Appointment.query.filter_by(patient_username=f'patient{patient}').all()
+                    local['reads'] += 1
+            except OperationalError as e:
+                medtrack.db.session.rollback()
+                local['locked' if 'locked' in str(e) else 'errors'] += 1
+    with lock:
+        for key, value in local.items():
+            counts[key] += value
+
+
+def worker(db_path, tuning, worker_id, args, ready, go, queue):
+    medtrack = load_app(db_path, tuning)
+    counts = {'reads': 0, 'writes': 0, 'locked': 0, 'errors': 0}
+    lock = threading.Lock()
+    ready.put(worker_id)
+    time.sleep(max(0, go.get() - time.time()))
+    deadline = time.perf_counter() + args.seconds
+    threads = [threading.Thread(target=run_thread, args=(medtrack, args, args.seed * 1000 + worker_id * 100 + t,
+                                                         deadline, counts, lock))
+               for t in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    queue.put(counts)
+
+
+def run(tuning, args):
+    ctx = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'load.db')
+        setup_process = ctx.Process(target=setup, args=(db_path, tuning, args.patients))
+        setup_process.start()
+        setup_process.join()
+
+        ready, go, queue = ctx.Queue(), ctx.Queue(), ctx.Queue()
+        processes = [ctx.Process(target=worker, args=(db_path, tuning, i, args, ready, go, queue))
+                     for i in range(args.processes)]
+        for process in processes:
+            process.start()
+        for _ in processes:
+            ready.get()
+        # perf_counter isn't shared between processes, so hand out a wall-clock start instead
+        start = time.time() + 0.5
+        for _ in processes:
+            go.put(start)
+        results = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+    return {key: sum(result[key] for result in results) for key in results[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{args.processes} processes x {args.threads} threads for {args.seconds:g}s, "
+          f"{args.write_ratio:.0%} writes")
+    for label, tuning in (('default', 'off'), ('tuned', 'on')):
+        totals = run(tuning, args)
+        print(f"{label:>8}: {totals['reads'] / args.seconds:8.0f} reads/s {totals['writes'] / args.seconds:8.0f} writes/s"
+              f"   locked={totals['locked']} other errors={totals['errors']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+"""Load test of the core user journeys against the real app over HTTP.
+
+Seeds a fresh database with a synthetic clinic (--doctors, --patients and,
+per patient, appointments, medicines, diagnoses and reports), starts the app
+with `flask run --with-threads` on a free local port, and has --users virtual
+users repeat the full journey for --duration seconds:
+
+    patient: signup -> login -> dashboard -> book an appointment
+    doctor:  login -> dashboard -> find the booking -> solve it
+             -> download the patient's report (polling until the PDF is ready)
+
+Each virtual user drives both sides with its own cookie jars. Every request is
+timed, and the p50/p95/p99 latency, throughput and errors per route go to
+--output as JSON (stdout by default). Runs with the same --seed book the same
+doctors and slots. Pass --baseline with an earlier result to print how p95
+moved per route:
+
+    python benchmarks/load_test.py --users 8 --duration 60 --output after.json --baseline before.json
+"""
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, timedelta
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'loadtest'
+SLOT_TIMES = [f'{hour:02d}:{minute:02d}' for hour in range(9, 17) for minute in (0, 30)]
+
+
+def seed(args):
+    """Fill the database named by DATABASE_URL; returns the doctors' usernames."""
+    sys.path.insert(0, APP_DIR)
+    import app as medtrack
+    from werkzeug.security import generate_password_hash
+
+    rng = random.Random(args.seed)
+    password = generate_password_hash(PASSWORD)
+    first_day = date.today() + timedelta(days=1)
+    with medtrack.app.app_context():
+        db = medtrack.db
+        db.create_all()
+        doctors = [f'loaddoctor{i}' for i in range(args.doctors)]
+        patients = [f'loadpatient{i}' for i in range(args.patients)]
+        with db.engine.begin() as conn:
+            conn.execute(medtrack.User.__table__.insert(), [
+                {'username': name, 'email': f'{name}@loadtest.example', 'password': password, 'role': role}
+                for names, role in ((doctors, 'doctor'), (patients, 'patient')) for name in names])
+            ids = dict(conn.execute(db.select(medtrack.User.username, medtrack.User.id)).all())
+
+            appointments, taken = [], set()
+            for patient in patients:
+                for _ in range(args.appointments):
+                    doctor = rng.choice(doctors)
+                    day = first_day + timedelta(days=rng.randrange(60))
+                    slot = rng.choice(SLOT_TIMES)
+                    if (doctor, day, slot) in taken:
+                        continue
+                    taken.add((doctor, day, slot))
+                    starts_at = medtrack.parse_slot(day.isoformat(), slot)
+                    appointments.append({
+                        'patient_username': patient, 'doctor_username': doctor,
+                        'patient_id': ids[patient], 'doctor_id': ids[doctor],
+                        'date': day.isoformat(), 'time': slot, 'starts_at': starts_at,
+                        'reason': 'checkup', 'status': rng.choice(['Upcoming', 'Accepted', 'Completed'])})
+            conn.execute(medtrack.Appointment.__table__.insert(), appointments)
+            conn.execute(medtrack.Medicine.__table__.insert(), [
+                {'patient_username': patient, 'patient_id': ids[patient], 'name': f'medicine {i}',
+                 'dosage': '500mg', 'time': rng.choice(['morning', 'night', 'twice daily'])}
+                for patient in patients for i in range(args.medicines)])
+            conn.execute(medtrack.Diagnosis.__table__.insert(), [
+                {'patient_username': patient, 'patient_id': ids[patient], 'doctor_username': doctor,
+                 'doctor_id': ids[doctor], 'diagnosis_text': f'diagnosis {i}'}
+                for patient in patients
+                for i, doctor in enumerate(rng.sample(doctors, min(args.diagnoses, len(doctors))))])
+            conn.execute(medtrack.Report.__table__.insert(), [
+                {'patient_username': patient, 'patient_id': ids[patient], 'filename': f'report{i}.pdf',
+                 'size': 1024, 'mime_type': 'application/pdf'}
+                for patient in patients for i in range(args.reports)])
+            # what the ORM events would have kept up to date
+            conn.execute(db.text("""
+                INSERT INTO doctor_patient (doctor_id, patient_id)
+                SELECT DISTINCT doctor_id, patient_id FROM appointment
+                UNION SELECT DISTINCT doctor_id, patient_id FROM diagnosis
+            """))
+        medtrack.db.session.add_all(medtrack.DoctorStatusCount(doctor_username=doctor, status=status, count=count)
+                                    for doctor, status, count in medtrack.count_appointments_by_status())
+        medtrack.db.session.commit()
+    return doctors
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(env, port):
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(port), '--with-threads', '--no-reload'],
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise SystemExit("The app didn't start listening within 30s")
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Client:
+    """One browser: a cookie jar, no automatic redirects, every request timed under a route label."""
+
+    def __init__(self, base_url, recorder):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect)
+
+    def request(self, route, path, data=None):
+        body = urllib.parse.urlencode(data).encode('utf-8') if data is not None else None
+        started = time.perf_counter()
+        try:
+            with self.opener.open(self.base_url + path, data=body, timeout=60) as response:
+                status, payload, location = response.status, response.read(), response.headers.get('Location')
+        except urllib.error.HTTPError as e:
+            status, payload, location = e.code, e.read(), e.headers.get('Location')
+        except OSError:
+            status, payload, location = 0, b'', None
+        self.recorder.record(route, time.perf_counter() - started, ok=0 < status < 400)
+        return status, payload, location
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def record(self, route, seconds, ok=True):
+        with self.lock:
+            self.samples.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+
+def journey(base_url, recorder, rng, doctors, user_id, iteration, report_timeout):
+    patient = f'vu{user_id}x{iteration}x{rng.randrange(10 ** 6)}'
+    web = Client(base_url, recorder)
+    web.request('GET /signup', '/signup')
+    web.request('POST /signup', '/signup', {'name': patient, 'email': f'{patient}@loadtest.example',
+                                            'password': PASSWORD, 'role': 'patient'})
+    web.request('POST /login', '/login', {'email': f'{patient}@loadtest.example', 'password': PASSWORD})
+    web.request('GET /patient_dashboard', '/patient_dashboard')
+    web.request('GET /book_appointment', '/book_appointment')
+    doctor = rng.choice(doctors)
+    day = date.today() + timedelta(days=61 + rng.randrange(300))
+    status, _, location = web.request('POST /book_appointment', '/book_appointment', {
+        'doctor_username': doctor, 'date': day.isoformat(), 'time': rng.choice(SLOT_TIMES), 'reason': 'load test'})
+    if not (location or '').endswith('/patient_dashboard'):
+        return False  # slot taken or booking failed
+
+    clinic = Client(base_url, recorder)
+    clinic.request('POST /login (doctor)', '/login', {'email': f'{doctor}@loadtest.example', 'password': PASSWORD})
+    clinic.request('GET /doctor_dashboard', '/doctor_dashboard')
+    clinic.request('GET /doctor_view_appointments', '/doctor_view_appointments')
+    status, payload, _ = clinic.request('GET /api/v1/appointments',
+                                        '/api/v1/appointments?' + urllib.parse.urlencode({'patient': patient, 'fields': 'id'}))
+    appointments = json.loads(payload).get('appointments') if status == 200 else None
+    if not appointments:
+        return False
+    appointment_id = appointments[0]['id']
+    clinic.request('GET /solve_appointment', f'/solve_appointment/{appointment_id}')
+    clinic.request('POST /solve_appointment', f'/solve_appointment/{appointment_id}', {'diagnosis': 'rest and fluids'})
+
+    started = time.perf_counter()
+    status, payload, _ = clinic.request('GET /download_report', f'/download_report/{patient}')
+    deadline = started + report_timeout
+    while not payload.startswith(b'%PDF') and time.perf_counter() < deadline:
+        time.sleep(0.2)
+        status, payload, _ = clinic.request('GET /report_status', f'/report_status/{patient}')
+        if status == 200 and json.loads(payload).get('status') == 'ready':
+            status, payload, _ = clinic.request('GET /download_report (pdf)', f'/download_report/{patient}')
+    if not payload.startswith(b'%PDF'):
+        return False
+    recorder.record('report ready (end to end)', time.perf_counter() - started)
+    return True
+
+
+def virtual_user(base_url, recorder, doctors, user_id, args, deadline, outcomes):
+    rng = random.Random(args.seed * 1000 + user_id)
+    iteration = 0
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            ok = journey(base_url, recorder, rng, doctors, user_id, iteration, args.report_timeout)
+        except Exception:
+            ok = False
+        recorder.record('journey' if ok else 'journey (failed)', time.perf_counter() - started, ok=ok)
+        with recorder.lock:
+            outcomes['completed' if ok else 'failed'] += 1
+        iteration += 1
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    # nearest rank
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def summarize(recorder, elapsed):
+    routes = {}
+    for route, samples in sorted(recorder.samples.items()):
+        samples = sorted(samples)
+        routes[route] = {
+            'count': len(samples),
+            'errors': recorder.errors.get(route, 0),
+            'throughput_rps': round(len(samples) / elapsed, 2),
+            'mean_ms': round(sum(samples) / len(samples) * 1000, 2),
+            'p50_ms': round(percentile(samples, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(samples, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(samples, 0.99) * 1000, 2),
+        }
+    return routes
+
+
+def compare(result, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['routes']
+    print(f"{'route':<36} {'p95 before':>11} {'p95 after':>11} {'change':>8}", file=sys.stderr)
+    for route, stats in result['routes'].items():
+        before = baseline.get(route, {}).get('p95_ms')
+        change = f"{(stats['p95_ms'] - before) / before:+.0%}" if before else 'new'
+        print(f"{route:<36} {before if before is not None else '-':>11} {stats['p95_ms']:>11} {change:>8}",
+              file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--doctors', type=int, default=20)
+    parser.add_argument('--patients', type=int, default=500)
+    parser.add_argument('--appointments', type=int, default=4, help="per patient")
+    parser.add_argument('--medicines', type=int, default=5, help="per patient")
+    parser.add_argument('--diagnoses', type=int, default=3, help="per patient")
+    parser.add_argument('--reports', type=int, default=1, help="per patient")
+    parser.add_argument('--users', type=int, default=8, help="concurrent virtual users")
+    parser.add_argument('--duration', type=float, default=30, help="seconds")
+    parser.add_argument('--report-timeout', type=float, default=30, help="seconds to wait for a PDF")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='-', help="JSON results file, - for stdout")
+    parser.add_argument('--baseline', help="earlier JSON results to compare p95 against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(tmp, 'load.db'),
+                   REPORT_CACHE_FOLDER=os.path.join(tmp, 'report_cache'),
+                   DASHBOARD_CACHE_PATH=os.path.join(tmp, 'dashboard_cache.db'),
+                   # every virtual user logs in from 127.0.0.1, and the doctors log in over and over
+                   LOGIN_IP_PER_MINUTE='0', LOGIN_ACCOUNT_PER_MINUTE='0')
+        env.pop('DATABASE_REPLICA_URL', None)
+        os.environ.update(env)
+        started = time.perf_counter()
+        doctors = seed(args)
+        print(f"seeded in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+        port = free_port()
+        server = start_server(env, port)
+        try:
+            recorder = Recorder()
+            outcomes = {'completed': 0, 'failed': 0}
+            deadline = time.monotonic() + args.duration
+            started = time.perf_counter()
+            threads = [threading.Thread(target=virtual_user, args=(f'http://127.0.0.1:{port}', recorder, doctors, i,
+                                                                   args, deadline, outcomes))
+                       for i in range(args.users)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            server.terminate()
+            server.wait()
+
+    result = {
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'elapsed_s': round(elapsed, 2),
+        'journeys': outcomes,
+        'routes': summarize(recorder, elapsed),
+    }
+    text = json.dumps(result, indent=2)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    if args.baseline:
+        compare(result, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
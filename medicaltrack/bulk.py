@@ -0,0 +1,341 @@
+"""Streaming bulk import and export of users, medicines and appointments.
+
+Used by `flask medtrack import` and `flask medtrack export` to onboard a
+clinic without posting the signup/add_medicine/book_appointment forms row by
+row. Files are CSV (with a header row) or JSON Lines. Both directions are
+generator pipelines that never hold more than a few batches in memory, so
+file size doesn't matter:
+
+    read_records -> batched -> prepare (hash passwords, resolve user ids) -> insert
+
+Each batch goes in as one executemany INSERT in its own transaction. If a
+batch breaks a unique constraint (a username or email that already exists,
+an appointment slot that is already taken), it is retried row by row so the
+good rows still go in and the bad ones are reported as rejected.
+
+Passwords are hashed in a process pool, a couple of batches ahead of the
+inserts. Rows that already carry a password_hash, as exported with
+--password-hashes, are inserted as they are.
+
+Appointment imports also add the doctor_patient links and doctor_status_count
+changes in the same transaction, and medicine imports schedule their
+reminders, since the ORM events that normally do this don't see Core inserts.
+"""
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+
+FORMATS = ('csv', 'jsonl')
+KINDS = ('users', 'medicines', 'appointments')
+TABLE_FOR_KIND = {'users': 'users', 'medicines': 'medicine', 'appointments': 'appointment'}
+BATCH_SIZE = int(os.environ.get('BULK_BATCH_SIZE', 1000))
+HASH_CHUNK = 50  # passwords per pool task
+HASH_LOOKAHEAD = 2  # batches hashed ahead of the one being inserted
+MAX_REPORTED_REJECTS = 20
+
+ROLES = ('patient', 'doctor')
+STATUSES = ('Pending', 'Accepted', 'Rejected', 'Upcoming', 'Completed')
+
+EXPORT_COLUMNS = {
+    'users': ['id', 'username', 'email', 'role'],
+    'medicines': ['id', 'patient_username', 'name', 'dosage', 'time'],
+    'appointments': ['id', 'patient_username', 'doctor_username', 'date', 'time', 'reason', 'status'],
+}
+
+
+class Rejected(ValueError):
+    pass
+
+
+def guess_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def open_text(path, mode):
+    if path == '-':
+        return os.fdopen(os.dup((sys.stdin if mode == 'r' else sys.stdout).fileno()), mode,
+                         encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def read_records(path, fmt):
+    """Yield one dict per record in a CSV or JSON Lines file ('-' for stdin)."""
+    with open_text(path, 'r') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def write_records(records, path, fmt, columns):
+    """Write dicts to a CSV or JSON Lines file ('-' for stdout) as they arrive; returns the count."""
+    count = 0
+    with open_text(path, 'w') as f:
+        if fmt == 'csv':
+            writer = csv.DictWriter(f, columns, lineterminator='\n')
+            writer.writeheader()
+            for record in records:
+                writer.writerow(record)
+                count += 1
+        else:
+            for record in records:
+                f.write(json.dumps(record, separators=(',', ':'), default=str) + '\n')
+                count += 1
+    return count
+
+
+def batched(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def hash_passwords(passwords, method):
+    """Runs in a pool process."""
+    return [generate_password_hash(password, method) for password in passwords]
+
+
+class Progress:
+    """Counts rows and prints rows/sec to stderr every few seconds."""
+
+    def __init__(self, label, every=5.0, stream=None):
+        self.label = label
+        self.every = every
+        self.stream = stream or sys.stderr
+        self.rows = 0
+        self.started = self.last_report = time.perf_counter()
+
+    def add(self, rows):
+        self.rows += rows
+        now = time.perf_counter()
+        if now - self.last_report >= self.every:
+            self.last_report = now
+            self.report(now)
+
+    def report(self, now=None):
+        elapsed = (now or time.perf_counter()) - self.started
+        rate = self.rows / elapsed if elapsed else 0
+        print(f"{self.label}: {self.rows} rows in {elapsed:.1f}s ({rate:.0f} rows/s)", file=self.stream)
+
+
+class BulkLoader:
+    def __init__(self, engine, tables, parse_slot, reminder_store=None, batch_size=None, hash_workers=None,
+                 password_method='scrypt'):
+        """tables maps 'users', 'medicine', 'appointment', 'doctor_patient' and
+        'doctor_status_count' to their Table objects; parse_slot(date, time) is
+        app.parse_slot, so imported appointments are read like booked ones.
+        Imported medicines are scheduled in reminder_store when one is given,
+        and passwords are hashed with the Werkzeug password_method."""
+        self.engine = engine
+        self.tables = tables
+        self.parse_slot = parse_slot
+        self.reminder_store = reminder_store
+        self.batch_size = batch_size or BATCH_SIZE
+        self.hash_workers = hash_workers
+        self.password_method = password_method
+        self.rejected = 0
+
+    # Import
+
+    def import_file(self, kind, path, fmt=None, after_batch=None):
+        """Import records of kind from path; returns (inserted, rejected).
+
+        after_batch(rows) is called with each batch's inserted rows once it has committed.
+        """
+        fmt = guess_format(path, fmt)
+        progress = Progress(f'import {kind}')
+        self.rejected = 0
+        inserted = 0
+        batches = batched(enumerate(read_records(path, fmt), 1), self.batch_size)
+        # spawn, not fork: the CLI process has the app's engine and worker threads
+        pool = ProcessPoolExecutor(self.hash_workers, mp_context=multiprocessing.get_context('spawn')) \
+            if kind == 'users' else None
+        try:
+            if pool is not None:
+                batches = self._hash_ahead(batches, pool)
+            for batch in batches:
+                rows = []
+                for line, record in batch:
+                    try:
+                        rows.append((line, self._prepare(kind, record)))
+                    except Rejected as e:
+                        self._reject(line, e)
+                done = self._insert(kind, self._resolve_users(kind, rows))
+                inserted += len(done)
+                progress.add(len(batch))
+                if after_batch is not None and done:
+                    after_batch(done)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        progress.report()
+        return inserted, self.rejected
+
+    def _hash_ahead(self, batches, pool):
+        """Yield batches with a password_hash added to each record, hashing a few batches ahead in the pool."""
+        pending = deque()
+        for batch in batches:
+            to_hash = [(line, record) for line, record in batch
+                       if not record.get('password_hash') and record.get('password')]
+            futures = [pool.submit(hash_passwords, [record['password'] for _, record in to_hash[i:i + HASH_CHUNK]],
+                                   self.password_method)
+                       for i in range(0, len(to_hash), HASH_CHUNK)]
+            pending.append((batch, to_hash, futures))
+            if len(pending) > HASH_LOOKAHEAD:
+                yield self._collect_hashes(*pending.popleft())
+        while pending:
+            yield self._collect_hashes(*pending.popleft())
+
+    def _collect_hashes(self, batch, to_hash, futures):
+        hashes = [password_hash for future in futures for password_hash in future.result()]
+        for (_, record), password_hash in zip(to_hash, hashes):
+            record['password_hash'] = password_hash
+        return batch
+
+    def _reject(self, line, reason):
+        self.rejected += 1
+        if self.rejected <= MAX_REPORTED_REJECTS:
+            print(f"  record {line} rejected: {reason}", file=sys.stderr)
+
+    def _prepare(self, kind, record):
+        def field(name, required=True):
+            value = record.get(name)
+            if isinstance(value, str):
+                value = value.strip()
+            if required and not value:
+                raise Rejected(f"missing {name}")
+            return value
+
+        if kind == 'users':
+            role = field('role', required=False) or 'patient'
+            if role not in ROLES:
+                raise Rejected(f"unknown role {role!r}")
+            if not record.get('password_hash'):
+                raise Rejected("missing password")
+            return {'username': field('username'), 'email': field('email'),
+                    'password': record['password_hash'], 'role': role}
+        if kind == 'medicines':
+            return {'patient_username': field('patient_username'), 'name': field('name'),
+                    'dosage': field('dosage', required=False), 'time': field('time', required=False)}
+        starts_at = self.parse_slot(field('date'), field('time'))
+        if starts_at is None:
+            raise Rejected("unreadable date or time")
+        status = field('status', required=False) or 'Upcoming'
+        if status not in STATUSES:
+            raise Rejected(f"unknown status {status!r}")
+        # the same canonical spelling book_appointment stores
+        return {'patient_username': field('patient_username'), 'doctor_username': field('doctor_username'),
+                'date': starts_at.strftime('%Y-%m-%d'), 'time': starts_at.strftime('%H:%M'),
+                'starts_at': starts_at, 'reason': field('reason', required=False), 'status': status}
+
+    def _resolve_users(self, kind, rows):
+        """Fill in patient_id/doctor_id with one lookup per batch; rows naming unknown users are rejected."""
+        if kind == 'users' or not rows:
+            return rows
+        roles = {'patient_username': ('patient_id', 'patient')}
+        if kind == 'appointments':
+            roles['doctor_username'] = ('doctor_id', 'doctor')
+        users = self.tables['users']
+        names = {row[column] for _, row in rows for column in roles}
+        with self.engine.connect() as conn:
+            found = {(username, role): user_id for username, role, user_id in conn.execute(
+                select(users.c.username, users.c.role, users.c.id).where(users.c.username.in_(names)))}
+        resolved = []
+        for line, row in rows:
+            missing = [(role, row[column]) for column, (_, role) in roles.items() if (row[column], role) not in found]
+            if missing:
+                self._reject(line, Rejected("no %s named %r" % missing[0]))
+                continue
+            for column, (id_column, role) in roles.items():
+                row[id_column] = found[(row[column], role)]
+            resolved.append((line, row))
+        return resolved
+
+    def _insert(self, kind, rows):
+        """Insert (line, row) pairs in one transaction, or one by one if the batch hits a constraint.
+
+        Returns the rows that were inserted.
+        """
+        if not rows:
+            return []
+        try:
+            with self.engine.begin() as conn:
+                self._write(conn, kind, [row for _, row in rows])
+            return [row for _, row in rows]
+        except IntegrityError:
+            pass
+        inserted = []
+        for line, row in rows:
+            try:
+                with self.engine.begin() as conn:
+                    self._write(conn, kind, [row])
+                inserted.append(row)
+            except IntegrityError as e:
+                self._reject(line, Rejected(f"already exists ({e.orig})"))
+        return inserted
+
+    def _write(self, conn, kind, rows):
+        table = self.tables[TABLE_FOR_KIND[kind]]
+        if kind == 'medicines' and self.reminder_store is not None:
+            ids = conn.execute(table.insert().returning(table.c.id, sort_by_parameter_order=True), rows).scalars()
+            self.reminder_store.schedule(conn, [(medicine_id, row['patient_id'], row['time'])
+                                                for medicine_id, row in zip(ids, rows)], datetime.now())
+            return
+        conn.execute(table.insert(), rows)
+        if kind != 'appointments':
+            return
+        dialect = postgresql if conn.dialect.name == 'postgresql' else sqlite
+        links = {(row['doctor_id'], row['patient_id']) for row in rows}
+        conn.execute(dialect.insert(self.tables['doctor_patient']).on_conflict_do_nothing(),
+                     [{'doctor_id': doctor_id, 'patient_id': patient_id} for doctor_id, patient_id in links])
+        counts = self.tables['doctor_status_count']
+        for (doctor, status), count in Counter((row['doctor_username'], row['status']) for row in rows).items():
+            conn.execute(dialect.insert(counts)
+                         .values(doctor_username=doctor, status=status, count=count)
+                         .on_conflict_do_update(index_elements=[counts.c.doctor_username, counts.c.status],
+                                                set_={'count': counts.c.count + count}))
+
+    # Export
+
+    def export_file(self, kind, path, fmt=None, password_hashes=False):
+        """Stream every record of kind to path; returns the number written."""
+        fmt = guess_format(path, fmt)
+        table = self.tables[TABLE_FOR_KIND[kind]]
+        columns = list(EXPORT_COLUMNS[kind])
+        selected = [table.c[column] for column in columns]
+        if kind == 'users' and password_hashes:
+            columns.append('password_hash')
+            selected.append(table.c.password.label('password_hash'))
+        progress = Progress(f'export {kind}')
+
+        def records(conn):
+            result = conn.execution_options(yield_per=self.batch_size).execute(
+                select(*selected).order_by(table.c.id))
+            for partition in result.partitions():
+                progress.add(len(partition))
+                yield from (dict(row._mapping) for row in partition)
+
+        with self.engine.connect() as conn:
+            count = write_records(records(conn), path, fmt, columns)
+        progress.report()
+        return count
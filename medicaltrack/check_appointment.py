@@ -1,13 +1,9 @@
-import sqlite3
+from app import Appointment, app
 
-conn = sqlite3.connect('medtrack.db')
-cursor = conn.cursor()
+with app.app_context():
+    appointments = Appointment.query.order_by(Appointment.id).all()
 
-cursor.execute("SELECT * FROM appointments")
-rows = cursor.fetchall()
-
-print("📋 Appointments in DB:")
-for row in rows:
-    print(row)
-
-conn.close()
\ No newline at end of file
+    print("📋 Appointments in DB:")
+    for appointment in appointments:
+        print((appointment.id, appointment.patient_username, appointment.doctor_username,
+               appointment.date, appointment.time, appointment.reason, appointment.status))
@@ -1,12 +1,13 @@
-import sqlite3
+from sqlalchemy import text
 
-conn = sqlite3.connect('medtrack.db')
-cursor = conn.cursor()
+from database import create_engine
 
-cursor.execute("SELECT * FROM users")
-rows = cursor.fetchall()
+engine = create_engine()
+
+with engine.connect() as conn:
+    rows = conn.execute(text("SELECT * FROM users")).fetchall()
 
 for row in rows:
-    print(row)
+    print(tuple(row))
 
-conn.close()
+engine.dispose()
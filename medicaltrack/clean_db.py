@@ -1,13 +1,13 @@
 # clean_db.py
 
-import sqlite3
+from app import Appointment, app, db
 
-conn = sqlite3.connect('medtrack.db')
-cursor = conn.cursor()
+with app.app_context():
+    # Delete rows where patient_username is NULL. One by one through the session, so the
+    # flush events keep doctor_status_count in step.
+    orphans = Appointment.query.filter(Appointment.patient_username.is_(None)).all()
+    for appointment in orphans:
+        db.session.delete(appointment)
+    db.session.commit()
 
-# Delete rows where patient_username is NULL
-cursor.execute("DELETE FROM appointments WHERE patient_username IS NULL")
-conn.commit()
-conn.close()
-
-print("✅ Cleaned up appointments with NULL patient_username.")
+print(f"✅ Cleaned up {len(orphans)} appointments with NULL patient_username.")
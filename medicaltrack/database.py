@@ -0,0 +1,108 @@
+"""Connection settings for the app's database.
+
+SQLite is tuned for several worker processes sharing one file:
+
+- journal_mode=WAL lets readers carry on while one connection writes, instead
+  of every write locking the whole file
+- synchronous=NORMAL only fsyncs at WAL checkpoints; a power cut can lose the
+  last few commits but never corrupts the database
+- busy_timeout makes a connection wait for the write lock instead of failing
+  straight away with "database is locked"
+- mmap_size and cache_size keep hot pages in memory across requests
+
+The PRAGMAs run on every new DBAPI connection. Each can be overridden from the
+environment (SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, ...). DB_TUNING=off
+leaves both the PRAGMAs and the pool at their defaults, for comparison.
+
+Pools are per process, so the pool only has to cover the threads of one worker
+(DB_POOL_SIZE, default WEB_THREADS plus the outbox workers). SQLite gets little
+overflow, since extra connections would only queue for the same write lock.
+
+The app and the helper scripts all take their URL from DATABASE_URL (default
+instance/medtrack.db) and build engines through create_engine() here.
+DATABASE_REPLICA_URL optionally names a read replica; see read_session() in
+app.py. Locally a copy of the SQLite file stands in for one.
+"""
+import os
+
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+DEFAULT_DATABASE_URL = 'sqlite:///' + os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'instance', 'medtrack.db')
+
+
+def database_url():
+    return os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL)
+
+
+def replica_url():
+    return os.environ.get('DATABASE_REPLICA_URL') or None
+
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)),  # negative means KiB, so 64 MB
+    'temp_store': 'MEMORY',
+}
+
+
+def tuning_enabled():
+    return os.environ.get('DB_TUNING', 'on') != 'off'
+
+
+def is_sqlite_file(url):
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def engine_options(url, pool_size=5, max_overflow=None, pool_timeout=30):
+    """SQLALCHEMY_ENGINE_OPTIONS for url."""
+    url = make_url(url)
+    if not tuning_enabled():
+        return {}
+    if url.get_backend_name() == 'sqlite':
+        if not is_sqlite_file(url):
+            # in-memory databases live in a single connection; leave SQLAlchemy's pool choice alone
+            return {}
+        return {
+            'pool_size': pool_size,
+            'max_overflow': 2 if max_overflow is None else max_overflow,
+            'pool_timeout': pool_timeout,
+            # Python's sqlite3 busy handler, in seconds; busy_timeout below says the same
+            'connect_args': {'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000, 'check_same_thread': False},
+        }
+    return {
+        'pool_size': pool_size,
+        'max_overflow': 10 if max_overflow is None else max_overflow,
+        'pool_timeout': pool_timeout,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+    }
+
+
+def install_sqlite_pragmas(engine, pragmas=None):
+    """Run the PRAGMAs on each new connection of a SQLite file engine."""
+    if not tuning_enabled() or not is_sqlite_file(engine.url):
+        return
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+
+def create_engine(url=None, **options):
+    """Engine for url (default DATABASE_URL) with the same settings the app uses."""
+    url = url or database_url()
+    engine = sqlalchemy.create_engine(url, **{**engine_options(url), **options})
+    install_sqlite_pragmas(engine)
+    return engine
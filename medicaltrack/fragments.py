@@ -0,0 +1,141 @@
+"""Cached dashboard pages, keyed by user and a per-user data version.
+
+Each user has a version counter. A rendered page is stored under
+(user, page key, version); writes that change what a user's dashboard shows
+call bump(user) after committing, which moves the user to a new version and
+drops their old pages. Pages carry an ETag of their body, so a browser that
+already has the current page gets a 304 without anything being rendered.
+
+MemoryBackend keeps everything in a per-process LRU, so bumps made by one
+process are not seen by another; use SQLiteBackend (a local file shared by
+all processes on the host) when running several workers.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def body_etag(body):
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+class MemoryBackend:
+    def __init__(self, max_entries=2000):
+        self.max_entries = max_entries
+        self._versions = {}
+        self._entries = OrderedDict()  # (user, key) -> (etag, body)
+        self._lock = threading.Lock()
+
+    def version(self, user):
+        with self._lock:
+            return self._versions.get(user, 0)
+
+    def bump(self, user):
+        with self._lock:
+            self._versions[user] = self._versions.get(user, 0) + 1
+            for entry_key in [k for k in self._entries if k[0] == user]:
+                del self._entries[entry_key]
+
+    def get(self, user, key):
+        with self._lock:
+            entry = self._entries.get((user, key))
+            if entry is not None:
+                self._entries.move_to_end((user, key))
+            return entry
+
+    def set(self, user, key, etag, body):
+        with self._lock:
+            self._entries[(user, key)] = (etag, body)
+            self._entries.move_to_end((user, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteBackend:
+    PRUNE_EVERY = 100
+
+    def __init__(self, path, max_entries=20000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._sets = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS fragment_version (user TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS fragment (
+                    user TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    etag TEXT NOT NULL,
+                    body BLOB NOT NULL,
+                    stored_at REAL NOT NULL,
+                    PRIMARY KEY (user, key)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_fragment_stored_at ON fragment (stored_at)")
+
+    def _connect(self):
+        # one connection per thread; WAL lets readers in other processes carry on during writes
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def version(self, user):
+        row = self._connect().execute("SELECT version FROM fragment_version WHERE user = ?", (user,)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, user):
+        with self._connect() as conn:
+            conn.execute("""
+                INSERT INTO fragment_version (user, version) VALUES (?, 1)
+                ON CONFLICT (user) DO UPDATE SET version = version + 1
+            """, (user,))
+            conn.execute("DELETE FROM fragment WHERE user = ?", (user,))
+
+    def get(self, user, key):
+        row = self._connect().execute("SELECT etag, body FROM fragment WHERE user = ? AND key = ?",
+                                      (user, key)).fetchone()
+        return (row[0], bytes(row[1])) if row else None
+
+    def set(self, user, key, etag, body):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO fragment (user, key, etag, body, stored_at) VALUES (?, ?, ?, ?, ?)",
+                         (user, key, etag, body, time.time()))
+            self._sets += 1
+            if self._sets % self.PRUNE_EVERY == 0:
+                # keep the newest max_entries pages
+                conn.execute("""
+                    DELETE FROM fragment WHERE stored_at < (
+                        SELECT stored_at FROM fragment ORDER BY stored_at DESC LIMIT 1 OFFSET ?
+                    )
+                """, (self.max_entries,))
+
+
+class FragmentCache:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def version(self, user):
+        return self.backend.version(user)
+
+    def bump(self, *users):
+        for user in set(filter(None, users)):
+            self.backend.bump(user)
+
+    def get_or_render(self, user, key, render):
+        """Return (etag, body) for the user's current version of key, calling render() on a miss."""
+        version = self.backend.version(user)
+        versioned_key = f'{version}:{key}'
+        entry = self.backend.get(user, versioned_key)
+        if entry is None:
+            body = render().encode('utf-8')
+            entry = (body_etag(body), body)
+            self.backend.set(user, versioned_key, *entry)
+        return entry
@@ -0,0 +1,97 @@
+"""A patient's medicines, diagnoses, reports and appointments in one query.
+
+The four sections are read with a single UNION ALL, one branch per table,
+each branch limited to its own page. Rows come back as plain named tuples, so
+templates can't trigger lazy loads after the fact. Pages are keyset-paginated
+per section by id: the cursor holds the last id seen in each section, or None
+once a section has been read to the end.
+
+The HTML history page, the PDF report and the JSON API all load through
+PatientHistoryService.
+"""
+from collections import namedtuple
+
+from sqlalchemy import String, cast, literal, select, union_all
+
+from pagination import decode_cursor, encode_cursor
+
+MedicineEntry = namedtuple('MedicineEntry', 'id name dosage time')
+DiagnosisEntry = namedtuple('DiagnosisEntry', 'id doctor_username diagnosis_text')
+ReportEntry = namedtuple('ReportEntry', 'id filename sha256 mime_type size')
+AppointmentEntry = namedtuple('AppointmentEntry', 'id doctor_username date time reason status')
+
+# section name -> (entry type, column names after id); order matters, it is the cursor layout
+SECTIONS = {
+    'medicines': (MedicineEntry, ['name', 'dosage', 'time']),
+    'diagnoses': (DiagnosisEntry, ['doctor_username', 'diagnosis_text']),
+    'reports': (ReportEntry, ['filename', 'sha256', 'mime_type', 'size']),
+    'appointments': (AppointmentEntry, ['doctor_username', 'date', 'time', 'reason', 'status']),
+}
+WIDTH = max(len(columns) for _, columns in SECTIONS.values())
+
+
+class PatientHistory:
+    def __init__(self, medicines, diagnoses, reports, appointments, next_cursor=None):
+        self.medicines = medicines
+        self.diagnoses = diagnoses
+        self.reports = reports
+        self.appointments = appointments
+        self.next_cursor = next_cursor
+
+    def to_dict(self):
+        return {
+            name: [entry._asdict() for entry in getattr(self, name)] for name in SECTIONS
+        } | {'next_cursor': self.next_cursor}
+
+
+class PatientHistoryService:
+    def __init__(self, tables):
+        """tables maps each section name to its Table, e.g. {'medicines': Medicine.__table__, ...}."""
+        self.tables = tables
+
+    def _branch(self, index, name, patient_username, after, limit):
+        table = self.tables[name]
+        _, columns = SECTIONS[name]
+        # every branch has the same shape: section index, id, then WIDTH text columns
+        values = [cast(table.c[column], String) for column in columns]
+        values += [cast(literal(None), String)] * (WIDTH - len(values))
+        query = select(literal(index).label('section'), table.c.id,
+                       *(value.label(f'c{i}') for i, value in enumerate(values)))
+        query = query.where(table.c.patient_username == patient_username, table.c.id > after).order_by(table.c.id)
+        if limit is not None:
+            # one extra row tells us whether the section continues on the next page
+            query = query.limit(limit + 1)
+        return query.subquery().select()
+
+    def load(self, session, patient_username, cursor=None, limit=None):
+        """One page of a patient's history; limit=None returns everything."""
+        # None marks a section already finished on an earlier page
+        after = decode_cursor(cursor, [self.tables[name].c.id for name in SECTIONS], nullable=True)
+        if after is None:
+            after = [0] * len(SECTIONS)
+
+        branches = [self._branch(i, name, patient_username, after[i], limit)
+                    for i, name in enumerate(SECTIONS) if after[i] is not None]
+        rows = session.execute(union_all(*branches)).all() if branches else []
+
+        sections = {name: [] for name in SECTIONS}
+        names = list(SECTIONS)
+        for row in rows:
+            name = names[row.section]
+            entry_type, columns = SECTIONS[name]
+            values = [row[2 + i] for i in range(len(columns))]
+            if name == 'reports' and values[3] is not None:
+                values[3] = int(values[3])
+            sections[name].append(entry_type(row.id, *values))
+
+        next_after, more = [], False
+        for i, name in enumerate(names):
+            entries = sorted(sections[name])
+            if limit is not None and len(entries) > limit:
+                entries = entries[:limit]
+                next_after.append(entries[-1].id)
+                more = True
+            else:
+                next_after.append(None)
+            sections[name] = entries
+        return PatientHistory(next_cursor=encode_cursor(next_after) if more else None, **sections)
@@ -0,0 +1,224 @@
+"""Request, SQL, template, PDF and email timings in Prometheus text format.
+
+RequestMetrics hooks into Flask and SQLAlchemy:
+
+- before/after request hooks time each request per endpoint
+- engine before/after_cursor_execute events count the SQL statements a
+  request runs and time them
+- the before_render_template/template_rendered signals time templates
+
+PDF renders, email sends and password hashes report their durations through
+callbacks passed to ReportRenderer, OutboxDispatcher and PasswordHasher.
+Everything is served from /metrics.
+
+Metrics live in the process that records them. With several worker processes,
+each one serves its own /metrics, and Prometheus should scrape each of them.
+Work done in the separate outbox or reminder worker processes isn't seen by the
+web processes.
+
+SLOW_REQUEST_MS turns on the slow-request log: requests slower than that are
+logged to the 'medtrack.slow' logger with their query count and the slowest
+SQL statements they ran.
+"""
+import bisect
+import logging
+import threading
+import time
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SLOW_STATEMENTS_LOGGED = 5
+
+slow_logger = logging.getLogger('medtrack.slow')
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def format_number(value):
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{format_labels(self.labelnames, key)} {format_number(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), series):
+                    cumulative += count
+                    labels = format_labels(self.labelnames, key, [('le', format_number(bound))])
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = format_labels(self.labelnames, key)
+                lines.append(f'{self.name}_sum{labels} {format_number(series[-1])}')
+                lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        return '\n'.join(line for metric in self.metrics for line in metric.render()) + '\n'
+
+
+class RequestMetrics:
+    def __init__(self, registry=None, slow_request_ms=None):
+        self.registry = registry or Registry()
+        self.slow_request_ms = slow_request_ms
+        registry = self.registry
+        self.requests = registry.counter(
+            'medtrack_requests_total', 'Requests handled.', ['endpoint', 'method', 'status'])
+        self.latency = registry.histogram(
+            'medtrack_request_duration_seconds', 'Request latency.', ['endpoint', 'method'])
+        self.queries = registry.histogram(
+            'medtrack_request_sql_queries', 'SQL statements run per request.', ['endpoint'], QUERY_COUNT_BUCKETS)
+        self.sql_time = registry.histogram(
+            'medtrack_request_sql_duration_seconds', 'Time spent in SQL per request.', ['endpoint'])
+        self.templates = registry.histogram(
+            'medtrack_template_render_seconds', 'Template render time.', ['template'])
+        self.pdf = registry.histogram(
+            'medtrack_pdf_render_seconds', 'PDF report render time in the worker pool.')
+        self.email = registry.histogram(
+            'medtrack_email_send_seconds', 'SMTP send time per message.', ['outcome'])
+        self.password_hash = registry.histogram(
+            'medtrack_password_hash_seconds', 'Password hash or check time in the hashing pool.')
+
+    def init_app(self, app, engines):
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        before_render_template.connect(self._start_template, app)
+        template_rendered.connect(self._finish_template, app)
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._start_statement)
+            event.listen(engine, 'after_cursor_execute', self._finish_statement)
+
+    # Requests
+
+    def _start_request(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_sql_time = 0.0
+        g.metrics_statements = [] if self.slow_request_ms is not None else None
+
+    def _finish_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or 'unmatched'
+        self.requests.inc(endpoint=endpoint, method=request.method, status=str(response.status_code))
+        self.latency.observe(elapsed, endpoint=endpoint, method=request.method)
+        self.queries.observe(g.metrics_queries, endpoint=endpoint)
+        self.sql_time.observe(g.metrics_sql_time, endpoint=endpoint)
+        if self.slow_request_ms is not None and elapsed * 1000 >= self.slow_request_ms:
+            self._log_slow(endpoint, elapsed)
+        return response
+
+    def _log_slow(self, endpoint, elapsed):
+        slowest = sorted(g.metrics_statements, key=lambda s: s[0], reverse=True)[:SLOW_STATEMENTS_LOGGED]
+        slow_logger.warning(
+            "%s %s (%s) took %.0f ms: %d queries, %.0f ms in SQL%s",
+            request.method, request.path, endpoint, elapsed * 1000, g.metrics_queries, g.metrics_sql_time * 1000,
+            ''.join(f"\n  {seconds * 1000:7.1f} ms  {' '.join(statement.split())[:500]}"
+                    for seconds, statement in slowest))
+
+    # SQL
+
+    def _start_statement(self, conn, cursor, statement, parameters, context, executemany):
+        # kept on the statement's execution context, so a statement that fails, and never
+        # reaches after_cursor_execute, leaves nothing behind
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    def _finish_statement(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_metrics_started', None)
+        if started is None or not has_request_context() or 'metrics_started' not in g:
+            return
+        elapsed = time.perf_counter() - started
+        g.metrics_queries += 1
+        g.metrics_sql_time += elapsed
+        if g.metrics_statements is not None:
+            g.metrics_statements.append((elapsed, statement))
+
+    # Templates
+
+    def _start_template(self, app, template, context, **extra):
+        g.setdefault('metrics_templates', []).append(time.perf_counter())
+
+    def _finish_template(self, app, template, context, **extra):
+        stack = g.get('metrics_templates')
+        if stack:
+            self.templates.observe(time.perf_counter() - stack.pop(), template=template.name or 'string')
+
+    # Callbacks for the background work
+
+    def observe_pdf(self, seconds):
+        self.pdf.observe(seconds)
+
+    def observe_email(self, seconds, ok):
+        self.email.observe(seconds, outcome='ok' if ok else 'error')
+
+    def observe_password_hash(self, seconds):
+        self.password_hash.observe(seconds)
+
+    def render(self):
+        return self.registry.render()
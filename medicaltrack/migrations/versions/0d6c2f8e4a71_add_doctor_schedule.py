@@ -0,0 +1,35 @@
+"""Add doctor schedule
+
+Revision ID: 0d6c2f8e4a71
+Revises: b85f3e2a0c94
+Create Date: 2026-10-18 09:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0d6c2f8e4a71'
+down_revision = 'b85f3e2a0c94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('doctor_schedule',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('doctor_id', sa.Integer(), nullable=False),
+    sa.Column('weekday', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.String(length=5), nullable=False),
+    sa.Column('end_time', sa.String(length=5), nullable=False),
+    sa.Column('slot_minutes', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['doctor_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_doctor_schedule_doctor_id', 'doctor_schedule', ['doctor_id'])
+
+
+def downgrade():
+    op.drop_index('ix_doctor_schedule_doctor_id', table_name='doctor_schedule')
+    op.drop_table('doctor_schedule')
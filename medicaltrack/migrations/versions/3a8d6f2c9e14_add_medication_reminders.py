@@ -0,0 +1,62 @@
+"""Add medication reminders
+
+Revision ID: 3a8d6f2c9e14
+Revises: 7f1e9b3d5c28
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+import logging
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+from online_migrations import BATCH_SIZE
+from reminders import ReminderStore
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+# revision identifiers, used by Alembic.
+revision = '3a8d6f2c9e14'
+down_revision = '7f1e9b3d5c28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    medication_reminder = op.create_table('medication_reminder',
+    sa.Column('medicine_id', sa.Integer(), nullable=False),
+    sa.Column('patient_id', sa.Integer(), nullable=False),
+    sa.Column('schedule', sa.String(length=100), nullable=False),
+    sa.Column('next_due_at', sa.DateTime(), nullable=False),
+    sa.Column('last_sent_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['medicine_id'], ['medicine.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['patient_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('medicine_id')
+    )
+    op.create_index(op.f('ix_medication_reminder_next_due_at'), 'medication_reminder', ['next_due_at'], unique=False)
+
+    # Schedule the existing medicines a batch at a time; the times are free text, so this has to
+    # happen in Python rather than in one UPDATE
+    medicine = sa.table('medicine', sa.column('id', sa.Integer), sa.column('patient_id', sa.Integer),
+                        sa.column('time', sa.String))
+    store = ReminderStore(medication_reminder, medicine, None)
+    now = datetime.now()
+    last_id = scheduled = 0
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        while True:
+            rows = conn.execute(
+                sa.select(medicine.c.id, medicine.c.patient_id, medicine.c.time)
+                .where(medicine.c.id > last_id).order_by(medicine.c.id).limit(BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+            scheduled += store.schedule(conn, rows, now)
+            last_id = rows[-1].id
+    logger.info("scheduled reminders for %d medicines", scheduled)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_medication_reminder_next_due_at'), table_name='medication_reminder')
+    op.drop_table('medication_reminder')
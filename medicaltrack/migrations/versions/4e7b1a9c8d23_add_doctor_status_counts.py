@@ -0,0 +1,44 @@
+"""Add doctor status counts
+
+Revision ID: 4e7b1a9c8d23
+Revises: 9c2d4b7e1f65
+Create Date: 2026-10-18 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from online_migrations import create_index
+
+
+# revision identifiers, used by Alembic.
+revision = '4e7b1a9c8d23'
+down_revision = '9c2d4b7e1f65'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('doctor_status_count',
+    sa.Column('doctor_username', sa.String(length=100), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('doctor_username', 'status')
+    )
+    op.execute("""
+        INSERT INTO doctor_status_count (doctor_username, status, count)
+        SELECT doctor_username, status, COUNT(*)
+        FROM appointment
+        WHERE doctor_username IS NOT NULL AND status IS NOT NULL
+        GROUP BY doctor_username, status
+    """)
+    # the wider index serves everything the old one did, plus chronological per-status listings
+    create_index('ix_appointment_doctor_status_date_time', 'appointment',
+                 ['doctor_username', 'status', 'date', 'time'])
+    op.drop_index('ix_appointment_doctor_status', table_name='appointment')
+
+
+def downgrade():
+    op.create_index('ix_appointment_doctor_status', 'appointment', ['doctor_username', 'status'])
+    op.drop_index('ix_appointment_doctor_status_date_time', table_name='appointment')
+    op.drop_table('doctor_status_count')
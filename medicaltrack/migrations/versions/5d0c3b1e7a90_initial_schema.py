@@ -0,0 +1,78 @@
+"""Initial schema
+
+Revision ID: 5d0c3b1e7a90
+Revises: 
+Create Date: 2025-07-01 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0c3b1e7a90'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The tables as the app first created them with db.create_all(). Databases made that way
+    # should be stamped with `flask db stamp <revision>` instead of upgraded (see migrations/README).
+    op.create_table('user',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(length=100), nullable=True),
+    sa.Column('password', sa.String(length=100), nullable=True),
+    sa.Column('role', sa.String(length=20), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('username')
+    )
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(length=100), nullable=True),
+    sa.Column('email', sa.String(length=100), nullable=True),
+    sa.Column('password', sa.String(length=100), nullable=True),
+    sa.Column('role', sa.String(length=20), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email'),
+    sa.UniqueConstraint('username')
+    )
+    op.create_table('medicine',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('patient_username', sa.String(length=100), nullable=True),
+    sa.Column('name', sa.String(length=100), nullable=True),
+    sa.Column('dosage', sa.String(length=100), nullable=True),
+    sa.Column('time', sa.String(length=100), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('diagnosis',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('doctor_username', sa.String(length=100), nullable=True),
+    sa.Column('patient_username', sa.String(length=100), nullable=True),
+    sa.Column('diagnosis_text', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('appointment',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('patient_username', sa.String(length=100), nullable=True),
+    sa.Column('doctor_username', sa.String(length=100), nullable=True),
+    sa.Column('date', sa.String(length=20), nullable=True),
+    sa.Column('time', sa.String(length=20), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('report',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('patient_username', sa.String(length=100), nullable=True),
+    sa.Column('filename', sa.String(length=200), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('report')
+    op.drop_table('appointment')
+    op.drop_table('diagnosis')
+    op.drop_table('medicine')
+    op.drop_table('users')
+    op.drop_table('user')
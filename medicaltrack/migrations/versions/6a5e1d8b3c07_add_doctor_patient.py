@@ -0,0 +1,43 @@
+"""Add doctor_patient links
+
+Revision ID: 6a5e1d8b3c07
+Revises: f03e8c5a9d41
+Create Date: 2026-10-18 09:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a5e1d8b3c07'
+down_revision = 'f03e8c5a9d41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('doctor_patient',
+    sa.Column('doctor_id', sa.Integer(), nullable=False),
+    sa.Column('patient_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['doctor_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['patient_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('doctor_id', 'patient_id')
+    )
+    # Everyone a doctor has had an appointment with or written a diagnosis for
+    for table in ('appointment', 'diagnosis'):
+        op.execute(f"""
+            INSERT INTO doctor_patient (doctor_id, patient_id)
+            SELECT DISTINCT doctor.id, patient.id
+            FROM {table}
+            JOIN users AS doctor ON doctor.username = {table}.doctor_username
+            JOIN users AS patient ON patient.username = {table}.patient_username
+            WHERE NOT EXISTS (
+                SELECT 1 FROM doctor_patient
+                WHERE doctor_patient.doctor_id = doctor.id AND doctor_patient.patient_id = patient.id
+            )
+        """)
+
+
+def downgrade():
+    op.drop_table('doctor_patient')
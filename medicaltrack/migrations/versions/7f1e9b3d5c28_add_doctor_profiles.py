@@ -0,0 +1,65 @@
+"""Add doctor profiles
+
+Revision ID: 7f1e9b3d5c28
+Revises: 0d6c2f8e4a71
+Create Date: 2026-10-18 09:45:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7f1e9b3d5c28'
+down_revision = '0d6c2f8e4a71'
+branch_labels = None
+depends_on = None
+
+# The directory find_doctor used to hard-code: (name, specialty, experience, contact, email).
+# Only doctors who already have accounts get a profile here; `flask medtrack demo-doctors` adds the rest.
+DIRECTORY = [
+    ('Dr. A. Sharma', 'Cardiologist', 10, '9876543210', 'asharma@medtrack.com'),
+    ('Dr. R. Mehta', 'Neurologist', 8, '8765432109', 'rmehta@medtrack.com'),
+    ('Dr. K. Patel', 'Dermatologist', 7, '9876234560', 'kpatel@medtrack.com'),
+    ('Dr. S. Verma', 'Pediatrician', 12, '9811122334', 'sverma@medtrack.com'),
+    ('Dr. R. Joshi', 'Gynecologist', 15, '9822233445', 'rjoshi@medtrack.com'),
+    ('Dr. M. Singh', 'Orthopedic', 9, '9833344556', 'msingh@medtrack.com'),
+    ('Dr. L. Nair', 'General Physician', 5, '9844455667', 'lnair@medtrack.com'),
+    ('Dr. V. Reddy', 'ENT Specialist', 11, '9855566778', 'vreddy@medtrack.com'),
+    ('Dr. A. Khan', 'Psychiatrist', 6, '9866677889', 'akhan@medtrack.com'),
+    ('Dr. P. Desai', 'Dentist', 4, '9877788990', 'pdesai@medtrack.com'),
+    ('Dr. R. Kapoor', 'Urologist', 10, '9888899001', 'rkapoor@medtrack.com'),
+    ('Dr. T. Iyer', 'Oncologist', 14, '9899900112', 'tiyer@medtrack.com'),
+    ('Dr. D. Mukherjee', 'Gastroenterologist', 13, '9900011223', 'dmukherjee@medtrack.com'),
+    ('Dr. S. Rao', 'Nephrologist', 11, '9911122334', 'srao@medtrack.com'),
+    ('Dr. B. Das', 'Rheumatologist', 9, '9922233445', 'bdas@medtrack.com'),
+]
+
+
+def upgrade():
+    doctor_profile = op.create_table('doctor_profile',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('specialty', sa.String(length=50), nullable=False),
+    sa.Column('experience', sa.Integer(), nullable=False),
+    sa.Column('contact', sa.String(length=20), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id')
+    )
+    op.create_index('ix_doctor_profile_specialty_experience', 'doctor_profile', ['specialty', 'experience'])
+
+    # Doctors from the old directory who already have an account (matched by email) keep their listing.
+    # Other doctors fill in their profile on /doctor_profile.
+    users = sa.table('users', sa.column('id', sa.Integer), sa.column('email', sa.String), sa.column('role', sa.String))
+    conn = op.get_bind()
+    for name, specialty, experience, contact, email in DIRECTORY:
+        user_id = conn.execute(sa.select(users.c.id).where(users.c.email == email, users.c.role == 'doctor')).scalar()
+        if user_id is not None:
+            conn.execute(doctor_profile.insert().values(
+                user_id=user_id, specialty=specialty, experience=experience, contact=contact))
+
+
+def downgrade():
+    op.drop_index('ix_doctor_profile_specialty_experience', table_name='doctor_profile')
+    op.drop_table('doctor_profile')
@@ -0,0 +1,75 @@
+"""Add user id foreign keys and indexes
+
+Revision ID: 8e4f2a6c1b37
+Revises: a21b427114f5
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from online_migrations import backfill, create_index, is_postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4f2a6c1b37'
+down_revision = 'a21b427114f5'
+branch_labels = None
+depends_on = None
+
+# (table, column) pairs for the integer foreign keys to users.id
+ID_COLUMNS = [
+    ('medicine', 'patient_id'),
+    ('diagnosis', 'doctor_id'),
+    ('diagnosis', 'patient_id'),
+    ('appointment', 'patient_id'),
+    ('appointment', 'doctor_id'),
+    ('report', 'patient_id'),
+]
+
+INDEXES = [
+    ('ix_medicine_patient_username', 'medicine', ['patient_username']),
+    ('ix_medicine_patient_id', 'medicine', ['patient_id']),
+    ('ix_diagnosis_patient_username', 'diagnosis', ['patient_username']),
+    ('ix_diagnosis_doctor_username', 'diagnosis', ['doctor_username']),
+    ('ix_diagnosis_patient_id', 'diagnosis', ['patient_id']),
+    ('ix_diagnosis_doctor_id', 'diagnosis', ['doctor_id']),
+    ('ix_appointment_doctor_date_time', 'appointment', ['doctor_username', 'date', 'time']),
+    ('ix_appointment_doctor_status', 'appointment', ['doctor_username', 'status']),
+    ('ix_appointment_patient_status', 'appointment', ['patient_username', 'status']),
+    ('ix_appointment_patient_id', 'appointment', ['patient_id']),
+    ('ix_appointment_doctor_id', 'appointment', ['doctor_id']),
+    ('ix_report_patient_username', 'report', ['patient_username']),
+    ('ix_report_patient_id', 'report', ['patient_id']),
+]
+
+
+def upgrade():
+    for table, column in ID_COLUMNS:
+        if is_postgresql():
+            op.add_column(table, sa.Column(column, sa.Integer(), sa.ForeignKey('users.id'), nullable=True))
+        else:
+            # SQLite takes the reference inline in ADD COLUMN; Alembic would want batch mode for it,
+            # which copies the whole table
+            op.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER REFERENCES users(id)")
+
+    # backfill before indexing so the UPDATEs don't have to maintain the new indexes.
+    # Rows whose username has no user stay NULL and are skipped by the EXISTS check.
+    for table, column in ID_COLUMNS:
+        name_column = column.replace('_id', '_username')
+        backfill(
+            table,
+            f"{column} = (SELECT users.id FROM users WHERE users.username = {table}.{name_column})",
+            f"{column} IS NULL AND EXISTS (SELECT 1 FROM users WHERE users.username = {table}.{name_column})",
+        )
+
+    for name, table, columns in INDEXES:
+        create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
+    for table, column in reversed(ID_COLUMNS):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column(column)
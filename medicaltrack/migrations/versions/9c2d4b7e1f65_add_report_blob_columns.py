@@ -0,0 +1,33 @@
+"""Add report blob columns
+
+Revision ID: 9c2d4b7e1f65
+Revises: 6a5e1d8b3c07
+Create Date: 2026-10-18 09:25:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from online_migrations import create_index
+
+
+# revision identifiers, used by Alembic.
+revision = '9c2d4b7e1f65'
+down_revision = '6a5e1d8b3c07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('report', sa.Column('sha256', sa.String(length=64), nullable=True))
+    op.add_column('report', sa.Column('size', sa.BigInteger(), nullable=True))
+    op.add_column('report', sa.Column('mime_type', sa.String(length=100), nullable=True))
+    create_index('ix_report_sha256', 'report', ['sha256'])
+
+
+def downgrade():
+    op.drop_index('ix_report_sha256', table_name='report')
+    with op.batch_alter_table('report', schema=None) as batch_op:
+        batch_op.drop_column('mime_type')
+        batch_op.drop_column('size')
+        batch_op.drop_column('sha256')
@@ -1,7 +1,7 @@
 """Add reason column to appointment
 
 Revision ID: a21b427114f5
-Revises: 
+Revises: 5d0c3b1e7a90
 Create Date: 2025-07-03 21:10:00.243247
 
 """
@@ -11,7 +11,7 @@ import sqlalchemy as sa
 
 # revision identifiers, used by Alembic.
 revision = 'a21b427114f5'
-down_revision = None
+down_revision = '5d0c3b1e7a90'
 branch_labels = None
 depends_on = None
 
@@ -0,0 +1,72 @@
+"""Add appointment starts_at
+
+Revision ID: b85f3e2a0c94
+Revises: 4e7b1a9c8d23
+Create Date: 2026-10-18 09:35:00.000000
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+from online_migrations import backfill, create_index, is_postgresql
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+# revision identifiers, used by Alembic.
+revision = 'b85f3e2a0c94'
+down_revision = '4e7b1a9c8d23'
+branch_labels = None
+depends_on = None
+
+
+ACTIVE_SLOT_CLAUSE = "status IN ('Pending', 'Accepted', 'Upcoming')"
+
+
+def upgrade():
+    # Older bookings may have '9:00' for the time, while new ones are always '09:00'. Pad them
+    # first, so the unique active-slot index sees them as the same slot, and so strftime can read them.
+    short_time = r"time ~ '^\d:\d{2}$'" if is_postgresql() else "time GLOB '[0-9]:[0-5][0-9]'"
+    padded = f"CASE WHEN {short_time} THEN '0' || time ELSE time END"
+    duplicates = op.get_bind().execute(sa.text(f"""
+        SELECT doctor_username, date, {padded}, COUNT(*)
+        FROM appointment
+        WHERE {ACTIVE_SLOT_CLAUSE}
+        GROUP BY doctor_username, date, {padded}
+        HAVING COUNT(*) > 1
+    """)).fetchall()
+    if duplicates:
+        rows = '\n'.join(str(tuple(row)) for row in duplicates)
+        raise RuntimeError(f"Resolve these double-booked slots (written with and without a leading zero) "
+                           f"before upgrading:\n{rows}")
+
+    # With no clashes left, padding a row can't break the unique index
+    backfill('appointment', "time = '0' || time", short_time)
+
+    op.add_column('appointment', sa.Column('starts_at', sa.DateTime(), nullable=True))
+
+    # Rows whose date/time can't be read are left NULL and reported below
+    if is_postgresql():
+        backfill('appointment', "starts_at = CAST(date || ' ' || time AS timestamp)",
+                 r"starts_at IS NULL AND date ~ '^\d{4}-\d{2}-\d{2}$' AND time ~ '^\d{2}:\d{2}$'")
+    else:
+        # Same text layout SQLAlchemy uses for DateTime on SQLite, so range comparisons line up
+        slot = "date || ' ' || time"
+        backfill('appointment', f"starts_at = strftime('%Y-%m-%d %H:%M:%S.000000', {slot})",
+                 f"starts_at IS NULL AND strftime('%s', {slot}) IS NOT NULL")
+
+    unreadable = op.get_bind().execute(sa.text(
+        "SELECT id, date, time FROM appointment WHERE starts_at IS NULL ORDER BY id")).fetchall()
+    for row in unreadable[:20]:
+        logger.warning("could not read date/time of appointment %s", tuple(row))
+    if len(unreadable) > 20:
+        logger.warning("... and %d more appointments with an unreadable date/time", len(unreadable) - 20)
+
+    create_index('ix_appointment_doctor_id_starts_at', 'appointment', ['doctor_id', 'starts_at'])
+
+
+def downgrade():
+    op.drop_index('ix_appointment_doctor_id_starts_at', table_name='appointment')
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.drop_column('starts_at')
@@ -0,0 +1,39 @@
+"""Unique active appointment slot
+
+Revision ID: c71d9e03f5a2
+Revises: 8e4f2a6c1b37
+Create Date: 2026-10-18 09:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from online_migrations import create_index
+
+
+# revision identifiers, used by Alembic.
+revision = 'c71d9e03f5a2'
+down_revision = '8e4f2a6c1b37'
+branch_labels = None
+depends_on = None
+
+ACTIVE_SLOT_CLAUSE = "status IN ('Pending', 'Accepted', 'Upcoming')"
+
+
+def upgrade():
+    duplicates = op.get_bind().execute(sa.text(f"""
+        SELECT doctor_username, date, time, COUNT(*)
+        FROM appointment
+        WHERE {ACTIVE_SLOT_CLAUSE}
+        GROUP BY doctor_username, date, time
+        HAVING COUNT(*) > 1
+    """)).fetchall()
+    if duplicates:
+        rows = '\n'.join(str(tuple(row)) for row in duplicates)
+        raise RuntimeError(f"Resolve these double-booked slots before adding the constraint:\n{rows}")
+    create_index('uq_appointment_active_slot', 'appointment', ['doctor_username', 'date', 'time'],
+                 unique=True, where=ACTIVE_SLOT_CLAUSE)
+
+
+def downgrade():
+    op.drop_index('uq_appointment_active_slot', table_name='appointment')
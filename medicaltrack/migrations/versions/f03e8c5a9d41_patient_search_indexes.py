@@ -0,0 +1,28 @@
+"""Patient search indexes
+
+Revision ID: f03e8c5a9d41
+Revises: 2b9a7f4d6e18
+Create Date: 2026-10-18 09:15:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from online_migrations import create_index
+
+
+# revision identifiers, used by Alembic.
+revision = 'f03e8c5a9d41'
+down_revision = '2b9a7f4d6e18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    create_index('ix_users_role_username_lower', 'users', ['role', sa.text('lower(username)')])
+    create_index('ix_users_role_email_lower', 'users', ['role', sa.text('lower(email)')])
+
+
+def downgrade():
+    op.drop_index('ix_users_role_email_lower', table_name='users')
+    op.drop_index('ix_users_role_username_lower', table_name='users')
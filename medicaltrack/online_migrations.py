@@ -0,0 +1,73 @@
+"""Helpers for migrations that touch big tables without locking them for minutes.
+
+backfill() updates rows a batch at a time, committing after each batch and
+pausing briefly so the app's own writes get a turn at the lock. On PostgreSQL,
+create_index() builds with CREATE INDEX CONCURRENTLY. SQLite can't build
+indexes online, but a single index build is still a lot shorter than the
+table-wide UPDATEs it replaces.
+
+Both helpers leave the revision's transaction to run in autocommit, so call
+them after the revision's schema changes. A failed batch leaves the batches
+before it committed. Every backfill has a WHERE clause that skips rows it has
+already done, so rerunning the upgrade picks up where it stopped.
+
+MIGRATION_BATCH_SIZE and MIGRATION_BATCH_PAUSE (seconds) tune the batches.
+"""
+import logging
+import os
+import time
+
+from alembic import op
+from sqlalchemy import text
+
+BATCH_SIZE = int(os.environ.get('MIGRATION_BATCH_SIZE', 5000))
+BATCH_PAUSE = float(os.environ.get('MIGRATION_BATCH_PAUSE', 0.05))
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+
+def is_postgresql():
+    return op.get_bind().dialect.name == 'postgresql'
+
+
+def backfill(table, assignments, where, batch_size=None, pause=None):
+    """UPDATE table SET assignments for rows matching where, batch_size rows per transaction.
+
+    Walks the table once in id order, so each batch is a primary key range
+    scan rather than a search from the start of the table for rows still to do.
+    """
+    batch_size = batch_size or BATCH_SIZE
+    pause = BATCH_PAUSE if pause is None else pause
+    # the last id of the next batch, then the update of everything up to it
+    batch_end = text(f"""
+        SELECT max(id) FROM (
+            SELECT id FROM {table} WHERE id > :last_id AND ({where}) ORDER BY id LIMIT :batch_size
+        ) AS batch
+    """)
+    statement = text(f"""
+        UPDATE {table} SET {assignments}
+        WHERE id > :last_id AND id <= :batch_end AND ({where})
+    """)
+    total = last_id = 0
+    with op.get_context().autocommit_block():
+        while True:
+            end = op.get_bind().execute(batch_end, {'last_id': last_id, 'batch_size': batch_size}).scalar()
+            if end is None:
+                break
+            total += op.get_bind().execute(statement, {'last_id': last_id, 'batch_end': end}).rowcount
+            last_id = end
+            time.sleep(pause)
+    logger.info("backfilled %d rows of %s", total, table)
+    return total
+
+
+def create_index(name, table, columns, unique=False, where=None):
+    """op.create_index that doesn't block writes on PostgreSQL; where makes a partial index."""
+    kwargs = {'unique': unique}
+    if where is not None:
+        kwargs['sqlite_where'] = kwargs['postgresql_where'] = text(where)
+    if is_postgresql():
+        with op.get_context().autocommit_block():
+            op.create_index(name, table, columns, postgresql_concurrently=True, **kwargs)
+    else:
+        op.create_index(name, table, columns, **kwargs)
@@ -0,0 +1,239 @@
+"""Background delivery for the email_outbox table.
+
+Requests only insert rows into email_outbox (see send_email in app.py), in the
+same transaction as the change that triggered the email. OutboxDispatcher runs
+a small pool of worker threads that claim queued rows in batches, send them
+over a reused SMTP connection and record the outcome. Failed sends are retried
+with exponential backoff until max_attempts, then marked 'failed'. Without
+MAIL_SERVER (or with a MAIL_USERNAME but no MAIL_PASSWORD) the workers don't
+start, and emails wait in the outbox until mail is configured.
+
+The web server only runs the dispatcher under the development reloader
+(python app.py). In production, run it as its own process:
+
+    flask outbox-worker
+
+To try it locally without a real mail account, run a debugging SMTP server
+
+    python -m aiosmtpd -n -l localhost:8025
+
+and start the app with MAIL_SERVER=localhost MAIL_PORT=8025 MAIL_USE_SSL=0.
+"""
+import logging
+import smtplib
+import threading
+import time
+import uuid
+from email.message import EmailMessage
+
+from sqlalchemy import and_, or_, select, update
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+SENDING = 'sending'
+SENT = 'sent'
+FAILED = 'failed'
+
+
+class SMTPSettings:
+    def __init__(self, host, port, use_ssl=True, username=None, password=None, sender=None, timeout=10):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.username = username
+        self.password = password
+        self.sender = sender or username
+        self.timeout = timeout
+
+    @property
+    def missing(self):
+        """What is missing before mail can be sent, or None."""
+        if not self.host:
+            return 'MAIL_SERVER'
+        if self.username and not self.password:
+            return 'MAIL_PASSWORD'
+        return None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            host=config['MAIL_SERVER'],
+            port=int(config['MAIL_PORT']),
+            use_ssl=config['MAIL_USE_SSL'],
+            username=config.get('MAIL_USERNAME'),
+            password=config.get('MAIL_PASSWORD'),
+            sender=config.get('MAIL_SENDER'),
+        )
+
+
+class SMTPConnection:
+    """One SMTP session, opened lazily and kept open between batches."""
+
+    def __init__(self, settings, idle_timeout=60):
+        self.settings = settings
+        self.idle_timeout = idle_timeout
+        self._smtp = None
+        self._last_used = 0.0
+
+    def _open(self):
+        settings = self.settings
+        smtp_class = smtplib.SMTP_SSL if settings.use_ssl else smtplib.SMTP
+        smtp = smtp_class(settings.host, settings.port, timeout=settings.timeout)
+        if settings.username:
+            smtp.login(settings.username, settings.password)
+        return smtp
+
+    def _alive(self):
+        if self._smtp is None or time.monotonic() - self._last_used > self.idle_timeout:
+            return False
+        try:
+            return self._smtp.noop()[0] == 250
+        except smtplib.SMTPException:
+            return False
+        except OSError:
+            return False
+
+    def send(self, message):
+        if not self._alive():
+            self.close()
+            self._smtp = self._open()
+        try:
+            self._smtp.send_message(message)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            # the server dropped us between the NOOP and the send; reconnect once
+            self.close()
+            self._smtp = self._open()
+            self._smtp.send_message(message)
+        self._last_used = time.monotonic()
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+
+class OutboxDispatcher:
+    def __init__(self, engine, table, settings, workers=2, batch_size=20, poll_interval=1.0,
+                 max_attempts=5, backoff_base=30, lease_seconds=300, on_sent=None):
+        """on_sent(seconds, ok) is called after each SMTP send attempt, e.g. to record metrics."""
+        self.engine = engine
+        self.table = table
+        self.settings = settings
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.lease_seconds = lease_seconds
+        self.on_sent = on_sent
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        missing = self.settings.missing
+        if missing:
+            logger.warning("Email isn't configured (no %s); queued emails stay in the outbox", missing)
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'outbox-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self):
+        connection = SMTPConnection(self.settings)
+        try:
+            while not self._stop.is_set():
+                try:
+                    processed = self.run_once(connection)
+                except Exception:
+                    logger.exception("Outbox worker failed to process a batch")
+                    processed = 0
+                if not processed:
+                    self._stop.wait(self.poll_interval)
+        finally:
+            connection.close()
+
+    def claim_batch(self):
+        """Mark up to batch_size due messages as ours and return them.
+
+        Rows left in 'sending' by a crashed worker become claimable again
+        after the lease. Two workers (or two processes) can pick the same ids
+        in their subqueries: on PostgreSQL under READ COMMITTED the second
+        UPDATE waits for the first and then only rechecks its own WHERE
+        clause. So the UPDATE repeats the due condition, which the first
+        claim has made false, and on PostgreSQL the subquery also skips rows
+        another worker has locked, so the second worker takes the next ones.
+        """
+        table = self.table
+        now = time.time()
+        token = uuid.uuid4().hex
+        is_due = or_(
+            and_(table.c.status == QUEUED, table.c.next_attempt_at <= now),
+            and_(table.c.status == SENDING, table.c.claimed_at < now - self.lease_seconds),
+        )
+        due = select(table.c.id).where(is_due).order_by(table.c.id).limit(self.batch_size)
+        if self.engine.dialect.name == 'postgresql':
+            due = due.with_for_update(skip_locked=True)
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(table)
+                .where(table.c.id.in_(due.scalar_subquery()), is_due)
+                .values(status=SENDING, claimed_by=token, claimed_at=now)
+            )
+            return conn.execute(
+                select(table).where(table.c.claimed_by == token).order_by(table.c.id)
+            ).mappings().all()
+
+    def run_once(self, connection):
+        batch = self.claim_batch()
+        for row in batch:
+            message = EmailMessage()
+            message.set_content(row['body'])
+            message['Subject'] = row['subject']
+            message['From'] = self.settings.sender
+            message['To'] = row['recipient']
+            started = time.perf_counter()
+            try:
+                connection.send(message)
+            except (smtplib.SMTPException, OSError) as e:
+                self._observe(started, False)
+                connection.close()
+                self._record_failure(row, e)
+            else:
+                self._observe(started, True)
+                self._record(row['id'], status=SENT, sent_at=time.time(), attempts=row['attempts'] + 1,
+                             last_error=None)
+        return len(batch)
+
+    def _observe(self, started, ok):
+        if self.on_sent is not None:
+            self.on_sent(time.perf_counter() - started, ok)
+
+    def _record_failure(self, row, error):
+        attempts = row['attempts'] + 1
+        if attempts >= self.max_attempts:
+            logger.error("Giving up on outbox message %s after %s attempts: %s", row['id'], attempts, error)
+            self._record(row['id'], status=FAILED, attempts=attempts, last_error=str(error))
+        else:
+            delay = self.backoff_base * 2 ** (attempts - 1)
+            self._record(row['id'], status=QUEUED, attempts=attempts, last_error=str(error),
+                         next_attempt_at=time.time() + delay)
+
+    def _record(self, message_id, **values):
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(self.table)
+                .where(self.table.c.id == message_id)
+                .values(claimed_by=None, claimed_at=None, **values)
+            )
@@ -0,0 +1,93 @@
+"""Keyset (cursor) pagination helpers.
+
+Instead of OFFSET, each page remembers the sort key of its last row and the
+next page asks for rows strictly after it, so page N costs the same as page 1
+when the ORDER BY columns are indexed. Cursors are opaque to clients.
+"""
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(values):
+    # datetimes travel as ISO strings and are read back by cursor_value
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def cursor_value(column, value):
+    """value as something column can be compared with: a number for numeric columns, a
+    datetime for DateTime ones, else a string. Raises ValueError if it can't be."""
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError(f"bad cursor value {value!r}")
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if issubclass(python_type, (int, float)) and isinstance(value, (int, float)):
+        return value
+    if issubclass(python_type, datetime) and isinstance(value, str):
+        return datetime.fromisoformat(value)
+    if issubclass(python_type, str) and isinstance(value, str):
+        return value
+    raise ValueError(f"bad cursor value {value!r}")
+
+
+def decode_cursor(cursor, columns, nullable=False):
+    """Return the list of sort-key values in cursor, or None if it is missing or malformed.
+
+    A cursor must hold one string or number per column, of the column's kind,
+    so a tampered cursor can't reach the database as a bad comparison. With
+    nullable, null is allowed in place of any value.
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        return None
+    if not isinstance(values, list) or len(values) != len(columns):
+        return None
+    try:
+        return [None if nullable and value is None else cursor_value(column, value)
+                for column, value in zip(columns, values)]
+    except ValueError:
+        return None
+
+
+def after_clause(columns, values):
+    """WHERE clause for rows sorting after values on columns.
+
+    Spelled out as a > x OR (a = x AND b > y) instead of a row-value comparison,
+    which SQLite can't turn into an index range, plus a leading a >= x so the
+    first column bounds the scan.
+    """
+    clause = None
+    for column, value in reversed(list(zip(columns, values))):
+        clause = column > value if clause is None else or_(column > value, and_(column == value, clause))
+    return and_(columns[0] >= values[0], clause)
+
+
+def keyset_page(query, columns, cursor=None, limit=50):
+    """Return (rows, next_cursor) for query ordered by columns ascending.
+
+    columns must identify a row uniquely (end with the primary key). Each
+    entry is a column expression; the row's values are read back by label.
+    A malformed cursor gives the first page.
+    """
+    labels = [f'_k{i}' for i in range(len(columns))]
+    after = decode_cursor(cursor, columns)
+    if after is not None:
+        query = query.filter(after_clause(columns, after))
+    query = query.add_columns(*(column.label(label) for column, label in zip(columns, labels)))
+    rows = query.order_by(*columns).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, label) for label in labels)
+    return [row[0] for row in rows], next_cursor
@@ -0,0 +1,141 @@
+"""Password hashing off the request threads, behind a rate limit.
+
+Hashing is deliberately slow: it is most of the CPU a login or signup costs.
+PasswordHasher runs it in a small thread pool (hashlib's scrypt and PBKDF2
+release the GIL, so the pool really uses that many cores) and keeps the
+queue in front of the pool short. When the queue is full, hash() and
+verify() raise HasherBusy at once instead of queueing, and the caller
+answers 503. A burst of logins then can't tie up every request thread
+waiting on hashes, and the rest of the site stays responsive.
+
+The policy is a Werkzeug method string, e.g. 'scrypt' (Werkzeug's default),
+'scrypt:16384:8:1' or 'pbkdf2:sha256:600000'. Stored hashes carry the method
+they were made with. verify() hands back a new hash when a correct password's
+stored hash uses another method, so the login can save it: raising or
+lowering the cost takes effect as users log in.
+
+TokenBucketLimiter caps attempts per key. Login takes a token per client IP
+and per account, so guessing passwords, from one address or against one
+account, can't use up the hashing capacity. Behind a proxy, the app keys
+IP buckets on the client address ProxyFix reads from X-Forwarded-For (see
+TRUSTED_PROXIES), not the proxy's. Buckets are per process, like the
+'memory' dashboard cache. A bucket is forgotten once it has refilled, so
+memory stays bounded by the keys seen in the last burst / rate seconds.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = 'scrypt'
+
+
+class HasherBusy(Exception):
+    """Too many hashes queued; try again shortly."""
+
+
+def method_of(password_hash):
+    """'scrypt:32768:8:1' for a Werkzeug hash, or '' for anything else."""
+    return password_hash.split('$', 1)[0] if password_hash and '$' in password_hash else ''
+
+
+class PasswordHasher:
+    def __init__(self, method=DEFAULT_METHOD, workers=None, max_queued=None, on_hashed=None):
+        """workers defaults to one per CPU and max_queued to four per worker.
+        on_hashed(seconds) is called after each hash or check, e.g. to record metrics."""
+        self.method = method
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queued = self.workers * 4 if max_queued is None else max_queued
+        self.on_hashed = on_hashed
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queued)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        """(password is right, new hash to store or None)."""
+        return self._run(self._verify, password_hash, password)
+
+    @cached_property
+    def current_method(self):
+        # the full method string a hash made now carries, with Werkzeug's defaults filled in
+        return method_of(generate_password_hash('', self.method))
+
+    def needs_rehash(self, password_hash):
+        return method_of(password_hash) != self.current_method
+
+    def _verify(self, password_hash, password):
+        if not password_hash or not check_password_hash(password_hash, password):
+            return False, None
+        if self.needs_rehash(password_hash):
+            return True, generate_password_hash(password, self.method)
+        return True, None
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            return self._executor().submit(self._timed, function, *args).result()
+        finally:
+            self._slots.release()
+
+    def _timed(self, function, *args):
+        started = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            if self.on_hashed is not None:
+                self.on_hashed(time.perf_counter() - started)
+
+    def _executor(self):
+        # started lazily, so the threads belong to the process that serves requests
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hash')
+            return self._pool
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+class TokenBucketLimiter:
+    def __init__(self, per_minute, burst, clock=time.monotonic):
+        """Allow bursts of up to burst attempts per key, refilling at per_minute."""
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.clock = clock
+        self._buckets = {}  # key -> (tokens, when)
+        self._lock = threading.Lock()
+        self._next_prune = clock() + self.refill_seconds
+
+    @property
+    def refill_seconds(self):
+        return self.burst / self.rate
+
+    def take(self, key):
+        """Take a token for key. Returns 0 if one was free, else the seconds until one will be."""
+        now = self.clock()
+        with self._lock:
+            if now >= self._next_prune:
+                self._prune(now)
+            tokens, when = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - when) * self.rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / self.rate
+
+    def _prune(self, now):
+        # a bucket that has had time to refill is the same as no bucket
+        self._buckets = {key: (tokens, when) for key, (tokens, when) in self._buckets.items()
+                         if tokens + (now - when) * self.rate < self.burst}
+        self._next_prune = now + self.refill_seconds
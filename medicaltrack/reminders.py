@@ -0,0 +1,360 @@
+"""Medication reminders from the free-text Medicine.time.
+
+parse_schedule() reads what doctors actually type ('morning and night',
+'8am, 2pm', 'twice daily', '1-0-1', 'every 6 hours') into a Recurrence: a set
+of times of day. Text it can't read gets no reminders.
+
+Persisted state is one medication_reminder row per schedulable medicine with
+its next_due_at. The Medicine flush events in app.py keep those rows in step
+with the medicines, in the same transaction, so nothing is lost across
+restarts. `flask rebuild-reminders` recomputes them all.
+
+ReminderScheduler runs in one process (`flask reminder-worker`). It never
+scans the table: every refill_interval it reads the reminders due within the
+lookahead window through the next_due_at index into a heap, pops them as they
+come due, and dispatches them in batches through a channel. After a batch is
+sent, next_due_at moves on to the next dose in the same transaction, so a
+crash at worst resends one batch. Reminders that fell due while the worker was
+down are skipped if they are more than max_lateness late. The rest go out
+when it starts again.
+
+Channels take a connection and a list of Reminder tuples:
+
+- LogChannel logs them, for development
+- EmailChannel queues them in email_outbox, in the dispatch transaction
+- WebhookChannel POSTs them as JSON to a URL
+"""
+import heapq
+import json
+import logging
+import re
+import threading
+import urllib.request
+from collections import namedtuple
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+logger = logging.getLogger(__name__)
+
+Reminder = namedtuple('Reminder', 'medicine_id patient_username email name dosage time due_at')
+
+# times of day for words doctors use in place of a clock time
+NAMED_TIMES = {
+    'morning': '08:00', 'breakfast': '08:00',
+    'noon': '13:00', 'lunch': '13:00', 'afternoon': '14:00',
+    'evening': '18:00', 'dinner': '20:00',
+    'night': '21:00', 'bedtime': '22:00',
+}
+# how often, when no time of day is given
+FREQUENCIES = {
+    1: ['08:00'],
+    2: ['08:00', '20:00'],
+    3: ['08:00', '14:00', '20:00'],
+    4: ['08:00', '12:00', '16:00', '20:00'],
+}
+FREQUENCY_WORDS = {
+    'once': 1, 'od': 1, 'daily': 1, 'qd': 1,
+    'twice': 2, 'bd': 2, 'bid': 2,
+    'thrice': 3, 'tds': 3, 'tid': 3,
+    'qid': 4, 'qds': 4,
+}
+# 1-0-1 is morning, afternoon, night; 1-0-0-1 adds an evening dose
+DOSE_PATTERN_SLOTS = {3: ['08:00', '14:00', '21:00'], 4: ['08:00', '13:00', '18:00', '21:00']}
+
+CLOCK_RE = re.compile(r'\b(\d{1,2}):(\d{2})\s*(am|pm)?\b|\b(\d{1,2})\s*(am|pm)\b')
+EVERY_HOURS_RE = re.compile(r'\bevery\s+(\d{1,2})\s*(?:hours?|hrs?|h)\b|\bq\s*(\d{1,2})\s*h\b')
+TIMES_A_DAY_RE = re.compile(r'\b([1-4])\s*(?:times|x)\b')
+DOSE_PATTERN_RE = re.compile(r'^\s*([01])\s*-\s*([01])\s*-\s*([01])(?:\s*-\s*([01]))?\s*$')
+WORD_RE = re.compile(r'[a-z]+')
+
+
+def minutes(text):
+    hours, mins = text.split(':')
+    return int(hours) * 60 + int(mins)
+
+
+class Recurrence:
+    """Doses at fixed times of day, every day."""
+
+    def __init__(self, times):
+        self.times = tuple(sorted(set(times)))  # minutes after midnight
+
+    @classmethod
+    def from_spec(cls, spec):
+        return cls(minutes(t) for t in spec.split(','))
+
+    @property
+    def spec(self):
+        return ','.join(f'{t // 60:02d}:{t % 60:02d}' for t in self.times)
+
+    def next_after(self, moment):
+        """The first dose strictly after moment."""
+        midnight = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+        for day in (0, 1):
+            for t in self.times:
+                due = midnight + timedelta(days=day, minutes=t)
+                if due > moment:
+                    return due
+
+    def __eq__(self, other):
+        return isinstance(other, Recurrence) and self.times == other.times
+
+    def __repr__(self):
+        return f'Recurrence({self.spec})'
+
+
+@lru_cache(maxsize=4096)
+def parse_schedule(text):
+    """Recurrence for a Medicine.time, or None if it names no time or frequency we can read."""
+    text = (text or '').strip().lower()
+    if not text:
+        return None
+
+    match = DOSE_PATTERN_RE.match(text)
+    if match:
+        flags = [flag for flag in match.groups() if flag is not None]
+        times = [minutes(t) for flag, t in zip(flags, DOSE_PATTERN_SLOTS[len(flags)]) if flag == '1']
+        return Recurrence(times) if times else None
+
+    match = EVERY_HOURS_RE.search(text)
+    if match:
+        hours = int(match.group(1) or match.group(2))
+        if not 1 <= hours <= 24:
+            return None
+        return Recurrence([(8 * 60 + i * hours * 60) % (24 * 60) for i in range(24 // hours)])
+
+    times = []
+    for hour, minute, half, bare_hour, bare_half in CLOCK_RE.findall(text):
+        hour, minute, half = (int(hour), int(minute), half) if hour else (int(bare_hour), 0, bare_half)
+        if half == 'pm' and hour < 12:
+            hour += 12
+        elif half == 'am' and hour == 12:
+            hour = 0
+        if hour < 24 and minute < 60:
+            times.append(hour * 60 + minute)
+    words = WORD_RE.findall(text)
+    times += [minutes(NAMED_TIMES[word]) for word in words if word in NAMED_TIMES]
+    if times:
+        return Recurrence(times)
+
+    match = TIMES_A_DAY_RE.search(text)
+    if match:
+        count = int(match.group(1))
+    elif 'times' in words and ('three' in words or 'four' in words):
+        count = 3 if 'three' in words else 4
+    else:
+        count = max((FREQUENCY_WORDS.get(word, 0) for word in words), default=0)
+    return Recurrence([minutes(t) for t in FREQUENCIES[count]]) if count else None
+
+
+class ReminderStore:
+    def __init__(self, reminders, medicines, users):
+        """The medication_reminder, medicine and users tables."""
+        self.reminders = reminders
+        self.medicines = medicines
+        self.users = users
+
+    def schedule(self, conn, medicines, now):
+        """(Re)schedule (medicine id, patient id, time text) triples from now.
+
+        Medicines whose time can't be read, or that have no patient, are unscheduled.
+        """
+        rows, unreadable = [], []
+        for medicine_id, patient_id, time_text in medicines:
+            recurrence = parse_schedule(time_text)
+            if recurrence is None or patient_id is None:
+                unreadable.append(medicine_id)
+            else:
+                rows.append({'medicine_id': medicine_id, 'patient_id': patient_id,
+                             'schedule': recurrence.spec, 'next_due_at': recurrence.next_after(now)})
+        if unreadable:
+            self.unschedule(conn, unreadable)
+        if rows:
+            dialect = postgresql if conn.dialect.name == 'postgresql' else sqlite
+            statement = dialect.insert(self.reminders)
+            conn.execute(statement.on_conflict_do_update(
+                index_elements=[self.reminders.c.medicine_id],
+                set_={column: statement.excluded[column] for column in ('patient_id', 'schedule', 'next_due_at')}
+            ), rows)
+        return len(rows)
+
+    def unschedule(self, conn, medicine_ids):
+        conn.execute(self.reminders.delete().where(self.reminders.c.medicine_id.in_(medicine_ids)))
+
+    def due(self, conn, until, limit):
+        """(next_due_at, medicine_id) of the first limit reminders due by until; an index range scan."""
+        table = self.reminders
+        return conn.execute(
+            select(table.c.next_due_at, table.c.medicine_id)
+            .where(table.c.next_due_at <= until)
+            .order_by(table.c.next_due_at)
+            .limit(limit)
+        ).all()
+
+    def load(self, conn, medicine_ids):
+        """medicine_id -> (next_due_at, schedule, Reminder fields) for the given ids."""
+        r, m, u = self.reminders, self.medicines, self.users
+        rows = conn.execute(
+            select(r.c.medicine_id, r.c.next_due_at, r.c.schedule, u.c.username, u.c.email,
+                   m.c.name, m.c.dosage, m.c.time)
+            .join(m, m.c.id == r.c.medicine_id)
+            .join(u, u.c.id == r.c.patient_id)
+            .where(r.c.medicine_id.in_(medicine_ids))
+        )
+        return {row.medicine_id: row for row in rows}
+
+    def advance(self, conn, updates, sent_at):
+        """updates: (medicine_id, next_due_at) pairs."""
+        if updates:
+            table = self.reminders
+            conn.execute(
+                update(table).where(table.c.medicine_id == bindparam('b_id'))
+                .values(next_due_at=bindparam('b_next'), last_sent_at=sent_at),
+                [{'b_id': medicine_id, 'b_next': next_due_at} for medicine_id, next_due_at in updates]
+            )
+
+
+class LogChannel:
+    def send(self, conn, reminders):
+        for reminder in reminders:
+            logger.info("Reminder for %s: %s %s at %s", reminder.patient_username, reminder.name,
+                        reminder.dosage or '', reminder.due_at.strftime('%H:%M'))
+
+
+class EmailChannel:
+    """Queues one email per reminder in email_outbox; the outbox dispatcher delivers them."""
+
+    def __init__(self, outbox):
+        self.outbox = outbox
+
+    def send(self, conn, reminders):
+        conn.execute(self.outbox.insert(), [{
+            'recipient': reminder.email,
+            'subject': f"Reminder: {reminder.name}",
+            'body': f"Hi {reminder.patient_username},\n\nIt's time for your {reminder.name}"
+                    f"{' (' + reminder.dosage + ')' if reminder.dosage else ''}, "
+                    f"due at {reminder.due_at.strftime('%H:%M')}.\n\nMedTrack",
+        } for reminder in reminders if reminder.email])
+
+
+class WebhookChannel:
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, conn, reminders):
+        body = json.dumps({'reminders': [
+            {**reminder._asdict(), 'due_at': reminder.due_at.isoformat()} for reminder in reminders
+        ]}).encode('utf-8')
+        request = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class ReminderScheduler:
+    def __init__(self, engine, store, channel, batch_size=500, lookahead=300, refill_interval=60,
+                 max_queued=50000, max_lateness=3600, retry_delay=30, clock=datetime.now):
+        self.engine = engine
+        self.store = store
+        self.channel = channel
+        self.batch_size = batch_size
+        self.lookahead = timedelta(seconds=lookahead)
+        self.refill_interval = timedelta(seconds=refill_interval)
+        self.max_queued = max_queued
+        self.max_lateness = timedelta(seconds=max_lateness)
+        self.retry_delay = timedelta(seconds=retry_delay)
+        self.clock = clock
+        self._heap = []  # (due_at, medicine_id)
+        self._next_refill = None
+        self._backlog = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='reminder-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Reminder scheduler failed to dispatch a batch")
+                self._next_refill = self.clock() + self.retry_delay
+            self._stop.wait(self.seconds_until_next())
+
+    def seconds_until_next(self):
+        now = self.clock()
+        wake = now if self._backlog and not self._heap else self._next_refill or now
+        if self._heap:
+            wake = min(wake, self._heap[0][0])
+        return max(0.0, (wake - now).total_seconds())
+
+    def refill(self, now):
+        """Reload the heap with what is due within the lookahead.
+
+        The table is the source of truth, so the heap is rebuilt rather than
+        merged: medicines edited or deleted since the last refill drop out.
+        """
+        with self.engine.connect() as conn:
+            self._heap = [tuple(row) for row in self.store.due(conn, now + self.lookahead, self.max_queued)]
+        heapq.heapify(self._heap)
+        # a full heap means there is a backlog left in the table: come back as soon as it drains
+        self._backlog = len(self._heap) >= self.max_queued
+        self._next_refill = now + self.refill_interval
+
+    def run_once(self):
+        """Refill if it is time, then dispatch up to batch_size due reminders; returns how many were sent."""
+        now = self.clock()
+        if self._next_refill is None or now >= self._next_refill or self._backlog and not self._heap:
+            self.refill(now)
+        batch = []
+        while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+            batch.append(heapq.heappop(self._heap))
+        if not batch:
+            return 0
+        try:
+            return self.dispatch(batch, now)
+        except Exception:
+            # the table still has them due; the next refill picks them up again
+            self._next_refill = now + self.retry_delay
+            raise
+
+    def dispatch(self, batch, now):
+        queued = dict((medicine_id, due_at) for due_at, medicine_id in batch)
+        with self.engine.begin() as conn:
+            rows = self.store.load(conn, list(queued))
+            reminders, updates, orphans = [], [], []
+            for medicine_id, due_at in queued.items():
+                row = rows.get(medicine_id)
+                if row is None:
+                    # the medicine or its patient is gone; drop the reminder so it stops coming back
+                    orphans.append(medicine_id)
+                    continue
+                if row.next_due_at != due_at:
+                    continue  # rescheduled since the refill
+                if now - due_at <= self.max_lateness:
+                    reminders.append(Reminder(medicine_id, row.username, row.email, row.name, row.dosage,
+                                              row.time, due_at))
+                updates.append((medicine_id, Recurrence.from_spec(row.schedule).next_after(now)))
+            if reminders:
+                self.channel.send(conn, reminders)
+            self.store.advance(conn, updates, now)
+            if orphans:
+                self.store.unschedule(conn, orphans)
+        # doses due again within the window go back on the heap
+        horizon = now + self.lookahead
+        for medicine_id, next_due_at in updates:
+            if next_due_at <= horizon:
+                heapq.heappush(self._heap, (next_due_at, medicine_id))
+        return len(reminders)
@@ -0,0 +1,143 @@
+"""PDF patient reports rendered off the request path.
+
+xhtml2pdf is CPU-bound and slow for long histories, so PDFs are rendered in a
+process pool and cached on disk. Cache entries are keyed by a hash of the
+patient's history (medicines, diagnoses, appointments and uploaded reports),
+so a changed history never maps to a stale file. A finished render removes
+the patient's PDFs for older hashes, and add_medicine/add_diagnosis also call
+invalidate() to drop the old file straight away.
+
+    report_cache/<patient key>/<content hash>.pdf
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+READY = 'ready'
+PENDING = 'pending'
+ERROR = 'error'
+
+
+def render_pdf(html, path):
+    """Runs in a pool process: render html to a PDF at path. Returns the seconds it took."""
+    from xhtml2pdf import pisa
+
+    started = time.perf_counter()
+    result = BytesIO()
+    pdf = pisa.pisaDocument(BytesIO(html.encode("UTF-8")), result)
+    if pdf.err:
+        raise RuntimeError(f"xhtml2pdf reported {pdf.err} errors")
+    # write then rename, so readers never see a half-written file
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(result.getvalue())
+    os.replace(tmp_path, path)
+    return time.perf_counter() - started
+
+
+def history_hash(history):
+    """Hash of everything the report shows, from a history.PatientHistory."""
+    payload = json.dumps({
+        'meds': [list(m) for m in history.medicines],
+        'diagnoses': [list(d) for d in history.diagnoses],
+        'appointments': [list(a) for a in history.appointments],
+        'reports': [list(r) for r in history.reports],
+    })
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ReportRenderer:
+    def __init__(self, cache_dir, workers=2, on_rendered=None):
+        """on_rendered(seconds) is called after each successful render, e.g. to record metrics."""
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.on_rendered = on_rendered
+        self._pool = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _patient_dir(self, patient_username):
+        key = hashlib.sha256(patient_username.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_dir, key)
+
+    def path_for(self, patient_username, content_hash):
+        return os.path.join(self._patient_dir(patient_username), f'{content_hash}.pdf')
+
+    def _get_pool(self):
+        if self._pool is None:
+            # spawn, not fork: the web process has SQLAlchemy and SMTP threads we don't want copied
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def status(self, patient_username, content_hash):
+        path = self.path_for(patient_username, content_hash)
+        if os.path.exists(path):
+            return READY
+        with self._lock:
+            future = self._jobs.get(path)
+        if future is None:
+            return None
+        if future.done() and not future.cancelled() and future.exception() is not None:
+            return ERROR
+        return PENDING
+
+    def submit(self, patient_username, content_hash, render_html):
+        """Start rendering unless the PDF is cached or already being rendered.
+
+        render_html is only called when a job is actually started, so cache
+        hits skip template rendering too.
+        """
+        path = self.path_for(patient_username, content_hash)
+        with self._lock:
+            future = self._jobs.get(path)
+            if os.path.exists(path) or (future is not None and not future.done()):
+                return
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            future = self._get_pool().submit(render_pdf, render_html(), path)
+            self._jobs[path] = future
+        future.add_done_callback(lambda f: self._forget(path, f))
+
+    def _forget(self, path, future):
+        if future.cancelled():
+            # shut down before it ran; a later submit() starts it again
+            with self._lock:
+                if self._jobs.get(path) is future:
+                    del self._jobs[path]
+            return
+        # keep failed jobs around so status() can report the error
+        if future.exception() is not None:
+            return
+        if self.on_rendered is not None:
+            self.on_rendered(future.result())
+        with self._lock:
+            if self._jobs.get(path) is future:
+                del self._jobs[path]
+        self._remove_older(path)
+
+    def _remove_older(self, path):
+        # the patient's PDFs for earlier histories can never be asked for again
+        directory, current = os.path.split(path)
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.endswith('.pdf') and name != current:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def invalidate(self, patient_username):
+        shutil.rmtree(self._patient_dir(patient_username), ignore_errors=True)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,404 @@
+"""Deterministic fake data for development and load testing.
+
+`flask medtrack seed` fills the database with doctors, patients and a year of
+their history: appointments, diagnoses from completed visits, prescriptions
+and the reminders for those prescriptions. The same --seed (and --today)
+always produces the same rows, and each kind of data draws from its own
+random stream, so asking for more appointments doesn't change who the
+patients are.
+
+The data is meant to look like a real clinic's:
+
+- a few doctors are much busier than the rest (Zipf-like shares)
+- some patients visit far more often than others
+- every appointment falls in a free slot of the doctor's default working
+  week, and no doctor is ever booked twice for the same slot
+- past appointments are mostly Completed with some Rejected; future ones are
+  a mix of Pending, Accepted and Upcoming
+- patients have a Poisson number of prescriptions with readable times, so
+  they all get reminders
+
+Rows are written with plain executemany INSERTs that carry their own ids,
+in batches of one transaction each, with the secondary indexes on the tables
+being filled dropped first and built again at the end. That is much faster
+than keeping every index up to date row by row, but it takes the indexes
+away from anything else using the database, so seed a database nothing else
+is using. Rebuilding the unique slot index at the end doubles as a check that
+no slot was booked twice: every index is attempted, and then the seed fails
+naming any that couldn't be built. On PostgreSQL the id sequences are moved
+past the inserted ids afterwards, so the app's own inserts don't collide.
+
+Since the ORM events that maintain doctor_status_count, doctor_patient and
+medication_reminder don't see these inserts, the seeder writes those rows
+itself.
+"""
+import math
+import random
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.schema import CreateIndex, DropIndex
+
+from bulk import Progress, batched
+from reminders import parse_schedule
+
+BATCH_SIZE = 20000
+HISTORY_DAYS = 365
+FUTURE_DAYS = 60
+DOCTOR_SKEW = 0.6  # doctor i gets a share proportional to 1 / (i + 1) ** DOCTOR_SKEW
+PATIENT_SKEW = 1.5  # patients are picked at int(n * random() ** PATIENT_SKEW)
+
+FIRST_NAMES = ['Aarav', 'Aditi', 'Amit', 'Ananya', 'Arjun', 'Deepa', 'Divya', 'Farah', 'Gaurav', 'Isha',
+               'Karan', 'Kavya', 'Meera', 'Mohan', 'Neha', 'Nikhil', 'Pooja', 'Priya', 'Rahul', 'Ravi',
+               'Rohan', 'Sana', 'Sanjay', 'Shreya', 'Sneha', 'Suresh', 'Tara', 'Varun', 'Vikram', 'Zoya']
+LAST_NAMES = ['Agarwal', 'Bose', 'Chopra', 'Das', 'Desai', 'Gupta', 'Iyer', 'Joshi', 'Kapoor', 'Khan',
+              'Kumar', 'Menon', 'Mehta', 'Mukherjee', 'Nair', 'Patel', 'Rao', 'Reddy', 'Shah', 'Sharma',
+              'Singh', 'Verma']
+SPECIALTIES = ['General Physician', 'Cardiologist', 'Pediatrician', 'Dermatologist', 'Gynecologist',
+               'Orthopedic', 'ENT Specialist', 'Neurologist', 'Psychiatrist', 'Dentist', 'Gastroenterologist',
+               'Urologist', 'Nephrologist', 'Rheumatologist', 'Oncologist']
+
+REASONS = ['Fever', 'Follow-up', 'Routine checkup', 'Cough and cold', 'Headache', 'Back pain', 'Chest pain',
+           'Skin rash', 'Stomach ache', 'Blood pressure review', 'Diabetes review', 'Joint pain',
+           'Prescription renewal', 'Test results', 'Allergy', 'Dizziness']
+DIAGNOSES = ['Viral fever, rest and fluids', 'Hypertension, stable on current medication',
+             'Type 2 diabetes, HbA1c improving', 'Upper respiratory tract infection', 'Migraine without aura',
+             'Lumbar strain, physiotherapy advised', 'Contact dermatitis', 'Gastritis',
+             'Seasonal allergic rhinitis', 'Iron deficiency anaemia', 'Osteoarthritis of the knee',
+             'Anxiety, counselling referral', 'No abnormality found']
+MEDICINES = [('Paracetamol', '500mg'), ('Amoxicillin', '250mg'), ('Metformin', '500mg'), ('Amlodipine', '5mg'),
+             ('Atorvastatin', '10mg'), ('Cetirizine', '10mg'), ('Pantoprazole', '40mg'), ('Ibuprofen', '400mg'),
+             ('Losartan', '50mg'), ('Vitamin D3', '1000 IU'), ('Azithromycin', '500mg'), ('Levothyroxine', '50mcg')]
+MEDICINE_TIMES = ['morning', 'morning and night', 'twice daily', '1-0-1', '1-1-1', '8am, 2pm, 8pm',
+                  'every 8 hours', 'TDS', 'bedtime', 'after breakfast', '9:00 pm', 'once daily']
+
+# The directory find_doctor used to hard-code, for `flask medtrack demo-doctors`:
+# (name, specialty, experience, contact, email)
+DEMO_DOCTORS = [
+    ('Dr. A. Sharma', 'Cardiologist', 10, '9876543210', 'asharma@medtrack.com'),
+    ('Dr. R. Mehta', 'Neurologist', 8, '8765432109', 'rmehta@medtrack.com'),
+    ('Dr. K. Patel', 'Dermatologist', 7, '9876234560', 'kpatel@medtrack.com'),
+    ('Dr. S. Verma', 'Pediatrician', 12, '9811122334', 'sverma@medtrack.com'),
+    ('Dr. R. Joshi', 'Gynecologist', 15, '9822233445', 'rjoshi@medtrack.com'),
+    ('Dr. M. Singh', 'Orthopedic', 9, '9833344556', 'msingh@medtrack.com'),
+    ('Dr. L. Nair', 'General Physician', 5, '9844455667', 'lnair@medtrack.com'),
+    ('Dr. V. Reddy', 'ENT Specialist', 11, '9855566778', 'vreddy@medtrack.com'),
+    ('Dr. A. Khan', 'Psychiatrist', 6, '9866677889', 'akhan@medtrack.com'),
+    ('Dr. P. Desai', 'Dentist', 4, '9877788990', 'pdesai@medtrack.com'),
+    ('Dr. R. Kapoor', 'Urologist', 10, '9888899001', 'rkapoor@medtrack.com'),
+    ('Dr. T. Iyer', 'Oncologist', 14, '9899900112', 'tiyer@medtrack.com'),
+    ('Dr. D. Mukherjee', 'Gastroenterologist', 13, '9900011223', 'dmukherjee@medtrack.com'),
+    ('Dr. S. Rao', 'Nephrologist', 11, '9911122334', 'srao@medtrack.com'),
+    ('Dr. B. Das', 'Rheumatologist', 9, '9922233445', 'bdas@medtrack.com'),
+]
+
+# (status, cumulative weight) for appointments before and after now
+PAST_STATUSES = (['Completed', 'Rejected', 'Accepted', 'Pending'], [78, 93, 98, 100])
+FUTURE_STATUSES = (['Pending', 'Accepted', 'Upcoming', 'Rejected'], [35, 70, 90, 100])
+
+
+def poisson(rng, mean):
+    # Knuth's method; fine for the small means used here
+    limit, count, product = math.exp(-mean), 0, rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+def to_db(column, dialect):
+    """The function the dialect passes column values through on their way to the driver."""
+    process = column.type.dialect_impl(dialect).bind_processor(dialect)
+    return process or (lambda value: value)
+
+
+def allocate(total, weights, capacity):
+    """Split total into per-weight counts proportional to weights, none above capacity.
+
+    Whatever a full share can't take flows on to the smaller weights.
+    """
+    counts = [0] * len(weights)
+    remaining, remaining_weight = total, float(sum(weights))
+    for i in sorted(range(len(weights)), key=lambda i: -weights[i]):
+        share = round(remaining * weights[i] / remaining_weight) if remaining_weight else remaining
+        counts[i] = min(capacity, share, remaining)
+        remaining -= counts[i]
+        remaining_weight -= weights[i]
+    if remaining:
+        raise ValueError(f"{total} appointments don't fit in {len(weights)} doctors' calendars "
+                         f"({capacity} slots each); add doctors or history days")
+    return counts
+
+
+class Seeder:
+    def __init__(self, engine, tables, schedule, password_hash, batch_size=BATCH_SIZE,
+                 history_days=HISTORY_DAYS, future_days=FUTURE_DAYS, stream=None):
+        """tables maps 'users', 'doctor_profile', 'appointment', 'diagnosis',
+        'medicine', 'medication_reminder', 'doctor_patient' and
+        'doctor_status_count' to their Table objects. schedule is the working
+        week appointments are placed in, as availability.DEFAULT_SCHEDULE.
+        Every seeded user gets password_hash."""
+        self.engine = engine
+        self.tables = tables
+        self.schedule = schedule
+        self.password_hash = password_hash
+        self.batch_size = batch_size
+        self.history_days = history_days
+        self.future_days = future_days
+        self.stream = stream or sys.stderr
+
+    def run(self, patients, doctors, appointments, seed, now, medicines_per_patient=3.0, diagnosis_rate=0.6):
+        """Add the rows and return {table name: rows inserted}."""
+        if appointments and not (patients and doctors):
+            raise ValueError("appointments need at least one patient and one doctor")
+        # check the appointments fit before writing anything
+        slots = self._slots(now)
+        per_doctor = allocate(appointments, [1 / (i + 1) ** DOCTOR_SKEW for i in range(doctors)], len(slots))
+        inserted = Counter()
+        started = time.perf_counter()
+        with self.engine.connect() as conn, self._fast_sqlite(conn):
+            first_ids = {name: self._next_id(conn, name)
+                         for name in ('users', 'doctor_profile', 'appointment', 'diagnosis', 'medicine')}
+            doctor_ids = range(first_ids['users'], first_ids['users'] + doctors)
+            patient_ids = range(doctor_ids.stop, doctor_ids.stop + patients)
+            doctor_names = self._usernames(random.Random(f'{seed}:doctors'), doctor_ids, 'dr.')
+            patient_names = self._usernames(random.Random(f'{seed}:patients'), patient_ids, '')
+
+            with self._deferred_indexes(conn):
+                inserted['users'] += self._insert(conn, 'users', ('id', 'username', 'email', 'password', 'role'), (
+                    (user_id, username, f'{username}@example.org', self.password_hash, role)
+                    for ids, names, role in ((doctor_ids, doctor_names, 'doctor'), (patient_ids, patient_names, 'patient'))
+                    for user_id, username in zip(ids, names)))
+                inserted['doctor_profile'] += self._insert(
+                    conn, 'doctor_profile', ('id', 'user_id', 'specialty', 'experience', 'contact'),
+                    self._profiles(random.Random(f'{seed}:profiles'), first_ids['doctor_profile'], doctor_ids))
+
+                status_counts = Counter()
+                inserted.update(self._insert_appointments(
+                    conn, random.Random(f'{seed}:appointments'), slots, per_doctor, diagnosis_rate, first_ids,
+                    list(zip(doctor_ids, doctor_names)), list(zip(patient_ids, patient_names)), status_counts))
+                inserted.update(self._insert_medicines(
+                    conn, random.Random(f'{seed}:medicines'), medicines_per_patient, now, first_ids['medicine'],
+                    zip(patient_ids, patient_names)))
+                print("Rebuilding indexes...", file=self.stream)
+
+            inserted['doctor_status_count'] += self._add_status_counts(conn, status_counts)
+            if doctors:
+                inserted['doctor_patient'] += self._link_patients(conn, doctor_ids)
+            self._advance_sequences(conn)
+            conn.commit()
+        total = sum(inserted.values())
+        elapsed = time.perf_counter() - started
+        print(f"Seeded {total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s).", file=self.stream)
+        return dict(inserted)
+
+    # Generators
+
+    def _usernames(self, rng, ids, prefix):
+        return [f'{prefix}{rng.choice(FIRST_NAMES)}.{rng.choice(LAST_NAMES)}{user_id}'.lower() for user_id in ids]
+
+    def _profiles(self, rng, first_id, doctor_ids):
+        for profile_id, doctor_id in enumerate(doctor_ids, first_id):
+            yield (profile_id, doctor_id, rng.choice(SPECIALTIES), int(rng.triangular(1, 35, 8)),
+                   f'9{rng.randrange(10 ** 9):09d}')
+
+    def _slots(self, now):
+        """Every (date, time, starts_at, is past) slot of the working week in the seeded window."""
+        starts_at = to_db(self.tables['appointment'].c.starts_at, self.engine.dialect)
+        blocks = {}
+        for weekday, start, end, slot_minutes in self.schedule:
+            blocks.setdefault(weekday, []).append((start, end, slot_minutes))
+        first_day = now.date() - timedelta(days=self.history_days)
+        slots = []
+        for offset in range(self.history_days + self.future_days + 1):
+            day = first_day + timedelta(days=offset)
+            for start, end, slot_minutes in sorted(blocks.get(day.weekday(), ())):
+                moment = datetime.combine(day, datetime.strptime(start, '%H:%M').time())
+                block_end = datetime.combine(day, datetime.strptime(end, '%H:%M').time())
+                while moment + timedelta(minutes=slot_minutes) <= block_end:
+                    slots.append((day.isoformat(), moment.strftime('%H:%M'), starts_at(moment), moment < now))
+                    moment += timedelta(minutes=slot_minutes)
+        return slots
+
+    def _appointments(self, rng, slots, per_doctor, diagnosis_rate, first_ids, doctors, patients, status_counts):
+        """Yield (appointment row, diagnosis row or None), doctor by doctor in slot order."""
+        appointment_id, diagnosis_id = first_ids['appointment'], first_ids['diagnosis']
+        patient_count = len(patients)
+        for (doctor_id, doctor_name), booked in zip(doctors, per_doctor):
+            if not booked:
+                continue
+            picked = sorted(rng.sample(range(len(slots)), booked))
+            past = sum(1 for i in picked if slots[i][3])
+            statuses = (rng.choices(PAST_STATUSES[0], cum_weights=PAST_STATUSES[1], k=past)
+                        + rng.choices(FUTURE_STATUSES[0], cum_weights=FUTURE_STATUSES[1], k=booked - past))
+            reasons = rng.choices(REASONS, k=booked)
+            for slot_index, status, reason in zip(picked, statuses, reasons):
+                patient_id, patient_name = patients[int(patient_count * rng.random() ** PATIENT_SKEW)]
+                date, slot_time, starts_at, _ = slots[slot_index]
+                diagnosis = None
+                if status == 'Completed' and rng.random() < diagnosis_rate:
+                    diagnosis = (diagnosis_id, doctor_name, patient_name, doctor_id, patient_id, rng.choice(DIAGNOSES))
+                    diagnosis_id += 1
+                yield ((appointment_id, patient_name, doctor_name, patient_id, doctor_id,
+                        date, slot_time, starts_at, reason, status), diagnosis)
+                appointment_id += 1
+            status_counts.update((doctor_name, status) for status in statuses)
+
+    def _medicines(self, rng, mean, now, first_id, patients):
+        """Yield (medicine row, reminder row)."""
+        next_due_at = to_db(self.tables['medication_reminder'].c.next_due_at, self.engine.dialect)
+        schedules = {}
+        for text in MEDICINE_TIMES:
+            recurrence = parse_schedule(text)
+            schedules[text] = (recurrence.spec, next_due_at(recurrence.next_after(now)))
+        medicine_id = first_id
+        for patient_id, patient_name in patients:
+            for _ in range(poisson(rng, mean)):
+                name, dosage = rng.choice(MEDICINES)
+                text = rng.choice(MEDICINE_TIMES)
+                spec, due = schedules[text]
+                yield ((medicine_id, patient_name, patient_id, name, dosage, text), (medicine_id, patient_id, spec, due))
+                medicine_id += 1
+
+    # Writers
+
+    def _insert_appointments(self, conn, rng, slots, per_doctor, diagnosis_rate, first_ids, doctors, patients,
+                             status_counts):
+        inserted = Counter()
+        progress = Progress('appointment', stream=self.stream)
+        rows = self._appointments(rng, slots, per_doctor, diagnosis_rate, first_ids, doctors, patients, status_counts)
+        for batch in batched(rows, self.batch_size):
+            inserted['appointment'] += self._write(conn, 'appointment', (
+                'id', 'patient_username', 'doctor_username', 'patient_id', 'doctor_id',
+                'date', 'time', 'starts_at', 'reason', 'status'), [appointment for appointment, _ in batch])
+            inserted['diagnosis'] += self._write(conn, 'diagnosis', (
+                'id', 'doctor_username', 'patient_username', 'doctor_id', 'patient_id', 'diagnosis_text'),
+                [diagnosis for _, diagnosis in batch if diagnosis])
+            conn.commit()
+            progress.add(len(batch))
+        progress.report()
+        return inserted
+
+    def _insert_medicines(self, conn, rng, mean, now, first_id, patients):
+        inserted = Counter()
+        progress = Progress('medicine', stream=self.stream)
+        for batch in batched(self._medicines(rng, mean, now, first_id, patients), self.batch_size):
+            inserted['medicine'] += self._write(
+                conn, 'medicine', ('id', 'patient_username', 'patient_id', 'name', 'dosage', 'time'),
+                [medicine for medicine, _ in batch])
+            inserted['medication_reminder'] += self._write(
+                conn, 'medication_reminder', ('medicine_id', 'patient_id', 'schedule', 'next_due_at'),
+                [reminder for _, reminder in batch])
+            conn.commit()
+            progress.add(len(batch))
+        progress.report()
+        return inserted
+
+    def _insert(self, conn, name, columns, rows):
+        inserted = 0
+        for batch in batched(rows, self.batch_size):
+            inserted += self._write(conn, name, columns, batch)
+            conn.commit()
+        return inserted
+
+    def _write(self, conn, name, columns, rows):
+        """One executemany INSERT of tuples in columns order."""
+        if not rows:
+            return 0
+        table = self.tables[name]
+        if conn.dialect.name == 'sqlite':
+            # Straight to the driver: SQLAlchemy's per-row parameter handling is most of the
+            # cost at this size. Values that need converting were converted by the generators.
+            statement = str(table.insert().compile(dialect=conn.dialect, column_keys=list(columns)))
+            conn.exec_driver_sql(statement, rows)
+        else:
+            conn.execute(table.insert(), [dict(zip(columns, row)) for row in rows])
+        return len(rows)
+
+    def _add_status_counts(self, conn, status_counts):
+        if not status_counts:
+            return 0
+        table = self.tables['doctor_status_count']
+        dialect = postgresql if conn.dialect.name == 'postgresql' else sqlite
+        statement = dialect.insert(table)
+        conn.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.doctor_username, table.c.status],
+            set_={'count': table.c.count + statement.excluded.count}
+        ), [{'doctor_username': doctor, 'status': status, 'count': count}
+            for (doctor, status), count in status_counts.items()])
+        return len(status_counts)
+
+    def _link_patients(self, conn, doctor_ids):
+        # after the indexes are back, so this is a range scan on appointment.doctor_id
+        appointments, links = self.tables['appointment'], self.tables['doctor_patient']
+        dialect = postgresql if conn.dialect.name == 'postgresql' else sqlite
+        pairs = select(appointments.c.doctor_id, appointments.c.patient_id).distinct().where(
+            appointments.c.doctor_id.between(doctor_ids.start, doctor_ids.stop - 1))
+        return conn.execute(dialect.insert(links).from_select(['doctor_id', 'patient_id'], pairs)
+                            .on_conflict_do_nothing()).rowcount
+
+    # Plumbing
+
+    def _next_id(self, conn, name):
+        table = self.tables[name]
+        return (conn.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+    def _advance_sequences(self, conn):
+        # the inserts carried their own ids, so PostgreSQL's sequences never moved
+        if conn.dialect.name != 'postgresql':
+            return
+        for name in ('users', 'doctor_profile', 'appointment', 'diagnosis', 'medicine'):
+            table = self.tables[name]
+            last_id = func.max(table.c.id)
+            conn.execute(select(func.setval(func.pg_get_serial_sequence(table.name, 'id'),
+                                            func.coalesce(last_id, 1), last_id.isnot(None))))
+
+    @contextmanager
+    def _deferred_indexes(self, conn):
+        """Drop the secondary indexes of the seeded tables, and build them again on the way out."""
+        indexes = [index for name in ('users', 'doctor_profile', 'appointment', 'diagnosis', 'medicine',
+                                      'medication_reminder')
+                   for index in sorted(self.tables[name].indexes, key=lambda index: index.name)]
+        # IF [NOT] EXISTS rather than checkfirst, which can't see expression indexes on SQLite
+        for index in indexes:
+            conn.execute(DropIndex(index, if_exists=True))
+        conn.commit()
+        try:
+            yield
+        finally:
+            conn.rollback()
+            started = time.perf_counter()
+            failed = []
+            for index in indexes:
+                # one at a time, so an index that can't be built doesn't leave the rest dropped
+                try:
+                    conn.execute(CreateIndex(index, if_not_exists=True))
+                    conn.commit()
+                except SQLAlchemyError as e:
+                    conn.rollback()
+                    failed.append(f"{index.name}: {e.orig if getattr(e, 'orig', None) else e}")
+            print(f"Rebuilt {len(indexes) - len(failed)} indexes in {time.perf_counter() - started:.1f}s.",
+                  file=self.stream)
+            if failed:
+                raise RuntimeError("Couldn't rebuild these indexes; the schema is missing them until they are "
+                                   "fixed and created again:\n  " + '\n  '.join(failed))
+
+    @contextmanager
+    def _fast_sqlite(self, conn):
+        """Skip the fsync on every batch commit while seeding; a crash means seeding again anyway."""
+        if conn.dialect.name != 'sqlite':
+            yield
+            return
+        synchronous = conn.exec_driver_sql('PRAGMA synchronous').scalar()
+        conn.exec_driver_sql('PRAGMA synchronous=OFF')
+        try:
+            yield
+        finally:
+            conn.rollback()
+            conn.exec_driver_sql(f'PRAGMA synchronous={synchronous}')
@@ -0,0 +1,87 @@
+"""Preview images for uploaded reports.
+
+When a report is uploaded, a small JPEG preview is rendered in a background
+process and stored next to its blob as <sha256>.thumb.jpg. Images are
+downscaled with Pillow; PDFs get their first page rasterised with pypdfium2.
+Both are optional: without them a report simply has no preview.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_QUALITY = 70
+
+
+def thumbnail_path(blob_path):
+    return blob_path + '.thumb.jpg'
+
+
+def render_thumbnail(blob_path, mime_type, size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY):
+    """Runs in a pool process: write a JPEG preview of blob_path. Returns False if it can't."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return False
+
+    if mime_type == 'application/pdf':
+        try:
+            import pypdfium2
+        except ImportError:
+            return False
+        pdf = pypdfium2.PdfDocument(blob_path)
+        try:
+            page = pdf[0]
+            # render at just enough resolution for the thumbnail (PDF units are 1/72 inch)
+            scale = max(size) / max(page.get_size())
+            image = page.render(scale=max(scale, 0.1)).to_pil()
+        finally:
+            pdf.close()
+    else:
+        image = Image.open(blob_path)
+        # decode JPEGs at reduced size instead of inflating the full scan first
+        image.draft('RGB', size)
+
+    image = image.convert('RGB')
+    image.thumbnail(size)
+    path = thumbnail_path(blob_path)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    image.save(tmp_path, 'JPEG', quality=quality, optimize=True, progressive=True)
+    os.replace(tmp_path, path)
+    return True
+
+
+class ThumbnailPipeline:
+    def __init__(self, workers=1):
+        self.workers = workers
+        self._pool = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def submit(self, blob_path, mime_type):
+        with self._lock:
+            if blob_path in self._pending or os.path.exists(thumbnail_path(blob_path)):
+                return
+            self._pending.add(blob_path)
+            future = self._get_pool().submit(render_thumbnail, blob_path, mime_type)
+        future.add_done_callback(lambda f: self._done(blob_path, f))
+
+    def _done(self, blob_path, future):
+        with self._lock:
+            self._pending.discard(blob_path)
+        if future.exception() is not None:
+            logger.warning("Could not render a preview of %s: %s", blob_path, future.exception())
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
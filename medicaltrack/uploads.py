@@ -0,0 +1,99 @@
+"""Streaming, content-addressed storage for uploaded reports.
+
+Werkzeug's multipart parser writes each uploaded file to whatever
+Request._get_file_stream returns, one chunk at a time. StreamingRequest hands
+it a HashingFile, so the upload goes straight to a temp file on disk while its
+SHA-256, size and leading bytes are collected. Nothing is buffered in memory
+and the file is never copied. BlobStore then moves the temp file into place
+under its hash; an identical upload just reuses the existing blob.
+
+    uploads/blobs/<first 2 hex chars>/<sha256>
+"""
+import hashlib
+import os
+import tempfile
+
+from flask import Request
+
+# leading bytes of each allowed report type
+SIGNATURES = [
+    (b'%PDF-', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+]
+HEAD_SIZE = 16
+
+
+def sniff_mime_type(head):
+    # trust the bytes, not the client's filename or Content-Type
+    for signature, mime_type in SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    return None
+
+
+class HashingFile:
+    """Temp file that hashes what is written to it and deletes itself on close unless kept."""
+
+    def __init__(self, tmp_dir, filename=None):
+        os.makedirs(tmp_dir, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=tmp_dir, prefix='upload-', delete=False)
+        self.path = self._file.name
+        self.filename = filename
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.head = b''
+        self.kept = False
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        if len(self.head) < HEAD_SIZE:
+            self.head += bytes(data[:HEAD_SIZE - len(self.head)])
+        return self._file.write(data)
+
+    @property
+    def mime_type(self):
+        return sniff_mime_type(self.head)
+
+    def close(self):
+        self._file.close()
+        if not self.kept:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __getattr__(self, name):
+        # seek/read/flush etc. go to the underlying file
+        return getattr(self._file, name)
+
+
+class StreamingRequest(Request):
+    # set by the app to a directory on the same filesystem as the blob store
+    upload_tmp_dir = tempfile.gettempdir()
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingFile(self.upload_tmp_dir, filename)
+
+
+class BlobStore:
+    def __init__(self, root):
+        # absolute: the paths handed out go straight to send_file, which resolves relative ones
+        # against the app's root_path, not the working directory they were written under
+        self.root = os.path.abspath(root)
+
+    def path_for(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def store(self, upload):
+        """Move a finished HashingFile into the store and return its hex digest."""
+        digest = upload.sha256.hexdigest()
+        path = self.path_for(digest)
+        upload.flush()
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(upload.path, path)
+            upload.kept = True
+        # otherwise the same bytes are already stored; close() deletes the duplicate
+        return digest